@@ -0,0 +1,125 @@
+# _kb_fastpaths.py - 多層級知識庫的熱路徑
+"""
+multi_scope_kb 列表 / 統計 / frontmatter 解析的內層迴圈
+
+本模組只用 mypyc 支援的寫法（完整型別標註、無動態屬性），可選擇 AOT 編譯：
+
+    cd backend && mypyc _kb_fastpaths.py
+
+編譯後產生的 _kb_fastpaths.*.so 會被 import 系統優先載入（副檔名模組排在
+.py 之前）；未編譯時即以本檔的純 Python 版本執行，行為完全相同。
+"""
+
+import heapq
+import os
+import re
+from typing import Any, Dict, Final, Iterable, List, Optional, Tuple
+
+# 筆記檔名：{timestamp}__{category}__{title}.md（category 僅為提示，以 frontmatter 為準）
+_NOTE_NAME_RE: Final = re.compile(r"^(\d{8}_\d{6}(?:_\d{6})?)__([^_]*)__(.*)$")
+
+# 舊版筆記檔名：{timestamp}_{title}.md（timestamp 可能不含微秒）
+_LEGACY_NOTE_NAME_RE: Final = re.compile(r"^(\d{8}_\d{6}(?:_\d{6})?)_(?!_)(.*)$")
+
+# frontmatter 的 "key: value" 行（key 取第一個冒號前的文字，前後空白去除）
+_FM_RE: Final = re.compile(r"(?m)^[^\S\n]*([^:\n]*?)[^\S\n]*:[^\S\n]*(.*?)[^\S\n]*$")
+
+# ─────────────────────────────────────────────────────────────
+# 目錄走訪
+# ─────────────────────────────────────────────────────────────
+
+def scan_files(directory: str) -> List[Tuple[str, str, str]]:
+    """
+    疊代走訪目錄樹，收集非點開頭的檔案
+
+    與 os.walk 相同，不進入符號連結目錄。
+
+    Returns:
+        [(完整路徑, 檔名, 相對路徑), ...]
+    """
+    found: List[Tuple[str, str, str]] = []
+    stack: List[Tuple[str, str]] = [(directory, "")]
+    sep: str = os.sep
+    while stack:
+        current, rel_prefix = stack.pop()
+        with os.scandir(current) as it:
+            for entry in it:
+                name: str = entry.name
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        stack.append((entry.path, rel_prefix + name + sep))
+                    continue
+
+                if name[0] == ".":
+                    continue
+                found.append((entry.path, name, rel_prefix + name))
+    return found
+
+
+def count_files(directory: str) -> Tuple[int, Dict[str, int]]:
+    """
+    計算目錄樹中非點開頭的檔案數與各副檔名數量
+
+    Returns:
+        (總數, {副檔名: 數量})
+    """
+    total: int = 0
+    by_type: Dict[str, int] = {}
+    stack: List[str] = [directory]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        stack.append(entry.path)
+                    continue
+
+                name: str = entry.name
+                if name[0] == ".":
+                    continue
+                total += 1
+                # 副檔名以 rfind 取得（檔名已排除點開頭）
+                i: int = name.rfind(".")
+                ext: str = name[i:].lower() if i > 0 else ""
+                by_type[ext] = by_type.get(ext, 0) + 1
+    return total, by_type
+
+# ─────────────────────────────────────────────────────────────
+# 筆記
+# ─────────────────────────────────────────────────────────────
+
+def parse_frontmatter(fm: str) -> Dict[str, Any]:
+    """解析 frontmatter 區塊（兩條 --- 之間的文字）"""
+    meta: Dict[str, Any] = {}
+    for key, value in _FM_RE.findall(fm):
+        if key == "tags":
+            meta[key] = [t.strip() for t in value.split(",") if t.strip()]
+        else:
+            meta[key] = value
+    return meta
+
+
+def note_category_hint(filename: str) -> Optional[str]:
+    """由檔名取得分類提示；非新版命名時回傳 None"""
+    m = _NOTE_NAME_RE.match(filename)
+    return m.group(2) if m else None
+
+
+def split_legacy_note_name(filename: str) -> Optional[Tuple[str, str]]:
+    """拆解舊版筆記檔名為 (timestamp, 其餘部分)；不符合時回傳 None"""
+    if _NOTE_NAME_RE.match(filename):
+        return None
+    m = _LEGACY_NOTE_NAME_RE.match(filename)
+    return (m.group(1), m.group(2)) if m else None
+
+
+def select_latest_notes(
+    entries: Iterable[Dict[str, Any]],
+    category: Optional[str],
+    limit: int
+) -> List[Dict[str, Any]]:
+    """依 updated_at 取前 limit 筆索引項目，並去掉內部欄位 mtime_ns"""
+    if category:
+        entries = [e for e in entries if e["category"] == category]
+    top = heapq.nlargest(limit, entries, key=lambda e: e["updated_at"])
+    return [{k: v for k, v in e.items() if k != "mtime_ns"} for e in top]
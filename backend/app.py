@@ -26,7 +26,8 @@ from typing import Optional, Tuple, Dict, Any
 from fastapi import FastAPI, HTTPException, Request, File, UploadFile, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, HTMLResponse, JSONResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, Response
 from pydantic import BaseModel
 
 # ==== CSV 直查總開關（預設關閉）====
@@ -66,6 +67,7 @@ from sqlalchemy.orm import sessionmaker
 # 導入用戶管理和認證相關模組
 from jose import jwt
 from datetime import datetime, timedelta
+from email.utils import formatdate
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi import Depends, status
 from sqlalchemy import text
@@ -926,6 +928,57 @@ except ImportError as e:
     PERSONAL_KB_ENABLED = False
     logger.warning(f"⚠️ 個人知識庫模組未載入: {e}")
 
+# 個人知識庫上傳允許的副檔名
+_PERSONAL_ALLOWED_EXTS = frozenset({
+    '.docx', '.pdf', '.txt', '.md', '.xlsx', '.csv', '.png', '.jpg', '.jpeg', '.gif',
+})
+
+# 個人知識庫圖片的 MIME 類型（未列出者以 image/png 回應）
+_IMAGE_MIME_TYPES = {
+    '.png': 'image/png',
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+}
+
+# 上傳大小上限與串流寫入的區塊大小
+PERSONAL_UPLOAD_MAX_BYTES = 50 * 1024 * 1024
+_UPLOAD_CHUNK_SIZE = 1 << 20
+
+
+class _UploadTooLarge(Exception):
+    pass
+
+
+def _save_upload(src, dest_path: str, max_bytes: int) -> int:
+    """
+    以固定大小區塊將上傳內容寫入暫存檔，邊寫邊計算大小
+
+    超過 max_bytes 時立即中止並拋出 _UploadTooLarge，記憶體用量與檔案大小無關。
+
+    Returns:
+        寫入的位元組數
+    """
+    total = 0
+    read = src.read
+    with open(dest_path, 'wb') as f:
+        write = f.write
+        while chunk := read(_UPLOAD_CHUNK_SIZE):
+            total += len(chunk)
+            if total > max_bytes:
+                raise _UploadTooLarge(total)
+            write(chunk)
+    return total
+
+
+def _remove_temp_file(path: str):
+    """刪除暫存檔（不存在時略過）"""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
 
 @app.post("/kb/personal/upload")
 @conditional_rate_limit("20/hour")
@@ -939,10 +992,9 @@ async def upload_personal_document(
         raise HTTPException(status_code=503, detail="個人知識庫功能未啟用")
     
     # 檢查格式
-    allowed_ext = {'.docx', '.pdf', '.txt', '.md', '.xlsx', '.csv', '.png', '.jpg', '.jpeg', '.gif'}
     ext = os.path.splitext(file.filename)[1].lower()
     
-    if ext not in allowed_ext:
+    if ext not in _PERSONAL_ALLOWED_EXTS:
         raise HTTPException(status_code=400, detail=f"不支援的格式: {ext}")
     
     # 儲存暫存檔
@@ -951,17 +1003,14 @@ async def upload_personal_document(
     temp_path = os.path.join(temp_dir, f"{user_account}_{datetime.utcnow().strftime('%Y%m%d%H%M%S')}_{file.filename}")
     
     try:
-        content = await file.read()
-        
-        # 檢查大小 (50MB)
-        if len(content) > 50 * 1024 * 1024:
+        # 串流寫入暫存檔並檢查大小 (50MB)，在執行緒中進行以免阻塞事件迴圈
+        try:
+            await run_in_threadpool(_save_upload, file.file, temp_path, PERSONAL_UPLOAD_MAX_BYTES)
+        except _UploadTooLarge:
             raise HTTPException(status_code=400, detail="檔案太大（上限 50MB）")
         
-        with open(temp_path, 'wb') as f:
-            f.write(content)
-        
-        # 處理文件
-        result = add_personal_doc(user_account, temp_path, file.filename)
+        # 處理文件（解析 / 切塊 / 向量化皆為阻塞操作，交由執行緒池執行）
+        result = await run_in_threadpool(add_personal_doc, user_account, temp_path, file.filename)
         
         return {
             "success": result.get("success", False),
@@ -978,8 +1027,7 @@ async def upload_personal_document(
         logger.error(f"個人文件上傳失敗: {e}")
         raise HTTPException(status_code=500, detail=str(e))
     finally:
-        if os.path.exists(temp_path):
-            os.remove(temp_path)
+        await run_in_threadpool(_remove_temp_file, temp_path)
 
 
 @app.get("/kb/personal/documents")
@@ -1015,7 +1063,7 @@ async def delete_personal_document(
     
     try:
         kb = get_personal_kb(user_account)
-        success = kb.remove_document(doc_id)
+        success = await run_in_threadpool(kb.remove_document, doc_id)
         
         if success:
             return {"success": True, "message": f"文件 {doc_id} 已刪除"}
@@ -1028,8 +1076,8 @@ async def delete_personal_document(
 
 
 @app.get("/kb/personal/{user_id}/images/{doc_id}/{image_name}")
-async def get_personal_image(user_id: str, doc_id: str, image_name: str):
-    """取得個人文件的圖片"""
+async def get_personal_image(request: Request, user_id: str, doc_id: str, image_name: str):
+    """取得個人文件的圖片（附 ETag / Last-Modified，可條件式重新驗證）"""
     if not PERSONAL_KB_ENABLED:
         raise HTTPException(status_code=503, detail="個人知識庫未啟用")
     
@@ -1037,21 +1085,34 @@ async def get_personal_image(user_id: str, doc_id: str, image_name: str):
         kb = get_personal_kb(user_id)
         image_path = kb.get_image_path(doc_id, image_name)
         
-        if image_path and os.path.exists(image_path):
-            ext = os.path.splitext(image_name)[1].lower()
-            mime_types = {
-                '.png': 'image/png',
-                '.jpg': 'image/jpeg',
-                '.jpeg': 'image/jpeg',
-                '.gif': 'image/gif',
-            }
-            return FileResponse(
-                image_path,
-                media_type=mime_types.get(ext, 'image/png'),
-                headers={"Cache-Control": "max-age=86400"}
-            )
-        else:
+        try:
+            st = os.stat(image_path) if image_path else None
+        except OSError:
+            st = None
+        if st is None:
             raise HTTPException(status_code=404, detail="圖片不存在")
+        
+        # 以修改時間與大小作為 ETag，瀏覽器重新驗證時未變更即回 304
+        etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+        headers = {
+            "Cache-Control": "max-age=86400",
+            "ETag": etag,
+            "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        }
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and (
+            if_none_match.strip() == "*"
+            or etag in (t.strip().removeprefix("W/") for t in if_none_match.split(","))
+        ):
+            return Response(status_code=304, headers=headers)
+        
+        ext = os.path.splitext(image_name)[1].lower()
+        return FileResponse(
+            image_path,
+            media_type=_IMAGE_MIME_TYPES.get(ext, 'image/png'),
+            headers=headers,
+            stat_result=st,
+        )
     except HTTPException:
         raise
     except Exception as e:
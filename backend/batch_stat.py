@@ -0,0 +1,83 @@
+# batch_stat.py - 批次 stat 工具
+"""
+大量檔案的批次 stat
+
+os.stat 在 C 層會釋放 GIL；目錄內檔案數達門檻時，以執行緒池分批並行送出
+stat，讓核心同時處理多個請求（網路 / 慢速檔案系統上效果最明顯）。
+小目錄直接逐一 stat，避免執行緒排程的額外開銷。
+
+環境變數：
+- KB_DISABLE_BATCH_STAT=1      停用並行，一律逐一 stat
+- KB_BATCH_STAT_THRESHOLD      啟用並行的最少檔案數（預設 2048）
+- KB_BATCH_STAT_WORKERS        執行緒數（預設 8）
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import List, Optional
+
+# ─────────────────────────────────────────────────────────────
+# 設定
+# ─────────────────────────────────────────────────────────────
+
+BATCH_STAT_DISABLED = os.getenv("KB_DISABLE_BATCH_STAT", "0").lower() in ("1", "true", "yes")
+BATCH_STAT_THRESHOLD = int(os.getenv("KB_BATCH_STAT_THRESHOLD", "2048"))
+BATCH_STAT_WORKERS = int(os.getenv("KB_BATCH_STAT_WORKERS", "8"))
+
+# 每個工作單位處理的路徑數
+_CHUNK_SIZE = 256
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = Lock()
+
+# ─────────────────────────────────────────────────────────────
+# 內部工具
+# ─────────────────────────────────────────────────────────────
+
+def _get_pool() -> ThreadPoolExecutor:
+    """取得共用執行緒池（延遲建立）"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=BATCH_STAT_WORKERS,
+                    thread_name_prefix="kb-stat",
+                )
+    return _pool
+
+
+def _safe_stat(path: str) -> Optional[os.stat_result]:
+    """stat 單一路徑，檔案已不存在時回傳 None"""
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+
+
+def _stat_chunk(paths: List[str]) -> List[Optional[os.stat_result]]:
+    return [_safe_stat(p) for p in paths]
+
+# ─────────────────────────────────────────────────────────────
+# 對外介面
+# ─────────────────────────────────────────────────────────────
+
+def batch_stat(paths: List[str]) -> List[Optional[os.stat_result]]:
+    """
+    批次取得多個路徑的 stat 結果
+
+    Args:
+        paths: 檔案路徑列表
+
+    Returns:
+        與 paths 順序對應的 stat_result 列表（失敗者為 None）
+    """
+    if BATCH_STAT_DISABLED or len(paths) < BATCH_STAT_THRESHOLD:
+        return _stat_chunk(paths)
+
+    chunks = [paths[i:i + _CHUNK_SIZE] for i in range(0, len(paths), _CHUNK_SIZE)]
+    results: List[Optional[os.stat_result]] = []
+    for chunk_result in _get_pool().map(_stat_chunk, chunks):
+        results.extend(chunk_result)
+    return results
@@ -38,6 +38,8 @@ except ImportError:
     _HAS_PANDAS = False
     logger.warning("pandas 未安裝，業務 AI 引擎將無法運作")
 
+from business_csv import read_business_csv
+
 # ═══════════════════════════════════════════════════════════════
 # 資料庫連接（PostgreSQL）
 # ═══════════════════════════════════════════════════════════════
@@ -500,7 +502,7 @@ class BusinessAIEngine:
             return
         
         try:
-            self.df = pd.read_csv(self.csv_path, encoding='utf-8')
+            self.df = read_business_csv(self.csv_path)
             self.df = self.df.dropna(how='all')
             
             # 預處理日期
@@ -764,10 +766,10 @@ class BusinessAIEngine:
         sep = "|" + "|".join(["---"] * len(cols)) + "|"
         
         rows = []
-        for _, r in df_show.iterrows():
+        for r in df_show.itertuples(index=False, name=None):
             row_vals = []
-            for c in cols:
-                val = str(r.get(c, ""))[:60]
+            for v in r:
+                val = str(v)[:60]
                 val = val.replace("|", "｜").replace("\n", " ")
                 row_vals.append(val)
             rows.append("| " + " | ".join(row_vals) + " |")
@@ -19,6 +19,18 @@ try:
 except ImportError:
     _HAS_PANDAS = False
 
+try:
+    import pyarrow  # noqa: F401  （僅供 pandas 的 pyarrow CSV 引擎使用）
+    _HAS_PYARROW = True
+except ImportError:
+    _HAS_PYARROW = False
+
+try:
+    import ahocorasick
+    _HAS_AHOCORASICK = True
+except ImportError:
+    _HAS_AHOCORASICK = False
+
 # ─────────────────────────────────────────────────────────────
 # 常數
 # ─────────────────────────────────────────────────────────────
@@ -37,6 +49,44 @@ CUSTOMER_KEYWORDS = [
     "股份有限公司", "有限公司", "實業"
 ]
 
+# 營業所偵測：(別名, 正式名稱)，依 BRANCH_SYNONYMS 的順序展開（正式名稱在前）
+_BRANCH_ALIAS_PAIRS = tuple(
+    (alias, canonical)
+    for canonical, syns in BRANCH_SYNONYMS.items()
+    for alias in (canonical, *syns)
+    if alias
+)
+
+# 裝有 pyahocorasick 時以自動機一次掃描查詢，取順序最前的營業所
+_BRANCH_AUTOMATON = None
+if _HAS_AHOCORASICK:
+    _BRANCH_AUTOMATON = ahocorasick.Automaton()
+    _branch_rank = {canonical: i for i, canonical in enumerate(BRANCH_SYNONYMS)}
+    for _alias, _canonical in _BRANCH_ALIAS_PAIRS:
+        _BRANCH_AUTOMATON.add_word(_alias, (_branch_rank[_canonical], _canonical))
+    _BRANCH_AUTOMATON.make_automaton()
+
+# 查詢解析用的正則（載入時編譯一次）
+_RE_CUSTOMER = re.compile(r'客戶[：:\s]*([^\s,，的]+)')
+_RE_CUSTOMER_SUFFIXES = [
+    re.compile(rf'([^\s,，列出查詢]+{suffix})') for suffix in CUSTOMER_KEYWORDS
+]
+_RE_CUSTOMER_ACTIVITY = re.compile(
+    r'(?:列出|查詢|顯示|找出?)\s*([^\s,，的]{2,10})\s*的?\s*(?:活動|記錄|紀錄|日報|業務)'
+)
+
+_RE_LAST_30D = re.compile(r'最近30[天日]|最近一個?月')
+_RE_LAST_7D = re.compile(r'最近7[天日]|最近一[個]?[週周禮拜]')
+_RE_LAST_N_DAYS = re.compile(r'最近(\d+)[天日]')
+_RE_LAST_N_WEEKS = re.compile(r'最近(\d+)[週周]')
+_RE_LAST_N_MONTHS = re.compile(r'最近(\d+)個?月')
+_RE_RECENT = re.compile(r'最近(?:的)?(?:活動|紀錄|記錄|業務)?')
+_RE_YEAR_MONTH = re.compile(r'(20\d{2})[年/\-](\d{1,2})月?')
+_RE_MONTH = re.compile(r'(?<!\d)(\d{1,2})月(?!\d)')
+_RE_DATE = re.compile(r'(20\d{2})[/\-](\d{1,2})[/\-](\d{1,2})')
+
+_RE_CLASS_SEP = re.compile(r'[、,，/]+')
+
 # ─────────────────────────────────────────────────────────────
 # CSV 路徑偵測
 # ─────────────────────────────────────────────────────────────
@@ -57,6 +107,20 @@ def _guess_business_csv() -> Optional[str]:
             return p
     return None
 
+# 超過此大小的 CSV 改用 pyarrow 多執行緒解析（小檔案用 C 解析器的固定成本較低）
+CSV_PYARROW_MIN_BYTES = int(os.environ.get("CSV_PYARROW_MIN_BYTES", str(1024 * 1024)))
+
+
+def read_business_csv(csv_path: str):
+    """讀取業務 CSV；檔案夠大且裝有 pyarrow 時使用 pyarrow 引擎"""
+    if _HAS_PYARROW and os.path.getsize(csv_path) >= CSV_PYARROW_MIN_BYTES:
+        df = _pd.read_csv(csv_path, encoding='utf-8', engine='pyarrow')
+        # pyarrow 不會去除 BOM（clean_business.csv 以 utf-8-sig 寫出）
+        if len(df.columns) and str(df.columns[0]).startswith('\ufeff'):
+            df = df.rename(columns={df.columns[0]: df.columns[0].lstrip('\ufeff')})
+        return df
+    return _pd.read_csv(csv_path, encoding='utf-8')
+
 # ─────────────────────────────────────────────────────────────
 # 客戶名稱解析
 # ─────────────────────────────────────────────────────────────
@@ -74,18 +138,18 @@ def _extract_customer_name(query: str) -> Optional[str]:
         return None
     
     # 模式1：「客戶XXX」
-    m = re.search(r'客戶[：:\s]*([^\s,，的]+)', query)
+    m = _RE_CUSTOMER.search(query)
     if m:
         return m.group(1).strip()
     
     # 模式2：「XXX公司/精機/科技/工業...的」
-    for suffix in CUSTOMER_KEYWORDS:
-        m = re.search(rf'([^\s,，列出查詢]+{suffix})', query)
+    for regex in _RE_CUSTOMER_SUFFIXES:
+        m = regex.search(query)
         if m:
             return m.group(1).strip()
     
     # 模式3：「列出/查詢 XXX 的活動」
-    m = re.search(r'(?:列出|查詢|顯示|找出?)\s*([^\s,，的]{2,10})\s*的?\s*(?:活動|記錄|紀錄|日報|業務)', query)
+    m = _RE_CUSTOMER_ACTIVITY.search(query)
     if m:
         candidate = m.group(1).strip()
         # 排除營業所和時間詞
@@ -168,12 +232,13 @@ def _fuzzy_match_customer(df, customer_name: str) -> 'pd.Series':
 def _detect_canonical_branch(q: str) -> Optional[str]:
     """從查詢中偵測營業所"""
     q = q or ""
-    for canonical, syns in BRANCH_SYNONYMS.items():
-        if canonical in q:
+    if _BRANCH_AUTOMATON is not None:
+        found = min((value for _, value in _BRANCH_AUTOMATON.iter(q)), default=None)
+        return found[1] if found else None
+    
+    for alias, canonical in _BRANCH_ALIAS_PAIRS:
+        if alias in q:
             return canonical
-        for s in syns:
-            if s and s in q:
-                return canonical
     return None
 
 
@@ -194,57 +259,62 @@ def _parse_date_from_query(q: str) -> Tuple[Optional[_dt.date], Optional[tuple]]
     
     today = _dt.date.today()
     
-    # 1. 最近30天 / 最近一個月
-    if re.search(r'最近30[天日]|最近一個?月', q):
-        start = today - _dt.timedelta(days=30)
-        return None, ('range', start, today)
-    
-    # 2. 最近7天 / 最近一週
-    if re.search(r'最近7[天日]|最近一[個]?[週周禮拜]', q):
-        start = today - _dt.timedelta(days=7)
-        return None, ('range', start, today)
-    
-    # 3. 最近N天
-    m = re.search(r'最近(\d+)[天日]', q)
-    if m:
-        days = int(m.group(1))
-        start = today - _dt.timedelta(days=days)
-        return None, ('range', start, today)
-    
-    # 4. 最近N週
-    m = re.search(r'最近(\d+)[週周]', q)
-    if m:
-        weeks = int(m.group(1))
-        start = today - _dt.timedelta(weeks=weeks)
-        return None, ('range', start, today)
-    
-    # 5. 最近N個月
-    m = re.search(r'最近(\d+)個?月', q)
-    if m:
-        months = int(m.group(1))
-        start = today - _dt.timedelta(days=months * 30)
-        return None, ('range', start, today)
-    
-    # 6. 最近 / 最近的活動 → 預設 90 天
-    if re.search(r'最近(?:的)?(?:活動|紀錄|記錄|業務)?', q):
+    # 規則 1–6 的樣式都以「最近」開頭，規則 7、9 需要「20」，規則 8 需要「月」：
+    # 先以子字串判斷（C 層單次掃描）略過不可能命中的規則，多數查詢不需執行任何 regex。
+    # 規則優先順序不變（各規則仍依序 search，而非取最左側的命中）。
+    if '最近' in q:
+        # 1. 最近30天 / 最近一個月
+        if _RE_LAST_30D.search(q):
+            start = today - _dt.timedelta(days=30)
+            return None, ('range', start, today)
+        
+        # 2. 最近7天 / 最近一週
+        if _RE_LAST_7D.search(q):
+            start = today - _dt.timedelta(days=7)
+            return None, ('range', start, today)
+        
+        # 3. 最近N天
+        m = _RE_LAST_N_DAYS.search(q)
+        if m:
+            days = int(m.group(1))
+            start = today - _dt.timedelta(days=days)
+            return None, ('range', start, today)
+        
+        # 4. 最近N週
+        m = _RE_LAST_N_WEEKS.search(q)
+        if m:
+            weeks = int(m.group(1))
+            start = today - _dt.timedelta(weeks=weeks)
+            return None, ('range', start, today)
+        
+        # 5. 最近N個月
+        m = _RE_LAST_N_MONTHS.search(q)
+        if m:
+            months = int(m.group(1))
+            start = today - _dt.timedelta(days=months * 30)
+            return None, ('range', start, today)
+        
+        # 6. 最近 / 最近的活動 → 預設 90 天（_RE_RECENT 後綴皆為可選，含「最近」即命中）
         start = today - _dt.timedelta(days=90)
         return None, ('range', start, today)
     
+    has_year = '20' in q
+    
     # 7. YYYY年MM月 或 YYYY/MM
-    m = re.search(r'(20\d{2})[年/\-](\d{1,2})月?', q)
+    m = _RE_YEAR_MONTH.search(q) if has_year else None
     if m:
         y, mo = int(m.group(1)), int(m.group(2))
         return None, (y, mo)
     
     # 8. 單獨的「N月」
-    m = re.search(r'(?<!\d)(\d{1,2})月(?!\d)', q)
+    m = _RE_MONTH.search(q) if '月' in q else None
     if m:
         mo = int(m.group(1))
         y = today.year
         return None, (y, mo)
     
     # 9. 具體日期 YYYY/MM/DD
-    m = re.search(r'(20\d{2})[/\-](\d{1,2})[/\-](\d{1,2})', q)
+    m = _RE_DATE.search(q) if has_year else None
     if m:
         try:
             d = _dt.date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
@@ -271,10 +341,10 @@ def _format_markdown_table(df, limit: int = 50) -> str:
     sep = "|" + "|".join(["---"] * len(cols)) + "|"
     
     rows = []
-    for _, r in df_show.iterrows():
+    for r in df_show[cols].itertuples(index=False, name=None):
         row_vals = []
-        for c in cols:
-            val = str(r.get(c, ""))[:80]  # 截斷過長內容
+        for v in r:
+            val = str(v)[:80]  # 截斷過長內容
             val = val.replace("|", "｜").replace("\n", " ")
             row_vals.append(val)
         rows.append("| " + " | ".join(row_vals) + " |")
@@ -289,7 +359,7 @@ def _class_distribution(df) -> Dict[str, int]:
     
     dist = {}
     for val in df['Class'].astype(str).fillna(''):
-        parts = [p.strip() for p in re.split(r'[、,，/]+', val) if p.strip()]
+        parts = [p.strip() for p in _RE_CLASS_SEP.split(val) if p.strip()]
         for p in parts:
             dist[p] = dist.get(p, 0) + 1
     
@@ -320,7 +390,7 @@ def _direct_business_query_text(query: str, csv_path: str = None) -> Optional[st
     
     # 讀取 CSV
     try:
-        df = _pd.read_csv(csv_path, encoding='utf-8')
+        df = read_business_csv(csv_path)
         # 過濾空行和無效資料
         df = df.dropna(how='all')  # 移除全空行
         df = df[df['Date'].notna() & (df['Date'].astype(str).str.strip() != '')]  # 確保有日期
@@ -376,7 +446,7 @@ def _direct_business_query_text(query: str, csv_path: str = None) -> Optional[st
     total = len(filtered)
     visit_count = 0
     for v in filtered.get('Class', _pd.Series([], dtype=object)).astype(str).fillna(''):
-        parts = [p.strip() for p in re.split(r'[、,，/]+', v) if p.strip()]
+        parts = [p.strip() for p in _RE_CLASS_SEP.split(v) if p.strip()]
         if '業務拜訪' in parts:
             visit_count += 1
     
@@ -427,11 +497,10 @@ def _direct_business_query_text(query: str, csv_path: str = None) -> Optional[st
 """
     
     # 加入時間軸（最新 5 筆）
-    for _, r in filtered_sorted.head(5).iterrows():
-        d = r.get('Date', 'N/A')
-        w = r.get('Worker', 'N/A')
-        c = r.get('Customer', 'N/A')
-        cls = r.get('Class', 'N/A')
+    timeline = filtered_sorted.head(5).reindex(
+        columns=['Date', 'Worker', 'Customer', 'Class'], fill_value='N/A'
+    )
+    for d, w, c, cls in timeline.itertuples(index=False, name=None):
         result += f"- {d}: {w} 拜訪 {c}，進行 {cls}\n"
     
     result += "\n📋 參考資料來源：\nbusiness"
@@ -18,9 +18,11 @@ from __future__ import annotations
 import argparse
 import re
 import os
+import sys
 import hashlib
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
 
@@ -57,12 +59,24 @@ TARGET_COLS = [
     "Manager", "Level", "Doc_Status", "TimeCreated", "Doc_Time"
 ]
 
+# 重複度高的短字串欄位（業務員、客戶、活動類型、日期等）：解析時以 sys.intern 共用同一字串物件，
+# 數十萬筆記錄只保留每個相異值一份
+INTERN_COLS = ("Date", "Worker", "Customer", "Class", "Depart", "Manager", "Level", "Doc_Status")
+
 RE_KEY_VALUE = re.compile(r"^([A-Za-z0-9_\-$\u4e00-\u9fa5]+)\s*[:：]\s*(.*)$")
+RE_DATE = re.compile(r"(\d{4})[/-](\d{1,2})[/-](\d{1,2})")
+RE_CLASS_SEP = re.compile(r"[,\s]+")
+RE_CN_NAME = re.compile(r"CN=([^/，,；;\s]+)")
+RE_FORM_FEEDS = re.compile(r"\f+")
+RE_RECORD_START = re.compile(r"^\s*(Doc_Time|Date)\s*[:：]")
 
 # ─────────────────────────────────────────────────────────────
 # 解析工具
 # ─────────────────────────────────────────────────────────────
 
+# 以下正規化函式皆為純字串轉換，欄位值重複度高（業務員、活動類型、日期），以 lru_cache 快取
+
+@lru_cache(maxsize=256)
 def normalize_key(k: str) -> str:
     """正規化欄位名稱"""
     k = k.strip()
@@ -75,12 +89,13 @@ def normalize_key(k: str) -> str:
         return k
     return k
 
+@lru_cache(maxsize=4096)
 def normalize_date(s: str) -> str:
     """將日期正規化為 YYYY/MM/DD"""
     s = (s or "").strip()
     if not s:
         return s
-    m = re.search(r"(\d{4})[/-](\d{1,2})[/-](\d{1,2})", s)
+    m = RE_DATE.search(s)
     if m:
         y, mo, d = m.groups()
         return f"{int(y):04d}/{int(mo):02d}/{int(d):02d}"
@@ -96,27 +111,49 @@ def parse_date(s: str) -> Optional[datetime]:
     except:
         return None
 
+@lru_cache(maxsize=4096)
 def normalize_class(s: str) -> str:
     """清洗活動類型"""
     s = (s or "").strip()
     if not s:
         return s
     s = s.replace("，", ",").replace("、", ",").replace(" ", "")
-    parts = [p for p in re.split(r"[,\s]+", s) if p]
+    parts = [p for p in RE_CLASS_SEP.split(s) if p]
     return ", ".join(parts)
 
+@lru_cache(maxsize=4096)
 def extract_cn_name(s: str) -> str:
     """從 CN=名字/O=Org 格式抽出名字"""
     if not isinstance(s, str):
         return s
-    m = re.search(r"CN=([^/，,；;\s]+)", s)
+    m = RE_CN_NAME.search(s)
     return m.group(1) if m else s
 
+# 去重 hash 使用的欄位
+HASH_KEY_FIELDS = ["Date", "Worker", "Customer", "Content", "TimeCreated"]
+
+def _hash_key_str(key_str: str) -> str:
+    return hashlib.md5(key_str.encode()).hexdigest()[:12]
+
 def compute_record_hash(rec: Dict[str, str]) -> str:
     """計算記錄的唯一 hash（用於去重）"""
-    key_fields = ["Date", "Worker", "Customer", "Content", "TimeCreated"]
-    key_str = "|".join(str(rec.get(f, "")) for f in key_fields)
-    return hashlib.md5(key_str.encode()).hexdigest()[:12]
+    key_str = "|".join(str(rec.get(f, "")) for f in HASH_KEY_FIELDS)
+    return _hash_key_str(key_str)
+
+def compute_record_hashes(df: pd.DataFrame) -> pd.Series:
+    """
+    整個 DataFrame 的記錄 hash（與逐筆 compute_record_hash 結果相同）
+    
+    以欄位字串串接一次組出所有 key，避免逐列建立 Series / dict。
+    """
+    if df.empty:
+        return pd.Series([], index=df.index, dtype=object)
+    parts = [
+        df[f].astype(str) if f in df.columns else pd.Series("", index=df.index)
+        for f in HASH_KEY_FIELDS
+    ]
+    key_strs = parts[0].str.cat(parts[1:], sep="|")
+    return key_strs.map(_hash_key_str)
 
 # ─────────────────────────────────────────────────────────────
 # 記錄切分與解析
@@ -126,16 +163,15 @@ def split_records(text: str) -> List[str]:
     """將文字切分為多筆記錄"""
     # 優先使用換頁符
     if "\f" in text:
-        blocks = re.split(r"\f+", text)
+        blocks = RE_FORM_FEEDS.split(text)
         return [b for b in blocks if b.strip()]
     
     # 退路：以 Doc_Time 或 Date 行為分段
     lines = text.splitlines()
     blocks, curr = [], []
-    rec_start_re = re.compile(r"^\s*(Doc_Time|Date)\s*[:：]")
     
     for ln in lines:
-        if rec_start_re.search(ln) and curr:
+        if RE_RECORD_START.search(ln) and curr:
             blocks.append("\n".join(curr))
             curr = [ln]
         else:
@@ -145,6 +181,54 @@ def split_records(text: str) -> List[str]:
     
     return [b for b in blocks if b.strip()]
 
+# 串流讀取時每次讀入的字元數
+READ_CHUNK_CHARS = 1024 * 1024
+
+def _file_has_form_feed(path: Path) -> bool:
+    """以二進位分段掃描檔案是否含換頁符（不載入整個檔案）"""
+    with path.open("rb") as f:
+        while chunk := f.read(READ_CHUNK_CHARS):
+            if b"\f" in chunk:
+                return True
+    return False
+
+def iter_records(path: Path, encoding: str = "utf-8") -> Iterator[str]:
+    """
+    逐筆串流讀出檔案中的記錄（與 split_records(整個檔案內容) 的結果相同）
+    
+    記憶體用量只與單筆記錄大小有關，不需一次讀入整個檔案。
+    """
+    if _file_has_form_feed(path):
+        # 換頁符模式：以換頁符切分，略過空白區塊
+        with path.open("r", encoding=encoding, errors="ignore") as f:
+            pending = ""
+            while chunk := f.read(READ_CHUNK_CHARS):
+                parts = (pending + chunk).split("\f")
+                pending = parts.pop()
+                for b in parts:
+                    if b.strip():
+                        yield b
+            if pending.strip():
+                yield pending
+        return
+    
+    # 退路：以 Doc_Time 或 Date 行為分段
+    curr: List[str] = []
+    with path.open("r", encoding=encoding, errors="ignore") as f:
+        for raw in f:
+            for ln in raw.splitlines():
+                if RE_RECORD_START.search(ln) and curr:
+                    block = "\n".join(curr)
+                    if block.strip():
+                        yield block
+                    curr = [ln]
+                else:
+                    curr.append(ln)
+    if curr:
+        block = "\n".join(curr)
+        if block.strip():
+            yield block
+
 def parse_block(block: str) -> Dict[str, str]:
     """解析單一區塊為欄位 dict"""
     data = {col: "" for col in TARGET_COLS}
@@ -179,6 +263,9 @@ def parse_block(block: str) -> Dict[str, str]:
     data["Date"] = normalize_date(data["Date"])
     data["Class"] = normalize_class(data["Class"])
     
+    for col in INTERN_COLS:
+        data[col] = sys.intern(data[col])
+    
     return data
 
 # ─────────────────────────────────────────────────────────────
@@ -217,24 +304,15 @@ def process_business_file(
     cutoff_date = datetime.now() - relativedelta(months=months_to_keep)
     stats["cutoff_date"] = cutoff_date.strftime("%Y/%m/%d")
     
-    # 讀取輸入檔案
+    # 讀取輸入檔案（以 utf-8 串流解碼，無法解碼的位元組略過）
     input_path = Path(input_path)
-    text = None
-    for enc in ("utf-8", "utf-8-sig", "cp950", "big5"):
-        try:
-            text = input_path.read_text(encoding=enc, errors="ignore")
-            break
-        except:
-            continue
-    
-    if text is None:
+    if not input_path.is_file():
         raise ValueError(f"無法讀取檔案: {input_path}")
     
     # 解析記錄
-    blocks = split_records(text)
     rows = []
     
-    for b in blocks:
+    for b in iter_records(input_path):
         rec = parse_block(b)
         if not any(rec.values()) or not (rec.get("Date") or rec.get("Content")):
             continue
@@ -264,9 +342,7 @@ def process_business_file(
             
             # 確保現有資料也有 hash
             if "_hash" not in df_existing.columns:
-                df_existing["_hash"] = df_existing.apply(
-                    lambda r: compute_record_hash(r.to_dict()), axis=1
-                )
+                df_existing["_hash"] = compute_record_hashes(df_existing)
             
             # 現有資料也要過濾日期
             df_existing["_parsed_date"] = df_existing["Date"].apply(parse_date)
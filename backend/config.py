@@ -195,6 +195,10 @@ RETRIEVER_CONFIGS = {
 class ChunkConfig:
     chunk_size: int = 600
     chunk_overlap: int = 100
+    # 切塊策略：paragraph（段落累積）或 sliding（固定大小滑動視窗）
+    strategy: str = "paragraph"
+    # sliding 模式的步幅（0 表示 chunk_size 的 3/4）
+    stride: int = 0
     separators: List[str] = field(default_factory=lambda: [
         "\n## ", "\n### ", "\n#### ",
         "\n\n**", "\n\n", "\n", "。", "；", " ", ""
@@ -222,6 +226,7 @@ CHUNK_CONFIGS = {
     "personal": ChunkConfig(
         chunk_size=800,       # 增加到 800
         chunk_overlap=120,
+        strategy=os.getenv("PERSONAL_CHUNK_STRATEGY", "paragraph"),
         separators=[
             "\n## ", "\n### ",
             "\n第 ", "\n一、", "\n二、", "\n三、",  # 條文分隔
@@ -437,11 +442,11 @@ BRANCH_SYNONYMS = {
 }
 
 # 中文停用詞
-CHINESE_STOPWORDS = {
+CHINESE_STOPWORDS = frozenset({
     '的', '是', '在', '和', '了', '有', '這', '個', '不', '為',
     '上', '下', '中', '請', '到', '把', '被', '讓', '給', '跟',
     '與', '及', '或', '但', '而', '因', '所', '以', '就', '都',
-}
+})
 
 # ═══════════════════════════════════════════════════════════════
 # 複雜度評估設定
@@ -13,6 +13,8 @@
 import os
 import re
 import json
+import random
+import asyncio
 import hashlib
 import logging
 from typing import List, Dict, Optional, Tuple, Any
@@ -20,6 +22,7 @@ from dataclasses import dataclass, asdict, field
 from datetime import datetime
 from threading import Lock
 from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 
 logger = logging.getLogger(__name__)
@@ -39,7 +42,7 @@ except ImportError:
 # 查詢增強器（多語言術語擴展）
 # ═══════════════════════════════════════════════════════════════
 try:
-    from query_enhancer import enhance_query, EnhancedQuery
+    from query_enhancer import enhance_query, EnhancedQuery, clear_enhance_cache
     _HAS_QUERY_ENHANCER = True
     logger.info("✅ 查詢增強器已載入")
 except ImportError:
@@ -146,13 +149,14 @@ _bootstrap_llm_env()
 # ═══════════════════════════════════════════════════════════════
 
 from config import (
-    EMBEDDING_MODEL, LLM_CONFIGS, RETRIEVER_CONFIGS,
+    LLM_CONFIGS, RETRIEVER_CONFIGS,
     PROMPTS, RERANKER_CONFIG, CACHE_CONFIG, SOURCE_TRACKING,
     KEYWORD_PATTERNS, CHINESE_STOPWORDS, COMPLEXITY_THRESHOLDS,
     COMPARISON_KEYWORDS, ANALYSIS_KEYWORDS,
     VECTOR_DB_DIR, BUSINESS_CSV_FILE, MARKDOWN_DIR,
     get_llm_config, get_retriever_config,
 )
+from utils import MAX_EMBED_CONCURRENCY, get_shared_embedding, submit_embedding
 
 # ═══════════════════════════════════════════════════════════════
 # 資料結構
@@ -360,6 +364,11 @@ def estimate_complexity(query: str, doc_count: int = 0) -> str:
 # 關鍵字索引（精確匹配層）
 # ═══════════════════════════════════════════════════════════════
 
+# 關鍵字模式於載入時編譯一次
+_KEYWORD_RES = [re.compile(p, re.IGNORECASE) for p in KEYWORD_PATTERNS]
+_CHINESE_WORD_RE = re.compile(r'[\u4e00-\u9fa5]{2,6}')
+_STOPWORDS = frozenset(CHINESE_STOPWORDS)
+
 class KeywordIndex:
     """倒排關鍵字索引，用於精確匹配"""
     
@@ -394,13 +403,13 @@ class KeywordIndex:
         keywords = set()
         
         # 使用配置的正則模式
-        for pattern in KEYWORD_PATTERNS:
-            matches = re.findall(pattern, text, re.IGNORECASE)
+        for regex in _KEYWORD_RES:
+            matches = regex.findall(text)
             keywords.update(m.upper() if len(m) <= 10 else m for m in matches)
         
         # 中文詞彙
-        chinese = re.findall(r'[\u4e00-\u9fa5]{2,6}', text)
-        keywords.update(w for w in chinese if w not in CHINESE_STOPWORDS)
+        chinese = _CHINESE_WORD_RE.findall(text)
+        keywords.update(w for w in chinese if w not in _STOPWORDS)
         
         # 產品型號
         products = extract_product_models(text)
@@ -618,6 +627,212 @@ class Reranker:
             logger.warning(f"Rerank 失敗: {e}")
             return results[:RERANKER_CONFIG.top_n]
 
+# ═══════════════════════════════════════════════════════════════
+# 向量庫批次寫入
+# ═══════════════════════════════════════════════════════════════
+
+# 技術文件寫入向量庫：每次 embedding 請求的 chunk 數（受 OpenAI 單次 token 上限限制），
+# 以及每次寫入 Chroma 的筆數（Chroma 建議 50–250）；同時進行的 embedding 請求數
+# 由 utils.MAX_EMBED_CONCURRENCY 限制
+EMBED_CALL_BATCH = int(os.getenv("EMBED_CALL_BATCH", "500"))
+CHROMA_WRITE_BATCH = int(os.getenv("CHROMA_WRITE_BATCH", "200"))
+
+# HNSW 索引每累積多少筆才寫回磁碟（預設 1000）、每次併入索引的筆數（預設 100）；
+# 調高後大量寫入時不會反覆序列化整個索引，僅在建立 collection 時生效
+HNSW_SYNC_THRESHOLD = int(os.getenv("HNSW_SYNC_THRESHOLD", "10000"))
+HNSW_BATCH_SIZE = int(os.getenv("HNSW_BATCH_SIZE", "1000"))
+
+# embedding 批次失敗（限流 429、逾時等）時的重試次數與指數退避上限（秒）
+EMBED_MAX_ATTEMPTS = int(os.getenv("EMBED_MAX_ATTEMPTS", "5"))
+EMBED_RETRY_MAX_DELAY = 30.0
+
+# 上次寫入失敗的來源檔（下次同步時重新處理，其餘 chunk 以穩定 ID 略過）
+FAILED_SOURCES_FILE = os.path.join(VECTOR_DB_DIR, "failed_sources.json")
+
+
+def _run_coroutine(coro):
+    """在同步流程中執行 coroutine；若目前執行緒已有事件迴圈則改在獨立執行緒執行"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
+# 分頁讀取 collection 時每頁的筆數
+COLLECTION_PAGE_SIZE = 10000
+
+
+def _collect_sources(collection, live_sources: Optional[set] = None) -> Tuple[set, List[str]]:
+    """
+    分頁讀取 collection 的 metadata，收集所有 source
+    
+    給定 live_sources 時，同時收集 source 已不在其中的 chunk ID（已刪除檔案的殘留）；
+    每頁只比對該頁的 metadata，記憶體用量為 O(頁大小 + 待刪除數)。
+    
+    Returns:
+        (source 集合, 待刪除的 chunk ID 列表)
+    """
+    sources = set()
+    stale_ids: List[str] = []
+    total = collection.count()
+    for offset in range(0, total, COLLECTION_PAGE_SIZE):
+        page = collection.get(limit=COLLECTION_PAGE_SIZE, offset=offset, include=["metadatas"])
+        for chunk_id, meta in zip(page["ids"], page["metadatas"] or ()):
+            source = meta.get('source') if meta else None
+            if not source:
+                continue
+            sources.add(source)
+            if live_sources is not None and source not in live_sources:
+                stale_ids.append(chunk_id)
+    return sources, stale_ids
+
+
+def _delete_ids_batched(collection, ids: List[str]) -> int:
+    """依 CHROMA_WRITE_BATCH 分段刪除 chunk；回傳成功刪除的筆數"""
+    deleted = 0
+    for i in range(0, len(ids), CHROMA_WRITE_BATCH):
+        batch = ids[i:i + CHROMA_WRITE_BATCH]
+        try:
+            collection.delete(ids=batch)
+            deleted += len(batch)
+        except Exception as e:
+            logger.warning(f"刪除 {len(batch)} 個 chunks 失敗: {e}")
+    return deleted
+
+
+@lru_cache(maxsize=1)
+def _get_tech_vectordb():
+    """
+    取得技術文件的 Chroma collection（程序內只開啟一次）
+    
+    開啟持久化目錄需載入 HNSW 索引與 SQLite；重新載入系統時沿用同一個連線，
+    新檔案由增量同步寫入。
+    """
+    from langchain_chroma import Chroma
+    
+    os.makedirs(VECTOR_DB_DIR, exist_ok=True)
+    return Chroma(
+        persist_directory=VECTOR_DB_DIR,
+        embedding_function=get_shared_embedding(),
+        collection_name="tech_docs",
+        collection_metadata={
+            "hnsw:sync_threshold": HNSW_SYNC_THRESHOLD,
+            "hnsw:batch_size": HNSW_BATCH_SIZE,
+        },
+    )
+
+
+def _load_failed_sources() -> set:
+    """讀取上次寫入失敗的來源檔"""
+    try:
+        with open(FAILED_SOURCES_FILE, 'r', encoding='utf-8') as f:
+            return set(json.load(f))
+    except (OSError, ValueError):
+        return set()
+
+
+def _save_failed_sources(sources: set) -> None:
+    """記錄寫入失敗的來源檔；全部成功時移除記錄檔"""
+    try:
+        if sources:
+            with open(FAILED_SOURCES_FILE, 'w', encoding='utf-8') as f:
+                json.dump(sorted(sources), f, ensure_ascii=False)
+        elif os.path.exists(FAILED_SOURCES_FILE):
+            os.remove(FAILED_SOURCES_FILE)
+    except OSError as e:
+        logger.warning(f"無法寫入失敗記錄: {e}")
+
+
+def _chunk_id(source: str, chunk_idx: int, content: str) -> str:
+    """由來源檔名、chunk 序號與內容決定的穩定 chunk ID（內容相同即 ID 相同）"""
+    key = f"{source}\x00{chunk_idx}\x00{content}"
+    # 僅作內容定址用，不需密碼學強度；blake2b 比 sha1 快，digest 長度維持 20 bytes
+    return "tech:" + hashlib.blake2b(key.encode("utf-8"), digest_size=20).hexdigest()
+
+
+async def _aadd_texts_batched(vectordb, texts: List[str], metadatas: List[Dict]) -> set:
+    """
+    分批並行計算 embedding，再以預先算好的向量寫入 Chroma collection
+    
+    texts / metadatas 為平行陣列（不建立 Document 物件）。每個 chunk 使用穩定 ID；
+    已在 collection 中的 chunk（例如中斷後重跑的批次）不再送 embedding，其餘以 upsert 寫入。
+    embedding 以同步 client 在 utils 的共用執行緒池送出（不綁定本次的事件迴圈）；
+    同時送進池中的批次不超過 MAX_EMBED_CONCURRENCY，其他模組（如個人知識庫上傳）
+    的 embedding 請求最多只需等待一輪，不會排在整個同步之後。
+    Chroma 的查詢與寫入（同步 SQLite / HNSW）以 asyncio.to_thread 在工作執行緒執行，
+    寫入期間事件迴圈仍可處理其他批次的 embedding 回應；每批依 CHROMA_WRITE_BATCH 分段寫入。
+    單批失敗時以指數退避（含 jitter）重試最多 EMBED_MAX_ATTEMPTS 次，從失敗的步驟接續
+    （寫入失敗不會重新計算 embedding）。
+    
+    Returns:
+        重試後仍寫入失敗的來源檔名
+    """
+    semaphore = asyncio.Semaphore(MAX_EMBED_CONCURRENCY)
+    embedding = vectordb.embeddings
+    collection = vectordb._collection
+    
+    async def add_batch(batch_num: int, texts: List[str], metadatas: List[Dict]):
+        ids = [
+            _chunk_id(m.get("source", ""), m.get("chunk_idx", 0), t)
+            for t, m in zip(texts, metadatas)
+        ]
+        # 各步驟的進度跨重試保留：已算好的向量與已寫入的分段不會重做
+        checked = False
+        vectors = None
+        written = 0
+        
+        for attempt in range(1, EMBED_MAX_ATTEMPTS + 1):
+            try:
+                if not checked:
+                    existing = set((await asyncio.to_thread(collection.get, ids=ids, include=[]))["ids"])
+                    checked = True
+                    if existing:
+                        keep = [k for k, i in enumerate(ids) if i not in existing]
+                        logger.info(f"  ⏭️ 第 {batch_num} 批: {len(existing)} chunks 已存在，略過")
+                        if not keep:
+                            return
+                        ids = [ids[k] for k in keep]
+                        texts = [texts[k] for k in keep]
+                        metadatas = [metadatas[k] for k in keep]
+                
+                if vectors is None:
+                    logger.info(f"  📦 處理第 {batch_num} 批: {len(texts)} chunks...")
+                    async with semaphore:
+                        vectors = await asyncio.wrap_future(submit_embedding(embedding, texts))
+                
+                while written < len(texts):
+                    end = written + CHROMA_WRITE_BATCH
+                    await asyncio.to_thread(
+                        collection.upsert,
+                        ids=ids[written:end],
+                        embeddings=vectors[written:end],
+                        documents=texts[written:end],
+                        metadatas=metadatas[written:end],
+                    )
+                    written = end
+                return
+            except Exception as e:
+                if attempt == EMBED_MAX_ATTEMPTS:
+                    logger.error(f"  ❌ 第 {batch_num} 批寫入失敗（已重試 {attempt} 次）: {e}")
+                    failed_sources.update(m.get("source", "") for m in metadatas)
+                    return
+                delay = min(EMBED_RETRY_MAX_DELAY, 2 ** (attempt - 1)) + random.uniform(0, 1)
+                logger.warning(f"  ⚠️ 第 {batch_num} 批失敗，{delay:.1f} 秒後重試（{attempt}/{EMBED_MAX_ATTEMPTS}）: {e}")
+                await asyncio.sleep(delay)
+    
+    failed_sources = set()
+    await asyncio.gather(*(
+        add_batch(
+            i // EMBED_CALL_BATCH + 1,
+            texts[i:i + EMBED_CALL_BATCH],
+            metadatas[i:i + EMBED_CALL_BATCH],
+        )
+        for i in range(0, len(texts), EMBED_CALL_BATCH)
+    ))
+    return failed_sources
+
 # ═══════════════════════════════════════════════════════════════
 # 主要 RAG 引擎
 # ═══════════════════════════════════════════════════════════════
@@ -702,20 +917,8 @@ class CategorizedQASystem:
     def _init_vectordb(self):
         """初始化向量庫（自動從 markdown 目錄建立，支援增量更新）"""
         try:
-            from langchain_chroma import Chroma
-            from langchain_openai import OpenAIEmbeddings
-            from langchain.text_splitter import RecursiveCharacterTextSplitter
-            from langchain_core.documents import Document
-            
-            embedding = OpenAIEmbeddings(model=EMBEDDING_MODEL)
-            
-            os.makedirs(VECTOR_DB_DIR, exist_ok=True)
-            
-            self._vectordb = Chroma(
-                persist_directory=VECTOR_DB_DIR,
-                embedding_function=embedding,
-                collection_name="tech_docs",
-            )
+            self._vectordb = _get_tech_vectordb()
+            embedding = self._vectordb.embeddings
             
             self.doc_count = self._vectordb._collection.count()
             
@@ -742,19 +945,6 @@ class CategorizedQASystem:
     def _sync_vectordb_with_markdown(self, embedding):
         """同步向量庫與 markdown 目錄（增量更新）"""
         from langchain.text_splitter import RecursiveCharacterTextSplitter
-        from langchain_core.documents import Document
-        
-        # 取得向量庫中已有的檔案
-        try:
-            existing_data = self._vectordb.get()
-            existing_sources = set()
-            if existing_data and existing_data.get('metadatas'):
-                for meta in existing_data['metadatas']:
-                    if meta and meta.get('source'):
-                        existing_sources.add(meta['source'])
-        except Exception as e:
-            logger.warning(f"無法讀取現有向量庫: {e}")
-            existing_sources = set()
         
         # 取得 markdown 目錄中的檔案
         markdown_files = set()
@@ -762,8 +952,24 @@ class CategorizedQASystem:
             if filename.endswith(('.md', '.txt', '.markdown')):
                 markdown_files.add(filename)
         
-        # 找出需要新增的檔案
-        new_files = markdown_files - existing_sources
+        # 取得向量庫中已有的檔案（分頁只讀 metadata，不載入文件內容與向量），
+        # 同時找出已從目錄刪除的檔案所留下的 chunks（目錄為空時不清除，避免掛載異常時清空向量庫）
+        collection = self._vectordb._collection
+        try:
+            existing_sources, stale_ids = _collect_sources(
+                collection, markdown_files if markdown_files else None
+            )
+        except Exception as e:
+            logger.warning(f"無法讀取現有向量庫: {e}")
+            existing_sources, stale_ids = set(), []
+        
+        if stale_ids:
+            deleted = _delete_ids_batched(collection, stale_ids)
+            removed_files = len(existing_sources - markdown_files)
+            logger.info(f"🗑️ 已移除 {removed_files} 個已刪除檔案的 {deleted} 個 chunks")
+        
+        # 找出需要新增的檔案（含上次寫入失敗、可能只寫入部分 chunks 的檔案）
+        new_files = (markdown_files - existing_sources) | (_load_failed_sources() & markdown_files)
         
         if not new_files:
             logger.info("📚 向量庫已是最新，無需更新")
@@ -781,7 +987,8 @@ class CategorizedQASystem:
             ]
         )
         
-        all_docs = []
+        all_texts: List[str] = []
+        all_metadatas: List[Dict] = []
         
         for filename in new_files:
             filepath = os.path.join(MARKDOWN_DIR, filename)
@@ -794,38 +1001,34 @@ class CategorizedQASystem:
                 
                 chunks = text_splitter.split_text(content)
                 
-                for i, chunk in enumerate(chunks):
-                    doc = Document(
-                        page_content=chunk,
-                        metadata={
-                            "source": filename,
-                            "chunk_idx": i,
-                            "doc_type": "technical"
-                        }
-                    )
-                    all_docs.append(doc)
+                all_texts.extend(chunks)
+                all_metadatas.extend(
+                    {"source": filename, "chunk_idx": i, "doc_type": "technical"}
+                    for i in range(len(chunks))
+                )
                 
                 logger.info(f"  📄 {filename}: {len(chunks)} chunks")
                 
             except Exception as e:
                 logger.error(f"  ❌ 讀取 {filename} 失敗: {e}")
         
-        if all_docs:
-            # 分批處理，每批 500 個 chunks
-            batch_size = 500
-            total = len(all_docs)
+        if all_texts:
+            # 分批並行處理
+            total = len(all_texts)
             logger.info(f"📤 開始 embedding {total} 個新 chunks...")
             
-            for i in range(0, total, batch_size):
-                batch = all_docs[i:i + batch_size]
-                self._vectordb.add_documents(batch)
+            failed_sources = _run_coroutine(
+                _aadd_texts_batched(self._vectordb, all_texts, all_metadatas)
+            )
+            _save_failed_sources(failed_sources)
             
+            if failed_sources:
+                logger.warning(f"⚠️ {len(failed_sources)} 個檔案寫入失敗，下次同步時重試")
             logger.info(f"✅ 增量更新完成: 新增 {total} chunks")
     
     def _build_vectordb_from_markdown(self, embedding):
         """從 markdown 目錄建立向量庫"""
         from langchain.text_splitter import RecursiveCharacterTextSplitter
-        from langchain_core.documents import Document
         
         text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,      # 增加到 1000，保留完整段落
@@ -837,7 +1040,8 @@ class CategorizedQASystem:
             ]
         )
         
-        all_docs = []
+        all_texts: List[str] = []
+        all_metadatas: List[Dict] = []
         
         for filename in os.listdir(MARKDOWN_DIR):
             if not filename.endswith(('.md', '.txt', '.markdown')):
@@ -853,34 +1057,30 @@ class CategorizedQASystem:
                 
                 chunks = text_splitter.split_text(content)
                 
-                for i, chunk in enumerate(chunks):
-                    doc = Document(
-                        page_content=chunk,
-                        metadata={
-                            "source": filename,
-                            "chunk_idx": i,
-                            "doc_type": "technical"
-                        }
-                    )
-                    all_docs.append(doc)
+                all_texts.extend(chunks)
+                all_metadatas.extend(
+                    {"source": filename, "chunk_idx": i, "doc_type": "technical"}
+                    for i in range(len(chunks))
+                )
                 
                 logger.info(f"  📄 {filename}: {len(chunks)} chunks")
                 
             except Exception as e:
                 logger.error(f"  ❌ 讀取 {filename} 失敗: {e}")
         
-        if all_docs:
-            # 分批處理，每批 500 個 chunks（避免超過 OpenAI token 限制）
-            batch_size = 500
-            total = len(all_docs)
+        if all_texts:
+            # 分批處理（每批 EMBED_CALL_BATCH 個 chunks，避免超過 OpenAI token 限制），多批並行
+            batch_size = EMBED_CALL_BATCH
+            total = len(all_texts)
             logger.info(f"📤 開始 embedding {total} 個 chunks（分 {(total + batch_size - 1) // batch_size} 批）...")
             
-            for i in range(0, total, batch_size):
-                batch = all_docs[i:i + batch_size]
-                batch_num = i // batch_size + 1
-                logger.info(f"  📦 處理第 {batch_num} 批: {len(batch)} chunks...")
-                self._vectordb.add_documents(batch)
+            failed_sources = _run_coroutine(
+                _aadd_texts_batched(self._vectordb, all_texts, all_metadatas)
+            )
+            _save_failed_sources(failed_sources)
             
+            if failed_sources:
+                logger.warning(f"⚠️ {len(failed_sources)} 個檔案寫入失敗，下次同步時重試")
             logger.info(f"✅ 向量庫建立完成: {total} chunks")
     
     def _init_bm25(self):
@@ -1637,6 +1837,8 @@ class CategorizedQASystem:
         
         self.initialize()
         self.cache.clear()
+        if _HAS_QUERY_ENHANCER:
+            clear_enhance_cache()
         logger.info("✅ 系統已重新載入")
         return True
     
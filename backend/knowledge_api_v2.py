@@ -13,8 +13,13 @@ knowledge_api_v2.py - 知識庫 API v2
 
 import os
 import shutil
+import asyncio
 import subprocess
 import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from threading import Lock
 from datetime import datetime
 from typing import List, Optional, Dict, Any
 from pathlib import Path
@@ -204,7 +209,7 @@ def convert_excel_to_markdown(excel_path: str, output_path: str) -> Dict[str, An
                 headers = "| " + " | ".join(str(c) for c in df.columns) + " |"
                 separator = "| " + " | ".join(["---"] * len(df.columns)) + " |"
                 rows = []
-                for _, row in df.iterrows():
+                for row in df.itertuples(index=False, name=None):
                     rows.append("| " + " | ".join(str(v) if pd.notna(v) else "" for v in row) + " |")
                 content_parts.append(headers + "\n" + separator + "\n" + "\n".join(rows))
             
@@ -247,7 +252,7 @@ def convert_csv_to_markdown(csv_path: str, output_path: str) -> Dict[str, Any]:
                 headers = "| " + " | ".join(str(c) for c in df.columns) + " |"
                 separator = "| " + " | ".join(["---"] * len(df.columns)) + " |"
                 f.write(headers + "\n" + separator + "\n")
-                for _, row in df.iterrows():
+                for row in df.itertuples(index=False, name=None):
                     f.write("| " + " | ".join(str(v) if pd.notna(v) else "" for v in row) + " |\n")
         
         return {"success": True, "rows": len(df)}
@@ -256,6 +261,54 @@ def convert_csv_to_markdown(csv_path: str, output_path: str) -> Dict[str, Any]:
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+# ─────────────────────────────────────────────────────────────
+# 轉換行程池
+# ─────────────────────────────────────────────────────────────
+
+# 文件轉換（pdfplumber / pandas 為 CPU 密集的純 Python 處理）在獨立行程執行，
+# 不佔用事件迴圈與 GIL；多個上傳可同時轉換
+CONVERT_WORKERS = int(os.getenv("KB_CONVERT_WORKERS", str(os.cpu_count() or 2)))
+
+_convert_pool: Optional[ProcessPoolExecutor] = None
+_convert_pool_lock = Lock()
+
+def _get_convert_pool() -> ProcessPoolExecutor:
+    """取得共用的轉換行程池（延遲建立；以 spawn 啟動，避免 fork 多執行緒的伺服器行程）"""
+    global _convert_pool
+    if _convert_pool is None:
+        with _convert_pool_lock:
+            if _convert_pool is None:
+                _convert_pool = ProcessPoolExecutor(
+                    max_workers=CONVERT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+    return _convert_pool
+
+def _get_converter(ext: str):
+    if ext == '.pdf':
+        return convert_pdf_to_markdown
+    if ext in {'.xlsx', '.xls'}:
+        return convert_excel_to_markdown
+    if ext == '.csv':
+        return convert_csv_to_markdown
+    return convert_docx_to_markdown
+
+async def run_conversion(ext: str, input_path: str, output_path: str) -> Dict[str, Any]:
+    """在轉換行程池中轉換文件；行程池失效時捨棄該行程池（下次重建）並改在執行緒中轉換"""
+    global _convert_pool
+    converter = _get_converter(ext)
+    loop = asyncio.get_running_loop()
+    pool = _get_convert_pool()
+    try:
+        return await loop.run_in_executor(pool, converter, input_path, output_path)
+    except BrokenProcessPool:
+        # 其他請求可能已換上新的行程池，只重設仍指向失效行程池的情況
+        with _convert_pool_lock:
+            if _convert_pool is pool:
+                _convert_pool = None
+        pool.shutdown(wait=False)
+        return await loop.run_in_executor(None, converter, input_path, output_path)
+
 # ─────────────────────────────────────────────────────────────
 # API: 統計與概覽
 # ─────────────────────────────────────────────────────────────
@@ -517,14 +570,7 @@ async def upload_file(
             output_name = Path(safe_name).stem + '.md'
             output_path = os.path.join(target_dir, output_name)
             
-            if ext == '.pdf':
-                conv_result = convert_pdf_to_markdown(temp_path, output_path)
-            elif ext in {'.xlsx', '.xls'}:
-                conv_result = convert_excel_to_markdown(temp_path, output_path)
-            elif ext == '.csv':
-                conv_result = convert_csv_to_markdown(temp_path, output_path)
-            else:
-                conv_result = convert_docx_to_markdown(temp_path, output_path)
+            conv_result = await run_conversion(ext, temp_path, output_path)
             
             if conv_result.get("success"):
                 result["converted"] = True
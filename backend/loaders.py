@@ -5,13 +5,17 @@
 
 import os
 import re
+import mmap
+import logging
 from typing import List, Dict, Optional
 from pathlib import Path
 
 from langchain_community.document_loaders.base import BaseLoader
 from langchain_core.documents import Document
 
-from utils import DocumentType, _nfkc
+from utils import DocumentType, _nfkc_cached
+
+logger = logging.getLogger(__name__)
 
 # ─────────────────────────────────────────────────────────────
 # 依賴檢查
@@ -23,6 +27,27 @@ try:
 except ImportError:
     _HAS_PANDAS = False
 
+try:
+    import pyarrow  # noqa: F401
+    _STRING_DTYPE = 'string[pyarrow]'
+except ImportError:
+    _STRING_DTYPE = 'string'
+
+try:
+    from charset_normalizer import from_bytes as _charset_from_bytes
+    _HAS_CHARSET_NORMALIZER = True
+except ImportError:
+    _HAS_CHARSET_NORMALIZER = False
+
+# 編碼偵測只需檢查檔頭前綴
+_ENCODING_PROBE_SIZE = 4096
+
+_BOM_ENCODINGS = (
+    (b'\xef\xbb\xbf', 'utf-8-sig'),
+    (b'\xff\xfe', 'utf-16'),
+    (b'\xfe\xff', 'utf-16'),
+)
+
 # ─────────────────────────────────────────────────────────────
 # CSV 業務資料處理器
 # ─────────────────────────────────────────────────────────────
@@ -30,6 +55,30 @@ except ImportError:
 class CSVBusinessProcessor:
     """從 CSV 檔案載入業務資料"""
     
+    # 內容欄位：英文欄名 → 中文標籤
+    CONTENT_FIELDS = {
+        'Date': '日期',
+        'Worker': '業務人員',
+        'Customer': '客戶',
+        'Class': '活動類型',
+        'Content': '活動內容',
+        'Depart': '部門',
+        'Manager': '主管',
+    }
+    
+    # 進度輸出間隔（筆）
+    PROGRESS_INTERVAL = 100_000
+    
+    # metadata 鍵 → CSV 欄名
+    METADATA_COLUMNS = {
+        'date': 'Date',
+        'worker': 'Worker',
+        'customer': 'Customer',
+        'class': 'Class',
+        'depart': 'Depart',
+        'manager': 'Manager',
+    }
+    
     @staticmethod
     def load_business_csv(csv_file: str) -> List[Document]:
         """載入 CSV 業務資料為 Document 列表"""
@@ -45,8 +94,9 @@ class CSVBusinessProcessor:
             # 🔧 改進：過濾空行和無效資料
             original_len = len(df)
             df = df.dropna(how='all')  # 移除全空行
-            df = df[df['Date'].notna()]  # 確保有日期
-            df = df[df['Date'].astype(str).str.strip() != '']  # 日期不為空字串
+            # 日期非空且不為空白字串（單一 mask，字串運算走 Arrow 後端）
+            dates = df['Date'].astype(_STRING_DTYPE)
+            df = df[dates.str.strip().fillna('').ne('')]
             
             if original_len != len(df):
                 print(f"   🧹 過濾無效資料：{original_len:,} → {len(df):,} 筆")
@@ -59,31 +109,30 @@ class CSVBusinessProcessor:
                 return []
             
             df = df.dropna(subset=required_columns)
-            documents = []
             
-            for idx, row in df.iterrows():
-                content = CSVBusinessProcessor._build_content_from_row(row, idx + 1)
-                
-                if not content.strip():
-                    continue
-                
+            # 以欄為單位建構內容與 metadata，最後才組成 Document
+            record_ids = (df.index + 1).tolist()
+            contents = CSVBusinessProcessor._build_contents(df)
+            columns = {
+                key: CSVBusinessProcessor._str_column(df, col)
+                for key, col in CSVBusinessProcessor.METADATA_COLUMNS.items()
+            }
+            
+            documents = []
+            total = len(df)
+            for i, (record_id, content) in enumerate(zip(record_ids, contents)):
                 metadata = {
                     'doc_type': DocumentType.BUSINESS.value,
                     'source': 'business_csv',
-                    'record_id': idx + 1,
-                    'date': str(row.get('Date', '')),
-                    'worker': str(row.get('Worker', '')),
-                    'customer': str(row.get('Customer', '')),
-                    'class': str(row.get('Class', '')),
-                    'depart': str(row.get('Depart', '')),
-                    'manager': str(row.get('Manager', '')),
+                    'record_id': record_id,
                 }
+                for key, values in columns.items():
+                    metadata[key] = values[i]
                 
-                doc = Document(page_content=content, metadata=metadata)
-                documents.append(doc)
+                documents.append(Document(page_content=content, metadata=metadata))
                 
-                if (idx + 1) % 10000 == 0:
-                    print(f"   📊 已處理 {idx + 1:,} / {len(df):,} 筆記錄...")
+                if (i + 1) % CSVBusinessProcessor.PROGRESS_INTERVAL == 0:
+                    print(f"   📊 已處理 {i + 1:,} / {total:,} 筆記錄...")
             
             return documents
             
@@ -92,26 +141,26 @@ class CSVBusinessProcessor:
             return []
     
     @staticmethod
-    def _build_content_from_row(row, record_num: int) -> str:
-        """從 DataFrame 行建構文檔內容"""
-        parts = [f"**記錄編號**: {record_num}"]
-        
-        field_map = {
-            'Date': '日期',
-            'Worker': '業務人員',
-            'Customer': '客戶',
-            'Class': '活動類型',
-            'Content': '活動內容',
-            'Depart': '部門',
-            'Manager': '主管',
-        }
+    def _str_column(df, column: str) -> List[str]:
+        """取得欄位的字串列表（欄位不存在時為空字串）"""
+        if column not in df.columns:
+            return [''] * len(df)
+        return df[column].astype(str).tolist()
+    
+    @staticmethod
+    def _build_contents(df) -> List[str]:
+        """以向量化字串運算一次建構所有記錄的文檔內容"""
+        contents = '**記錄編號**: ' + pd.Series(df.index + 1, index=df.index).astype(str)
         
-        for en_name, zh_name in field_map.items():
-            val = row.get(en_name, '')
-            if pd.notna(val) and str(val).strip():
-                parts.append(f"**{zh_name}**: {str(val).strip()}")
+        for en_name, zh_name in CSVBusinessProcessor.CONTENT_FIELDS.items():
+            if en_name not in df.columns:
+                continue
+            col = df[en_name]
+            stripped = col.astype(str).str.strip()
+            keep = col.notna() & stripped.ne('')
+            contents = contents + (f"\n**{zh_name}**: " + stripped).where(keep, '')
         
-        return "\n".join(parts)
+        return contents.tolist()
 
 # ─────────────────────────────────────────────────────────────
 # 業務報告處理器
@@ -132,20 +181,30 @@ class BusinessReportProcessor:
         'Class:': '活動類型',
     }
     
+    # 預先編譯各欄位 pattern 與對應的 record 鍵名（Doc_Time → date）
+    _FIELD_PATTERNS = [
+        (
+            re.compile(rf'{re.escape(en_key)}\s*(.+?)(?=\n[A-Za-z_]+:|$)', re.DOTALL),
+            'date' if en_key == 'Doc_Time:' else en_key[:-1].lower(),
+        )
+        for en_key in FIELD_MAPPING
+    ]
+    _WHITESPACE_RE = re.compile(r'\s+')
+    _DOC_TIME_RE = re.compile(r'Doc_Time:')
+    
     @staticmethod
     def parse_report(text: str) -> List[Dict]:
         """解析業務日報文本"""
         records = []
         
-        # 嘗試用 Doc_Time: 分割
-        if 'Doc_Time:' in text:
-            parts = re.split(r'(?=Doc_Time:)', text)
-            parts = [p.strip() for p in parts if p.strip() and 'Doc_Time:' in p]
-            
-            for part in parts:
-                record = BusinessReportProcessor._parse_single_record(part)
-                if record and record.get('customer'):
-                    records.append(record)
+        # 以 Doc_Time: 的位置切出每筆記錄（欄位值解析時會 strip，不需另外清理）
+        positions = [m.start() for m in BusinessReportProcessor._DOC_TIME_RE.finditer(text)]
+        positions.append(len(text))
+        
+        for start, end in zip(positions, positions[1:]):
+            record = BusinessReportProcessor._parse_single_record(text[start:end])
+            if record and record.get('customer'):
+                records.append(record)
         
         return records
     
@@ -154,22 +213,11 @@ class BusinessReportProcessor:
         """解析單筆業務記錄"""
         record = {}
         
-        for en_key, zh_key in BusinessReportProcessor.FIELD_MAPPING.items():
-            pattern = rf'{re.escape(en_key)}\s*(.+?)(?=\n[A-Za-z_]+:|$)'
-            match = re.search(pattern, text, re.DOTALL)
+        for pattern, field_name in BusinessReportProcessor._FIELD_PATTERNS:
+            match = pattern.search(text)
             if match:
                 value = match.group(1).strip()
-                value = re.sub(r'\s+', ' ', value)
-                
-                field_name = en_key.replace(':', '').lower()
-                if field_name == 'doc_time':
-                    field_name = 'date'
-                elif field_name == 'worker':
-                    field_name = 'worker'
-                elif field_name == 'customer':
-                    field_name = 'customer'
-                
-                record[field_name] = value
+                record[field_name] = BusinessReportProcessor._WHITESPACE_RE.sub(' ', value)
         
         return record
 
@@ -180,15 +228,30 @@ class BusinessReportProcessor:
 class SimpleImageProcessor:
     """處理 Markdown 中的圖片引用"""
     
+    # 匹配 Markdown 圖片語法
+    _IMAGE_RE = re.compile(r'!\[([^\]]*)\]\(([^)]+)\)')
+    
     def __init__(self, media_base_dir: str):
         self.media_base_dir = media_base_dir
     
     def process_images(self, text: str, source_file: str) -> tuple:
         """處理圖片引用，返回 (處理後文本, 圖片列表)"""
         images = []
-        
-        # 匹配 Markdown 圖片語法
-        pattern = r'!\[([^\]]*)\]\(([^)]+)\)'
+        source_dir = os.path.dirname(source_file)
+        
+        # 目錄內容快取：每個目錄只 listdir 一次，取代逐張 os.path.exists
+        dir_entries: Dict[str, set] = {}
+        
+        def exists(full_path: str) -> bool:
+            parent, name = os.path.split(full_path)
+            entries = dir_entries.get(parent)
+            if entries is None:
+                try:
+                    entries = set(os.listdir(parent or '.'))
+                except OSError:
+                    entries = set()
+                dir_entries[parent] = entries
+            return name in entries
         
         def replace_image(match):
             alt_text = match.group(1)
@@ -196,10 +259,9 @@ class SimpleImageProcessor:
             
             # 處理相對路徑
             if not img_path.startswith(('http://', 'https://', '/')):
-                source_dir = os.path.dirname(source_file)
                 full_path = os.path.normpath(os.path.join(source_dir, img_path))
                 
-                if os.path.exists(full_path):
+                if exists(full_path):
                     images.append({
                         'path': full_path,
                         'alt': alt_text,
@@ -208,7 +270,7 @@ class SimpleImageProcessor:
             
             return f"[圖片: {alt_text or '無描述'}]"
         
-        processed_text = re.sub(pattern, replace_image, text)
+        processed_text = self._IMAGE_RE.sub(replace_image, text)
         return processed_text, images
 
 # ─────────────────────────────────────────────────────────────
@@ -221,32 +283,71 @@ class EnhancedMarkdownLoader(BaseLoader):
     # 完整的產品型號模式
     PRODUCT_PATTERNS = [
         # SMC 產品
-        r'(?:^|\s)(MXJ\d+[A-Z]*)',              # MXJ 系列
-        r'(?:^|\s)(MXH\d+[A-Z]*)',              # MXH 系列
-        r'(?:^|\s)(MXP\d+[A-Z]*)',              # MXP 系列
-        r'(?:^|\s)(LES[A-Z]*\d+)',              # LES 系列
-        r'(?:^|\s)(LEHZ[A-Z]*\d*)',             # LEHZ 系列
-        r'(?:^|\s)(LEHF\d+[A-Z]*)',             # LEHF 系列
-        r'(?:^|\s)(ACG[A-Z]*\d*)',              # ACG 系列
-        r'(?:^|\s)(ARG[A-Z]*\d*)',              # ARG 系列
-        r'(?:^|\s)(AWG[A-Z]*\d*)',              # AWG 系列
+        r'\b(MXJ\d+[A-Z]*)',                    # MXJ 系列
+        r'\b(MXH\d+[A-Z]*)',                    # MXH 系列
+        r'\b(MXP\d+[A-Z]*)',                    # MXP 系列
+        r'\b(LES[A-Z]*\d+)',                    # LES 系列
+        r'\b(LEHZ[A-Z]*\d*)',                   # LEHZ 系列
+        r'\b(LEHF\d+[A-Z]*)',                   # LEHF 系列
+        r'\b(ACG[A-Z]*\d*)',                    # ACG 系列
+        r'\b(ARG[A-Z]*\d*)',                    # ARG 系列
+        r'\b(AWG[A-Z]*\d*)',                    # AWG 系列
         # VALQUA 產品
         r'(?:バルカー\s*)?No\.\s*(\d{4}[A-Z]*)',  # No.6500, No.7010
         r'(?:バルカー\s*)?No\.\s*([A-Z]+\d+)',    # No.GF300, No.SF300
         r'(?:バルカー\s*)?No\.\s*(N\d{4})',       # No.N7030
         # 玖基/協鋼產品
-        r'(?:^|\s)(GF\d+[A-Z]*)',               # GF300
-        r'(?:^|\s)(GFO[-\s]?\d*)',              # GFO
-        r'(?:^|\s)(Gf[il]\d*[A-Z]*)',           # Gfil
-        r'(?:^|\s)(Uf[il]\d*[A-Z]*)',           # Ufil
+        r'\b(GF\d+[A-Z]*)',                     # GF300
+        r'\b(GFO[-\s]?\d*)',                    # GFO
+        r'\b(Gf[il]\d*[A-Z]*)',                 # Gfil
+        r'\b(Uf[il]\d*[A-Z]*)',                 # Ufil
         # 通用型號
         r'(?:型號|製品番号)[:\s]*([A-Z0-9]+-?[A-Z0-9]+)',
     ]
     
+    # 每份文件最多保留的產品代碼數
+    MAX_PRODUCT_CODES = 20
+    
+    # 產品代碼掃描範圍上限（字元數）；型號多集中在標題 / 目錄 / 前幾頁
+    MAX_SCAN_CHARS = 256 * 1024
+    
+    # 所有產品型號合併為單一 pattern（每個子 pattern 只有一個捕獲群組）
+    _PRODUCT_RE = re.compile(
+        '|'.join(f'(?:{p})' for p in PRODUCT_PATTERNS), re.IGNORECASE
+    )
+    
+    # 品牌 / 文檔類別 / 圖片訊號，一次 finditer 掃描收集
+    _SIGNAL_RE = re.compile(
+        r'(?P<brand_smc>smc|速睦喜)'
+        r'|(?P<brand_valqua>valqua|バルカー|華爾卡)'
+        r'|(?P<brand_jiuji>玖基)'
+        r'|(?P<brand_xiegang>協鋼)'
+        r'|(?P<cat_spec>規格|仕様|specification)'
+        r'|(?P<cat_install>取付|安裝|install)'
+        r'|(?P<cat_dimension>寸法|尺寸|dimension)'
+        r'|(?P<cat_catalog>カタログ|型錄|catalog)'
+        r'|(?P<image>!\[(?=[^\]]*\]\([^)]+\)))',
+        re.IGNORECASE,
+    )
+    
+    # 內容清洗 / 表格處理
+    _IMG_TAG_RE = re.compile(r'<img[^>]*src="([^"]*)"[^>]*/>')
+    _EMPTY_QUOTE_RE = re.compile(r'>\s*\n')
+    _BLANK_LINES_RE = re.compile(r'\n{3,}')
+    _PAGE_NUMBER_RE = re.compile(r'^\s*\d+\s*$', re.MULTILINE)
+    _TABLE_TAG_RE = re.compile(r'</?t(able|r|[hd]|body)[^>]*>')
+    _TABLE_TAG_REPL = {'able': '', 'r': '\n', 'h': ' | ', 'd': ' | ', 'body': ''}
+    
+    # 業務日報欄位標記（合併為單一 pattern，一次掃描全文）
+    _BUSINESS_INDICATOR_RE = re.compile(
+        r'Doc_Time:|TimeCreated:|Customer:|Worker:|Content:|Manager:|Depart:|Doc_St:'
+    )
+    
     def __init__(self, file_path: str, **kwargs):
         self.file_path = file_path
         self.autodetect_encoding = kwargs.get('autodetect_encoding', True)
         self.media_base_dir = kwargs.get('media_base_dir', '')
+        self.max_scan_chars = kwargs.get('max_scan_chars', self.MAX_SCAN_CHARS)
     
     def load(self) -> List[Document]:
         """載入並處理 Markdown 文件"""
@@ -262,44 +363,100 @@ class EnhancedMarkdownLoader(BaseLoader):
         return self._process_as_technical(text)
     
     def _read_file(self) -> str:
-        """讀取檔案內容"""
+        """
+        讀取檔案內容（mmap 映射，先以檔頭判斷編碼再解碼全文）
+        
+        無法映射的檔案（如部分網路 / 虛擬檔案系統）改為一般讀取；
+        開檔 / 讀取失敗記錄警告後回傳空字串，解碼過程的錯誤不攔截。
+        """
+        try:
+            with open(self.file_path, "rb") as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return ""
+                try:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (ValueError, OSError):
+                    raw_data = f.read()
+                else:
+                    with mm:
+                        if hasattr(mm, 'madvise'):
+                            mm.madvise(mmap.MADV_SEQUENTIAL)
+                        return self._decode(mm)
+        except OSError as e:
+            logger.warning(f"讀取檔案失敗 {self.file_path}: {e}")
+            return ""
+        
+        return self._decode(raw_data)
+    
+    def _decode(self, raw_data) -> str:
+        """解碼原始內容（bytes 或 mmap）並正規化"""
         text = None
         encodings_to_try = ['utf-8', 'utf-8-sig', 'big5', 'gb18030', 'shift_jis']
+        prefix = raw_data[:_ENCODING_PROBE_SIZE]
         
-        if self.autodetect_encoding:
-            try:
-                import chardet
-                with open(self.file_path, "rb") as f:
-                    raw_data = f.read()
-                detected = chardet.detect(raw_data)
-                if detected and detected['encoding']:
-                    encodings_to_try.insert(0, detected['encoding'])
-            except Exception:
-                pass
+        # 快速路徑：BOM 或 UTF-8 前綴有效時不做統計式偵測
+        bom_encoding = self._bom_encoding(prefix)
+        if bom_encoding:
+            encodings_to_try.insert(0, bom_encoding)
+        elif self.autodetect_encoding and not self._is_utf8_prefix(prefix):
+            detected = self._detect_encoding(raw_data[:])
+            if detected:
+                encodings_to_try.insert(0, detected)
         
         for encoding in encodings_to_try:
             try:
-                with open(self.file_path, "r", encoding=encoding) as f:
-                    text = f.read()
+                text = str(raw_data, encoding)
                 break
-            except (UnicodeDecodeError, UnicodeError):
+            except (UnicodeDecodeError, UnicodeError, LookupError):
                 continue
         
         if text is None:
-            try:
-                with open(self.file_path, "r", encoding="utf-8", errors="ignore") as f:
-                    text = f.read()
-            except Exception:
-                return ""
+            text = str(raw_data, "utf-8", "ignore")
         
-        return _nfkc(text) if text else ""
+        # 與文字模式開檔一致：統一換行符號
+        if '\r' in text:
+            text = text.replace('\r\n', '\n').replace('\r', '\n')
+        
+        return _nfkc_cached(raw_data, text) if text else ""
+    
+    @staticmethod
+    def _bom_encoding(raw_data: bytes) -> Optional[str]:
+        """依 BOM 判斷編碼"""
+        for bom, encoding in _BOM_ENCODINGS:
+            if raw_data.startswith(bom):
+                return encoding
+        return None
+    
+    @staticmethod
+    def _is_utf8_prefix(prefix: bytes) -> bool:
+        """檢查前綴是否為有效 UTF-8（容許結尾截斷在多位元組字元中間）"""
+        try:
+            prefix.decode('utf-8')
+            return True
+        except UnicodeDecodeError as e:
+            return e.reason == 'unexpected end of data' and e.start >= len(prefix) - 3
+    
+    @staticmethod
+    def _detect_encoding(raw_data: bytes) -> Optional[str]:
+        """統計式編碼偵測（優先 charset-normalizer，否則 chardet）"""
+        try:
+            if _HAS_CHARSET_NORMALIZER:
+                best = _charset_from_bytes(raw_data).best()
+                return best.encoding if best else None
+            import chardet
+            detected = chardet.detect(raw_data)
+            return detected['encoding'] if detected else None
+        except Exception:
+            return None
     
     def _is_business_report(self, text: str) -> bool:
-        """檢查是否為業務日報格式"""
-        indicators = ['Doc_Time:', 'TimeCreated:', 'Customer:', 'Worker:', 
-                      'Content:', 'Manager:', 'Depart:', 'Doc_St:']
-        count = sum(1 for ind in indicators if ind in text)
-        return count >= 3
+        """檢查是否為業務日報格式（單次掃描，命中 3 種欄位即返回）"""
+        seen = set()
+        for m in self._BUSINESS_INDICATOR_RE.finditer(text):
+            seen.add(m.group(0))
+            if len(seen) >= 3:
+                return True
+        return False
     
     def _process_as_business(self, text: str) -> List[Document]:
         """處理業務報告"""
@@ -346,14 +503,14 @@ class EnhancedMarkdownLoader(BaseLoader):
         # 提取產品代碼
         product_codes = self._extract_product_codes(text)
         
+        # 單次掃描收集品牌 / 類別 / 圖片訊號
+        signals, images_count = self._scan_signals(text)
+        
         # 識別主要品牌
-        brand = self._identify_brand(text, product_codes)
+        brand = self._identify_brand(product_codes, signals)
         
         # 識別文檔類型
-        doc_category = self._identify_doc_category(text)
-        
-        # 處理圖片
-        images_count = len(re.findall(r'!\[([^\]]*)\]\(([^)]+)\)', text))
+        doc_category = self._identify_doc_category(signals)
         
         # 清洗內容
         cleaned_text = self._clean_technical_content(text)
@@ -374,10 +531,20 @@ class EnhancedMarkdownLoader(BaseLoader):
         
         return [Document(page_content=cleaned_text, metadata=metadata)]
     
-    def _identify_brand(self, text: str, product_codes: List[str]) -> str:
+    def _scan_signals(self, text: str) -> tuple:
+        """單次掃描全文，返回 (命中的訊號群組集合, 圖片數)"""
+        signals = set()
+        images_count = 0
+        for m in self._SIGNAL_RE.finditer(text):
+            group = m.lastgroup
+            if group == 'image':
+                images_count += 1
+            else:
+                signals.add(group)
+        return signals, images_count
+    
+    def _identify_brand(self, product_codes: List[str], signals: set) -> str:
         """識別主要品牌"""
-        text_lower = text.lower()
-        
         # 優先根據產品代碼判斷
         for code in product_codes:
             code_upper = code.upper()
@@ -391,63 +558,59 @@ class EnhancedMarkdownLoader(BaseLoader):
                 return '協鋼'
         
         # 根據內容判斷
-        if 'smc' in text_lower or '速睦喜' in text:
+        if 'brand_smc' in signals:
             return 'SMC'
-        if 'valqua' in text_lower or 'バルカー' in text or '華爾卡' in text:
+        if 'brand_valqua' in signals:
             return 'VALQUA'
-        if '玖基' in text:
+        if 'brand_jiuji' in signals:
             return '玖基'
-        if '協鋼' in text:
+        if 'brand_xiegang' in signals:
             return '協鋼'
         
         return 'Unknown'
     
-    def _identify_doc_category(self, text: str) -> str:
+    def _identify_doc_category(self, signals: set) -> str:
         """識別文檔類別"""
-        if '規格' in text or '仕様' in text or 'specification' in text.lower():
+        if 'cat_spec' in signals:
             return 'specification'
-        if '取付' in text or '安裝' in text or 'install' in text.lower():
+        if 'cat_install' in signals:
             return 'installation'
-        if '寸法' in text or '尺寸' in text or 'dimension' in text.lower():
+        if 'cat_dimension' in signals:
             return 'dimension'
-        if 'カタログ' in text or '型錄' in text or 'catalog' in text.lower():
+        if 'cat_catalog' in signals:
             return 'catalog'
         return 'general'
     
     def _clean_technical_content(self, text: str) -> str:
         """清洗技術文檔內容"""
         # 移除圖片 HTML 標籤但保留描述
-        text = re.sub(r'<img[^>]*src="([^"]*)"[^>]*/>', r'[圖: \1]', text)
+        text = self._IMG_TAG_RE.sub(r'[圖: \1]', text)
         
         # 移除空的 blockquote
-        text = re.sub(r'>\s*\n', '\n', text)
+        text = self._EMPTY_QUOTE_RE.sub('\n', text)
         
         # 移除過多空行
-        text = re.sub(r'\n{3,}', '\n\n', text)
+        text = self._BLANK_LINES_RE.sub('\n\n', text)
         
         # 移除頁碼
-        text = re.sub(r'^\s*\d+\s*$', '', text, flags=re.MULTILINE)
+        text = self._PAGE_NUMBER_RE.sub('', text)
         
         return text.strip()
     
     def _extract_product_codes(self, text: str) -> List[str]:
-        """提取產品代碼"""
-        codes = set()
-        for pattern in self.PRODUCT_PATTERNS:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            for m in matches:
-                if isinstance(m, tuple):
-                    codes.update(c for c in m if c)
-                else:
-                    codes.add(m)
-        return list(codes)[:20]
+        """提取產品代碼（依首次出現順序去重，取前 MAX_PRODUCT_CODES 個）"""
+        scan_text = text if len(text) <= self.max_scan_chars else text[:self.max_scan_chars]
+        
+        codes = {}
+        for m in self._PRODUCT_RE.finditer(scan_text):
+            codes[m.group(m.lastindex)] = None
+            if len(codes) >= self.MAX_PRODUCT_CODES:
+                break
+        return list(codes)
     
     def _process_tables(self, text: str) -> str:
         """處理 HTML 表格轉為 Markdown"""
-        # 簡化處理：移除 HTML 標籤
-        text = re.sub(r'</?table[^>]*>', '', text)
-        text = re.sub(r'</?tr[^>]*>', '\n', text)
-        text = re.sub(r'</?t[hd][^>]*>', ' | ', text)
-        text = re.sub(r'</?tbody[^>]*>', '', text)
-        text = re.sub(r'</?thead[^>]*>', '', text)
-        return text
+        # 簡化處理：table/tbody 移除、tr 換行、th/td 轉為分隔符（thead 沿用原本視為 th）
+        return self._TABLE_TAG_RE.sub(
+            lambda m: self._TABLE_TAG_REPL[m.group(1)], text
+        )
@@ -2,44 +2,46 @@
 # 與 Sanshin System 共用 public.users 表
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text, Boolean
-from sqlalchemy.orm import declarative_base, relationship
+from typing import Optional
+from sqlalchemy import Integer, String, DateTime, ForeignKey, Text, Boolean
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
-Base = declarative_base()
+class Base(DeclarativeBase):
+    pass
 
 class User(Base):
     """用戶表 - 與 Sanshin System 共用"""
     __tablename__ = "users"
     __table_args__ = {'schema': 'public'}
     
-    id = Column(Integer, primary_key=True, index=True)
-    account = Column(String, unique=True, index=True)
-    password = Column(String)
-    name = Column(String)
-    display_name = Column(String)
-    department = Column(String)
-    role = Column(String, default='user')
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    account: Mapped[Optional[str]] = mapped_column(String, unique=True, index=True)
+    password: Mapped[Optional[str]] = mapped_column(String)
+    name: Mapped[Optional[str]] = mapped_column(String)
+    display_name: Mapped[Optional[str]] = mapped_column(String)
+    department: Mapped[Optional[str]] = mapped_column(String)
+    role: Mapped[Optional[str]] = mapped_column(String, default='user')
     
     # 擴充欄位
-    position_id = Column(Integer)
-    department_id = Column(Integer)
-    manager_id = Column(Integer)
-    emp_no = Column(String)
-    permissions = Column(String, default='business_report')
-    is_active = Column(Boolean, default=True)
+    position_id: Mapped[Optional[int]] = mapped_column(Integer)
+    department_id: Mapped[Optional[int]] = mapped_column(Integer)
+    manager_id: Mapped[Optional[int]] = mapped_column(Integer)
+    emp_no: Mapped[Optional[str]] = mapped_column(String)
+    permissions: Mapped[Optional[str]] = mapped_column(String, default='business_report')
+    is_active: Mapped[Optional[bool]] = mapped_column(Boolean, default=True)
 
 class ChatLog(Base):
     """AI 對話紀錄"""
     __tablename__ = "chat_logs"
     __table_args__ = {'schema': 'public'}
     
-    id = Column(Integer, primary_key=True, index=True)
-    chat_id = Column(String, index=True)
-    title = Column(String, nullable=True)
-    user_id = Column(Integer, ForeignKey("public.users.id"))
-    question = Column(Text)
-    answer = Column(Text)
-    source_type = Column(String, nullable=True)  # 來源類型: tech/business/personal
-    created_at = Column(DateTime, default=datetime.utcnow)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
+    chat_id: Mapped[Optional[str]] = mapped_column(String, index=True)
+    title: Mapped[Optional[str]] = mapped_column(String, nullable=True)
+    user_id: Mapped[Optional[int]] = mapped_column(Integer, ForeignKey("public.users.id"))
+    question: Mapped[Optional[str]] = mapped_column(Text)
+    answer: Mapped[Optional[str]] = mapped_column(Text)
+    source_type: Mapped[Optional[str]] = mapped_column(String, nullable=True)  # 來源類型: tech/business/personal
+    created_at: Mapped[Optional[datetime]] = mapped_column(DateTime, default=datetime.utcnow)
     
-    user = relationship("User")
+    user: Mapped[Optional["User"]] = relationship("User")
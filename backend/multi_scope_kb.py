@@ -16,12 +16,28 @@ multi_scope_kb.py - 多層級知識庫系統
 
 import os
 import json
+import heapq
 import hashlib
+import logging
+import tempfile
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple, Any
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from enum import Enum
 from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+import _kb_fastpaths
+from batch_stat import batch_stat
+
+logger = logging.getLogger(__name__)
+
+# 筆記 ID 雜湊：優先使用 BLAKE3（SIMD），否則 sha256（OpenSSL 可用 SHA 指令集）
+try:
+    from blake3 import blake3 as _id_hasher
+except ImportError:
+    _id_hasher = hashlib.sha256
 
 # ─────────────────────────────────────────────────────────────
 # 設定
@@ -57,6 +73,9 @@ PERSONAL_DIR = os.path.join(KNOWLEDGE_BASE_ROOT, "personal")       # 個人庫
 # 向量庫目錄
 VECTORDB_ROOT = os.path.join(KNOWLEDGE_BASE_ROOT, "vectordb")
 
+# 個人筆記持久化索引（位於各用戶目錄，點開頭不列入檔案列表 / 統計）
+NOTES_INDEX_FILENAME = ".notes_index.json"
+
 # 部門對照表
 DEPARTMENT_MAPPING = {
     "湖內事業部": "hukou",
@@ -89,7 +108,7 @@ class DocumentCategory(Enum):
     NOTE = "note"              # 個人筆記
     OTHER = "other"            # 其他
 
-@dataclass
+@dataclass(slots=True)
 class KnowledgeDocument:
     """知識文件"""
     id: str
@@ -104,36 +123,65 @@ class KnowledgeDocument:
     created_at: datetime = field(default_factory=datetime.now)
     updated_at: datetime = field(default_factory=datetime.now)
 
-@dataclass
+@dataclass(slots=True)
 class SearchResult:
     """搜尋結果"""
     document: KnowledgeDocument
     score: float
     source: str  # 來源標識
 
-@dataclass
+@dataclass(slots=True)
 class UserContext:
     """用戶上下文"""
     account: str
     name: str
     department: str
     role: str
+    # 部門代碼於建立時查一次，存於 slot（slots 類別無 __dict__，不能用 cached_property）
+    _dept_code: str = field(init=False, repr=False, compare=False)
+    
+    def __post_init__(self):
+        self._dept_code = DEPARTMENT_MAPPING.get(self.department, "general")
     
     @property
     def dept_code(self) -> str:
         """取得部門代碼"""
-        return DEPARTMENT_MAPPING.get(self.department, "general")
+        return self._dept_code
 
 # ─────────────────────────────────────────────────────────────
 # 知識庫管理器
 # ─────────────────────────────────────────────────────────────
 
+# 公用 / 部門 / 個人三棵目錄樹彼此獨立，列表與統計時並行走訪。
+# 執行緒池由所有請求共用，大小依同時請求數設定；每個請求的最後一個範圍在呼叫端
+# 執行緒直接走訪，池滿時請求仍會持續推進，不會整個排在其他請求之後
+LIST_WORKERS = int(os.getenv("KB_LIST_WORKERS", "16"))
+_LIST_POOL = ThreadPoolExecutor(max_workers=LIST_WORKERS, thread_name_prefix="kb-list")
+
+
+def _run_scoped(calls: List[Tuple[Callable, tuple]]) -> List[Any]:
+    """執行多個獨立的目錄走訪：最後一個在呼叫端執行緒執行，其餘送到共用執行緒池"""
+    if not calls:
+        return []
+    futures = [_LIST_POOL.submit(fn, *args) for fn, args in calls[:-1]]
+    fn, args = calls[-1]
+    last = fn(*args)
+    return [future.result() for future in futures] + [last]
+
 class MultiScopeKnowledgeBase:
     """多層級知識庫管理器"""
     
+    # frontmatter 逐塊讀取的區塊大小
+    FRONTMATTER_BLOCK_SIZE = 4096
+    
     def __init__(self):
+        # 已確認存在的目錄，避免每次請求重複 makedirs
+        self._ensured_dirs: set = set()
         self._ensure_directories()
-        self._index_cache = {}
+        # 個人筆記索引：{account: {note_id: filename}}
+        self._index_cache: Dict[str, Dict[str, str]] = {}
+        # frontmatter 快取：{filepath: (mtime_ns, meta)}
+        self._meta_cache: Dict[str, Tuple[int, Dict[str, Any]]] = {}
     
     def _ensure_directories(self):
         """確保目錄結構存在"""
@@ -147,7 +195,13 @@ class MultiScopeKnowledgeBase:
             VECTORDB_ROOT,
         ]
         for d in dirs:
-            os.makedirs(d, exist_ok=True)
+            self._ensure(d)
+    
+    def _ensure(self, path: str):
+        """確保目錄存在（同一路徑只呼叫一次 makedirs）"""
+        if path not in self._ensured_dirs:
+            os.makedirs(path, exist_ok=True)
+            self._ensured_dirs.add(path)
     
     def _get_user_dirs(self, user: UserContext) -> Dict[str, str]:
         """取得用戶可存取的目錄"""
@@ -162,7 +216,7 @@ class MultiScopeKnowledgeBase:
         
         # 個人目錄
         personal_dir = os.path.join(PERSONAL_DIR, user.account)
-        os.makedirs(personal_dir, exist_ok=True)
+        self._ensure(personal_dir)
         dirs["personal"] = personal_dir
         
         return dirs
@@ -181,16 +235,18 @@ class MultiScopeKnowledgeBase:
     ) -> Dict[str, Any]:
         """新增個人筆記"""
         personal_dir = os.path.join(PERSONAL_DIR, user.account)
-        os.makedirs(personal_dir, exist_ok=True)
+        self._ensure(personal_dir)
         
-        # 產生檔案名稱
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        # 產生檔案名稱（含微秒，批次匯入時同一秒內也不會重名）
+        now = datetime.now()
+        now_iso = now.isoformat()
+        timestamp = now.strftime("%Y%m%d_%H%M%S_%f")
         safe_title = "".join(c for c in title if c.isalnum() or c in "._- ")[:50]
-        filename = f"{timestamp}_{safe_title}.md"
+        filename = f"{timestamp}__{self._safe_category(category)}__{safe_title}.md"
         filepath = os.path.join(personal_dir, filename)
         
         # 產生 ID
-        note_id = hashlib.md5(f"{user.account}:{timestamp}:{title}".encode()).hexdigest()[:12]
+        note_id = _id_hasher(f"{user.account}:{timestamp}:{title}".encode()).hexdigest()[:12]
         
         # 建立 metadata
         metadata = {
@@ -198,21 +254,27 @@ class MultiScopeKnowledgeBase:
             "title": title,
             "category": category,
             "tags": tags or [],
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat(),
+            "created_at": now_iso,
+            "updated_at": now_iso,
         }
         
         # 寫入 Markdown 檔案
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(f"---\n")
-            f.write(f"id: {note_id}\n")
-            f.write(f"title: {title}\n")
-            f.write(f"category: {category}\n")
-            f.write(f"tags: {', '.join(tags or [])}\n")
-            f.write(f"created: {metadata['created_at']}\n")
-            f.write(f"---\n\n")
-            f.write(f"# {title}\n\n")
-            f.write(content)
+        self._write_note_file(filepath, "".join((
+            "---\n",
+            f"id: {note_id}\n",
+            f"title: {title}\n",
+            f"category: {category}\n",
+            f"tags: {', '.join(tags or [])}\n",
+            f"created: {metadata['created_at']}\n",
+            "---\n\n",
+            f"# {title}\n\n",
+            content,
+        )))
+        
+        self._refresh_note_entry(personal_dir, filename)
+        index = self._index_cache.get(user.account)
+        if index is not None:
+            index[note_id] = filename
         
         return {
             "success": True,
@@ -228,73 +290,202 @@ class MultiScopeKnowledgeBase:
         category: str = None,
         limit: int = 50
     ) -> List[Dict[str, Any]]:
-        """取得個人筆記列表"""
+        """取得個人筆記列表（讀取持久化索引，不開啟筆記檔）"""
         personal_dir = os.path.join(PERSONAL_DIR, user.account)
         
         if not os.path.exists(personal_dir):
             return []
         
-        notes = []
-        for filename in os.listdir(personal_dir):
-            if not filename.endswith(".md"):
-                continue
-            
-            filepath = os.path.join(personal_dir, filename)
-            stat = os.stat(filepath)
-            
-            # 讀取 metadata
-            meta = self._parse_note_metadata(filepath)
-            
-            if category and meta.get("category") != category:
-                continue
-            
-            notes.append({
-                "id": meta.get("id", filename),
-                "filename": filename,
-                "title": meta.get("title", filename),
-                "category": meta.get("category", "note"),
-                "tags": meta.get("tags", []),
-                "size": stat.st_size,
-                "created_at": meta.get("created", datetime.fromtimestamp(stat.st_ctime).isoformat()),
-                "updated_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-            })
-        
-        # 依更新時間排序
-        notes.sort(key=lambda x: x["updated_at"], reverse=True)
-        return notes[:limit]
+        # 依更新時間取前 limit 筆（O(N log limit)）
+        return _kb_fastpaths.select_latest_notes(
+            self._load_notes_index(personal_dir).values(), category, limit
+        )
     
     def get_personal_note(self, user: UserContext, note_id: str) -> Optional[Dict[str, Any]]:
         """取得單一筆記內容"""
-        personal_dir = os.path.join(PERSONAL_DIR, user.account)
-        
-        if not os.path.exists(personal_dir):
+        filename = self._find_note_file(user, note_id)
+        if not filename:
             return None
         
-        for filename in os.listdir(personal_dir):
-            if not filename.endswith(".md"):
+        filepath = os.path.join(PERSONAL_DIR, user.account, filename)
+        # 只讀一次檔案，同時取得 frontmatter 與內文，並順便更新 metadata 快取
+        with open(filepath, "r", encoding="utf-8") as f:
+            mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+            raw = f.read()
+        
+        content = raw
+        meta = {}
+        if raw.startswith("---"):
+            end = raw.find("\n---", 3)
+            if end < 0:
+                meta = self._parse_meta_from_text(raw[3:])
+            else:
+                meta = self._parse_meta_from_text(raw[3:end])
+                # 移除 frontmatter
+                content = raw[end + 4:].strip()
+        self._meta_cache[filepath] = (mtime_ns, meta)
+        
+        return {
+            "id": meta.get("id", filename),
+            "filename": filename,
+            "title": meta.get("title", filename),
+            "content": content,
+            "category": meta.get("category", "note"),
+            "tags": meta.get("tags", []),
+        }
+    
+    def _get_note_index(self, user: UserContext) -> Dict[str, str]:
+        """取得用戶筆記索引 {note_id: filename}，首次使用時由持久化索引建立"""
+        index = self._index_cache.get(user.account)
+        if index is None:
+            index = {}
+            personal_dir = os.path.join(PERSONAL_DIR, user.account)
+            if os.path.exists(personal_dir):
+                for filename, entry in self._load_notes_index(personal_dir).items():
+                    index.setdefault(entry["id"], filename)
+            self._index_cache[user.account] = index
+        return index
+    
+    # ─────────────────────────────────────────────────────────
+    # 筆記持久化索引
+    # ─────────────────────────────────────────────────────────
+    
+    def _load_notes_index(self, personal_dir: str) -> Dict[str, Dict[str, Any]]:
+        """
+        載入筆記索引 {filename: entry}
+        
+        掃描目錄比對各檔 mtime_ns，只重新解析新增 / 變更的筆記並移除已刪除項目；
+        有變動時回寫索引檔（重啟後首次列表即為 lazy backfill）。
+        """
+        notes = self._read_notes_index(personal_dir)
+        
+        with os.scandir(personal_dir) as it:
+            entries = [
+                (entry.path, entry.name) for entry in it
+                if entry.name.endswith(".md") and entry.is_file(follow_symlinks=False)
+            ]
+        
+        current = {}
+        dirty = False
+        stats = batch_stat([path for path, _ in entries])
+        for (path, filename), stat in zip(entries, stats):
+            if stat is None:
                 continue
+            cached = notes.get(filename)
+            if cached is None or cached.get("mtime_ns") != stat.st_mtime_ns:
+                cached = self._build_note_entry(path, filename, stat)
+                dirty = True
+            current[filename] = cached
+        
+        if dirty or len(current) != len(notes):
+            self._write_notes_index(personal_dir, current)
+        return current
+    
+    def _refresh_note_entry(self, personal_dir: str, filename: str):
+        """筆記新增 / 更新 / 刪除後同步索引中的單一項目"""
+        notes = self._read_notes_index(personal_dir)
+        filepath = os.path.join(personal_dir, filename)
+        self._meta_cache.pop(filepath, None)
+        
+        try:
+            notes[filename] = self._build_note_entry(filepath, filename, os.stat(filepath))
+        except FileNotFoundError:
+            notes.pop(filename, None)
+        
+        self._write_notes_index(personal_dir, notes)
+    
+    def _build_note_entry(self, filepath: str, filename: str, stat: os.stat_result) -> Dict[str, Any]:
+        """由 frontmatter 與 stat 建立索引項目"""
+        meta = self._parse_note_metadata(filepath, stat.st_mtime_ns)
+        return {
+            "id": meta.get("id", filename),
+            "filename": filename,
+            "title": meta.get("title", filename),
+            # frontmatter 為準；缺少時才採用檔名中的分類提示
+            "category": meta.get("category") or _kb_fastpaths.note_category_hint(filename) or "note",
+            "tags": meta.get("tags", []),
+            "size": stat.st_size,
+            "created_at": meta.get("created", datetime.fromtimestamp(stat.st_ctime).isoformat()),
+            "updated_at": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+            "mtime_ns": stat.st_mtime_ns,
+        }
+    
+    def _read_notes_index(self, personal_dir: str) -> Dict[str, Dict[str, Any]]:
+        """讀取索引檔，不存在或損壞時回傳空索引"""
+        index_path = os.path.join(personal_dir, NOTES_INDEX_FILENAME)
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                notes = json.load(f).get("notes", {})
+            return notes if isinstance(notes, dict) else {}
+        except (OSError, ValueError, AttributeError):
+            return {}
+    
+    def _write_notes_index(self, personal_dir: str, notes: Dict[str, Dict[str, Any]]):
+        """
+        原子寫入索引檔（暫存檔 + os.replace）
+        
+        每次寫入使用各自的暫存檔（mkstemp），同一用戶的並行請求不會寫進同一個
+        暫存檔；索引只是快取，寫入失敗時記錄警告，下次列表時依 mtime 重建。
+        """
+        index_path = os.path.join(personal_dir, NOTES_INDEX_FILENAME)
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                dir=personal_dir, prefix=f"{NOTES_INDEX_FILENAME}.", suffix=".tmp"
+            )
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": 1, "notes": notes}, f, ensure_ascii=False)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            logger.warning(f"筆記索引寫入失敗 {index_path}: {e}")
+            if tmp_path is not None:
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+    
+    @staticmethod
+    def _write_note_file(filepath: str, text: str):
+        """
+        一次編碼、一次 os.write 寫入暫存檔，再以 os.replace 原子替換
+        
+        每次寫入使用各自的暫存檔（mkstemp），同一筆記的並行更新不會寫進同一個暫存檔。
+        """
+        data = memoryview(text.encode("utf-8"))
+        directory, filename = os.path.split(filepath)
+        # 點開頭的暫存檔不會出現在列表與統計中
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{filename}.", suffix=".tmp")
+        try:
+            try:
+                # mkstemp 建立的檔案權限為 0600，維持筆記檔原本的 0644
+                os.fchmod(fd, 0o644)
+                while data:
+                    data = data[os.write(fd, data):]
+            finally:
+                os.close(fd)
+            os.replace(tmp_path, filepath)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+    
+    def _find_note_file(self, user: UserContext, note_id: str) -> Optional[str]:
+        """以筆記 ID（或檔名）查找檔名；索引與磁碟不一致時重建一次"""
+        personal_dir = os.path.join(PERSONAL_DIR, user.account)
+        
+        for _ in range(2):
+            index = self._get_note_index(user)
+            filename = index.get(note_id)
+            if filename is None and note_id in index.values():
+                filename = note_id
             
-            filepath = os.path.join(personal_dir, filename)
-            meta = self._parse_note_metadata(filepath)
+            if filename and os.path.exists(os.path.join(personal_dir, filename)):
+                return filename
             
-            if meta.get("id") == note_id or filename == note_id:
-                with open(filepath, "r", encoding="utf-8") as f:
-                    content = f.read()
-                
-                # 移除 frontmatter
-                if content.startswith("---"):
-                    parts = content.split("---", 2)
-                    if len(parts) >= 3:
-                        content = parts[2].strip()
-                
-                return {
-                    "id": meta.get("id", filename),
-                    "filename": filename,
-                    "title": meta.get("title", filename),
-                    "content": content,
-                    "category": meta.get("category", "note"),
-                    "tags": meta.get("tags", []),
-                }
+            # 檔案可能在外部被新增 / 刪除，捨棄索引後重試
+            self._index_cache.pop(user.account, None)
         
         return None
     
@@ -320,17 +511,19 @@ class MultiScopeKnowledgeBase:
         new_tags = tags if tags is not None else note["tags"]
         
         # 重寫檔案
-        with open(filepath, "w", encoding="utf-8") as f:
-            f.write(f"---\n")
-            f.write(f"id: {note_id}\n")
-            f.write(f"title: {new_title}\n")
-            f.write(f"category: {note.get('category', 'note')}\n")
-            f.write(f"tags: {', '.join(new_tags)}\n")
-            f.write(f"updated: {datetime.now().isoformat()}\n")
-            f.write(f"---\n\n")
-            f.write(f"# {new_title}\n\n")
-            f.write(new_content)
-        
+        self._write_note_file(filepath, "".join((
+            "---\n",
+            f"id: {note_id}\n",
+            f"title: {new_title}\n",
+            f"category: {note.get('category', 'note')}\n",
+            f"tags: {', '.join(new_tags)}\n",
+            f"updated: {datetime.now().isoformat()}\n",
+            "---\n\n",
+            f"# {new_title}\n\n",
+            new_content,
+        )))
+        
+        self._refresh_note_entry(personal_dir, note["filename"])
         return {"success": True, "id": note_id}
     
     def delete_personal_note(self, user: UserContext, note_id: str) -> Dict[str, Any]:
@@ -344,70 +537,142 @@ class MultiScopeKnowledgeBase:
         
         try:
             os.remove(filepath)
+            self._refresh_note_entry(personal_dir, note["filename"])
+            index = self._index_cache.get(user.account)
+            if index is not None:
+                index.pop(note["id"], None)
             return {"success": True, "deleted": note_id}
         except Exception as e:
             return {"success": False, "error": str(e)}
     
-    def _parse_note_metadata(self, filepath: str) -> Dict[str, Any]:
-        """解析筆記的 frontmatter"""
-        try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                content = f.read()
-            
-            if not content.startswith("---"):
-                return {}
+    def migrate_note_filenames(self, user: UserContext) -> int:
+        """
+        將舊版檔名 {timestamp}_{title}.md 改為 {timestamp}__{category}__{title}.md
+        
+        分類取自 frontmatter；ID 不變。回傳改名的檔案數。
+        """
+        personal_dir = os.path.join(PERSONAL_DIR, user.account)
+        if not os.path.exists(personal_dir):
+            return 0
+        
+        renamed = 0
+        # 目錄固定、檔名來自 scandir：直接串接路徑，不經 os.path.join
+        prefix = personal_dir + os.sep
+        for filename, entry in list(self._load_notes_index(personal_dir).items()):
+            parts = _kb_fastpaths.split_legacy_note_name(filename)
+            if parts is None:
+                continue
             
-            parts = content.split("---", 2)
-            if len(parts) < 2:
-                return {}
+            timestamp, rest = parts
+            new_name = f"{timestamp}__{self._safe_category(entry['category'])}__{rest}"
+            new_path = f"{prefix}{new_name}"
+            if os.path.exists(new_path):
+                continue
             
-            meta = {}
-            for line in parts[1].strip().split("\n"):
-                if ":" in line:
-                    key, value = line.split(":", 1)
-                    key = key.strip()
-                    value = value.strip()
-                    
-                    if key == "tags":
-                        meta[key] = [t.strip() for t in value.split(",") if t.strip()]
-                    else:
-                        meta[key] = value
+            old_path = f"{prefix}{filename}"
+            os.rename(old_path, new_path)
+            self._meta_cache.pop(old_path, None)
+            renamed += 1
+        
+        if renamed:
+            # 重新掃描以同步持久化索引與 ID 索引
+            self._index_cache.pop(user.account, None)
+            self._load_notes_index(personal_dir)
+        return renamed
+    
+    @staticmethod
+    def _safe_category(category: str) -> str:
+        """檔名中的分類片段（不含底線，避免與 __ 分隔衝突）"""
+        return "".join(c for c in category if c.isalnum() or c in ".-")[:30] or "note"
+    
+    def _parse_note_metadata(self, filepath: str, mtime_ns: int = None) -> Dict[str, Any]:
+        """
+        解析筆記的 frontmatter
+        
+        以 (filepath, mtime_ns) 快取結果，檔案未變更時不重新讀取；
+        呼叫端可傳入 scandir 取得的 mtime_ns 以省去 stat。
+        """
+        try:
+            if mtime_ns is None:
+                mtime_ns = os.stat(filepath).st_mtime_ns
+            cached = self._meta_cache.get(filepath)
+            if cached is not None and cached[0] == mtime_ns:
+                return cached[1]
             
+            meta = self._read_note_metadata(filepath)
+            self._meta_cache[filepath] = (mtime_ns, meta)
             return meta
+        except OSError:
+            return {}
+    
+    def _read_note_metadata(self, filepath: str) -> Dict[str, Any]:
+        """讀取並解析筆記的 frontmatter（逐塊讀到結尾分隔線為止，不讀內文）"""
+        try:
+            with open(filepath, "rb") as f:
+                head = f.read(self.FRONTMATTER_BLOCK_SIZE)
+                if not head.startswith(b"---"):
+                    return {}
+                
+                end = head.find(b"\n---", 3)
+                while end < 0:
+                    more = f.read(self.FRONTMATTER_BLOCK_SIZE)
+                    if not more:
+                        # 沒有結尾分隔線：與舊行為相同，整份視為 frontmatter
+                        end = len(head)
+                        break
+                    # 從前一塊尾端重疊搜尋，避免分隔線跨塊
+                    start = max(3, len(head) - 3)
+                    head += more
+                    end = head.find(b"\n---", start)
+            
+            return self._parse_meta_from_text(head[3:end].decode("utf-8", "replace"))
         except:
             return {}
     
+    @staticmethod
+    def _parse_meta_from_text(fm: str) -> Dict[str, Any]:
+        """解析 frontmatter 區塊（兩條 --- 之間的文字）"""
+        return _kb_fastpaths.parse_frontmatter(fm)
+    
     # ─────────────────────────────────────────────────────────
     # 知識庫統計
     # ─────────────────────────────────────────────────────────
     
     def get_statistics(self, user: UserContext) -> Dict[str, Any]:
         """取得知識庫統計資訊"""
+        dept_dir = os.path.join(DEPARTMENTS_DIR, user.dept_code)
+        personal_dir = os.path.join(PERSONAL_DIR, user.account)
+        
+        # 三個範圍並行計數
+        public_counts, dept_counts, personal_counts = _run_scoped([
+            (self._count_files, (PUBLIC_DIR,)),
+            (self._count_files, (dept_dir,)),
+            (self._count_files, (personal_dir,)),
+        ])
+        
         stats = {
-            "public": self._count_files(PUBLIC_DIR),
+            "public": public_counts,
             "department": {},
             "personal": 0,
             "total": 0,
         }
         
         # 部門統計
-        dept_dir = os.path.join(DEPARTMENTS_DIR, user.dept_code)
         if os.path.exists(dept_dir):
             stats["department"] = {
                 "code": user.dept_code,
                 "name": user.department,
-                "files": self._count_files(dept_dir),
+                "files": dept_counts,
             }
         
         # 個人統計
-        personal_dir = os.path.join(PERSONAL_DIR, user.account)
         if os.path.exists(personal_dir):
-            stats["personal"] = self._count_files(personal_dir)
+            stats["personal"] = personal_counts
         
         stats["total"] = (
             stats["public"]["total"] +
             stats["department"].get("files", {}).get("total", 0) +
-            stats["personal"]
+            (stats["personal"]["total"] if stats["personal"] else 0)
         )
         
         return stats
@@ -417,17 +682,8 @@ class MultiScopeKnowledgeBase:
         if not os.path.exists(directory):
             return {"total": 0, "by_type": {}}
         
-        counts = {"total": 0, "by_type": {}}
-        
-        for root, _, files in os.walk(directory):
-            for f in files:
-                if f.startswith("."):
-                    continue
-                counts["total"] += 1
-                ext = os.path.splitext(f)[1].lower()
-                counts["by_type"][ext] = counts["by_type"].get(ext, 0) + 1
-        
-        return counts
+        total, by_type = _kb_fastpaths.count_files(directory)
+        return {"total": total, "by_type": by_type}
     
     # ─────────────────────────────────────────────────────────
     # 檔案列表
@@ -436,74 +692,67 @@ class MultiScopeKnowledgeBase:
     def list_files(
         self,
         user: UserContext,
-        scope: KnowledgeScope = KnowledgeScope.ALL
+        scope: KnowledgeScope = KnowledgeScope.ALL,
+        limit: Optional[int] = None
     ) -> Dict[str, List[Dict[str, Any]]]:
-        """列出用戶可存取的檔案"""
-        result = {}
+        """列出用戶可存取的檔案（limit：每個範圍只取最近修改的前 N 筆）"""
+        # 各範圍目錄並行走訪（不存在的目錄回傳空列表）
+        calls = {}
         
         # 公用庫
         if scope in (KnowledgeScope.ALL, KnowledgeScope.PUBLIC):
-            result["public"] = self._list_directory_files(PUBLIC_DIR, "public")
+            calls["public"] = (self._list_directory_files, (PUBLIC_DIR, "public", limit))
         
         # 部門庫
         if scope in (KnowledgeScope.ALL, KnowledgeScope.DEPARTMENT):
             dept_dir = os.path.join(DEPARTMENTS_DIR, user.dept_code)
-            if os.path.exists(dept_dir):
-                result["department"] = self._list_directory_files(dept_dir, "department")
-            else:
-                result["department"] = []
+            calls["department"] = (self._list_directory_files, (dept_dir, "department", limit))
         
         # 個人庫
         if scope in (KnowledgeScope.ALL, KnowledgeScope.PERSONAL):
             personal_dir = os.path.join(PERSONAL_DIR, user.account)
-            if os.path.exists(personal_dir):
-                result["personal"] = self._list_directory_files(personal_dir, "personal")
-            else:
-                result["personal"] = []
+            calls["personal"] = (self._list_directory_files, (personal_dir, "personal", limit))
         
-        return result
+        return dict(zip(calls, _run_scoped(list(calls.values()))))
     
     def _list_directory_files(
         self,
         directory: str,
-        scope: str
+        scope: str,
+        limit: Optional[int] = None
     ) -> List[Dict[str, Any]]:
-        """列出目錄中的檔案"""
+        """列出目錄中的檔案（依修改時間新到舊）"""
         if not os.path.exists(directory):
             return []
         
-        files = []
-        for root, _, filenames in os.walk(directory):
-            for filename in filenames:
-                if filename.startswith("."):
-                    continue
-                
-                filepath = os.path.join(root, filename)
-                rel_path = os.path.relpath(filepath, directory)
-                stat = os.stat(filepath)
-                
-                files.append({
-                    "name": filename,
-                    "path": rel_path,
-                    "scope": scope,
-                    "size": stat.st_size,
-                    "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
-                })
-        
-        # 依修改時間排序
-        files.sort(key=lambda x: x["modified"], reverse=True)
-        return files
+        # 先收集檔案再批次 stat
+        pending = _kb_fastpaths.scan_files(directory)
+        stats = batch_stat([path for path, _, _ in pending])
+        found = [(item, stat) for item, stat in zip(pending, stats) if stat is not None]
+        
+        # 依修改時間排序；有 limit 時只選出前 N 筆再組裝結果
+        if limit is not None:
+            found = heapq.nlargest(limit, found, key=lambda pair: pair[1].st_mtime)
+        else:
+            found.sort(key=lambda pair: pair[1].st_mtime, reverse=True)
+        
+        return [
+            {
+                "name": filename,
+                "path": rel_path,
+                "scope": scope,
+                "size": stat.st_size,
+                "modified": datetime.fromtimestamp(stat.st_mtime).isoformat(),
+            }
+            for (_, filename, rel_path), stat in found
+        ]
 
 
 # ─────────────────────────────────────────────────────────────
 # 全域實例
 # ─────────────────────────────────────────────────────────────
 
-_kb_instance: Optional[MultiScopeKnowledgeBase] = None
-
+@lru_cache(maxsize=1)
 def get_knowledge_base() -> MultiScopeKnowledgeBase:
     """取得知識庫實例"""
-    global _kb_instance
-    if _kb_instance is None:
-        _kb_instance = MultiScopeKnowledgeBase()
-    return _kb_instance
+    return MultiScopeKnowledgeBase()
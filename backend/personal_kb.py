@@ -9,9 +9,13 @@
 6. 與主系統整合
 """
 
+import io
 import os
 import re
 import json
+import mmap
+import codecs
+import uuid
 import hashlib
 import zipfile
 import shutil
@@ -20,18 +24,57 @@ from pathlib import Path
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple, Any
 from dataclasses import dataclass, asdict, field
-from threading import Lock
+from threading import Lock, Timer
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
+
+# 解析器依賴於模組載入時解析一次，各解析函數只檢查旗標
+try:
+    import fitz  # PyMuPDF
+    _HAS_FITZ = True
+except ImportError:
+    _HAS_FITZ = False
+
+try:
+    import pdfplumber
+    _HAS_PDFPLUMBER = True
+except ImportError:
+    _HAS_PDFPLUMBER = False
+
+try:
+    import pandas as pd
+    _HAS_PANDAS = True
+except ImportError:
+    _HAS_PANDAS = False
+
+try:
+    from PIL import Image
+    _HAS_PIL = True
+except ImportError:
+    _HAS_PIL = False
+
+try:
+    import pytesseract
+    _HAS_TESSERACT = True
+except ImportError:
+    _HAS_TESSERACT = False
 
 # 嘗試從 config 導入，如果失敗則使用預設值
 try:
     from config import (
-        PERSONAL_KB_DIR, PERSONAL_KB_CONFIG, EMBEDDING_MODEL,
+        PERSONAL_KB_DIR, PERSONAL_KB_CONFIG,
         CHUNK_CONFIGS, KEYWORD_PATTERNS, CHINESE_STOPWORDS,
     )
 except ImportError:
     # 預設值
     PERSONAL_KB_DIR = os.getenv("PERSONAL_KB_DIR", "/app/data/personal_kb")
-    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
     
     @dataclass
     class _PersonalKBConfig:
@@ -65,13 +108,44 @@ except ImportError:
         '上', '下', '中', '請', '到', '把', '被', '讓', '給', '跟',
     }
 
+from utils import get_shared_embedding, embed_in_batches
+
 logger = logging.getLogger(__name__)
 
+# Embedding 批次大小（同時送出的請求數由 utils.MAX_EMBED_CONCURRENCY 限制）
+EMBED_BATCH_SIZE = int(os.getenv("PERSONAL_EMBED_BATCH_SIZE", "256"))
+
+# 關鍵字模式於載入時編譯一次（各模式仍分別 findall，保留彼此重疊的匹配）
+_KEYWORD_RES = [re.compile(p, re.IGNORECASE) for p in KEYWORD_PATTERNS]
+_CHINESE_WORD_RE = re.compile(r'[\u4e00-\u9fa5]{2,8}')
+_STOPWORDS = frozenset(CHINESE_STOPWORDS)
+
+# 段落分隔（連續空行）
+_PARA_RE = re.compile(r'\n\n+')
+
+# 滑動視窗切塊時可對齊的邊界字元，及向前 / 向後尋找邊界的最大距離
+_SNAP_CHARS = ("\n", "。", " ")
+_SNAP_DISTANCE = 64
+
+# 純文字檔超過此大小時改以 mmap 分段解碼
+LARGE_TEXT_BYTES = 8 * 1024 * 1024
+_DECODE_CHUNK = 1024 * 1024
+
+
+def _file_md5(f) -> str:
+    """以固定大小緩衝計算檔案 MD5，不把整個檔案讀進記憶體"""
+    if hasattr(hashlib, "file_digest"):  # Python 3.11+
+        return hashlib.file_digest(f, "md5").hexdigest()
+    md5 = hashlib.md5()
+    while chunk := f.read(1024 * 1024):
+        md5.update(chunk)
+    return md5.hexdigest()
+
 # ═══════════════════════════════════════════════════════════════
 # 資料結構
 # ═══════════════════════════════════════════════════════════════
 
-@dataclass
+@dataclass(slots=True)
 class ExtractedImage:
     """提取的圖片"""
     name: str
@@ -82,7 +156,7 @@ class ExtractedImage:
     paragraph_idx: Optional[int] = None
     paragraph_text: Optional[str] = None
     
-@dataclass
+@dataclass(slots=True)
 class DocumentChunk:
     """文件區塊"""
     content: str
@@ -90,7 +164,7 @@ class DocumentChunk:
     doc_id: str
     metadata: Dict = field(default_factory=dict)
 
-@dataclass
+@dataclass(slots=True)
 class ProcessedDocument:
     """處理後的文件"""
     doc_id: str
@@ -106,7 +180,7 @@ class ProcessedDocument:
     status: str = "processed"
     error: Optional[str] = None
 
-@dataclass
+@dataclass(slots=True)
 class SearchResult:
     """搜尋結果"""
     doc_id: str
@@ -134,20 +208,7 @@ class DocumentParser:
         """
         ext = Path(file_path).suffix.lower()
         
-        parsers = {
-            '.docx': DocumentParser._parse_docx,
-            '.pdf': DocumentParser._parse_pdf,
-            '.txt': DocumentParser._parse_text,
-            '.md': DocumentParser._parse_text,
-            '.xlsx': DocumentParser._parse_xlsx,
-            '.csv': DocumentParser._parse_csv,
-            '.png': DocumentParser._parse_image,
-            '.jpg': DocumentParser._parse_image,
-            '.jpeg': DocumentParser._parse_image,
-            '.gif': DocumentParser._parse_image,
-        }
-        
-        parser = parsers.get(ext)
+        parser = DocumentParser._PARSERS.get(ext)
         if not parser:
             raise ValueError(f"不支援的檔案格式: {ext}")
         
@@ -169,24 +230,26 @@ class DocumentParser:
         # 提取圖片
         images = []
         with zipfile.ZipFile(file_path, 'r') as z:
-            for name in z.namelist():
-                if name.startswith('word/media/'):
-                    img_data = z.read(name)
-                    ext = name.split('.')[-1].lower()
-                    if ext not in ['png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp']:
-                        continue
-                    
-                    img_name = f"img_{len(images)+1:03d}.{ext}"
-                    img_path = os.path.join(images_dir, img_name)
-                    
-                    with open(img_path, 'wb') as f:
-                        f.write(img_data)
-                    
-                    images.append(ExtractedImage(
-                        name=img_name,
-                        path=img_path,
-                        size=len(img_data),
-                    ))
+            for info in z.infolist():
+                name = info.filename
+                if not name.startswith('word/media/'):
+                    continue
+                ext = name.split('.')[-1].lower()
+                if ext not in ['png', 'jpg', 'jpeg', 'gif', 'bmp', 'webp']:
+                    continue
+                
+                img_name = f"img_{len(images)+1:03d}.{ext}"
+                img_path = os.path.join(images_dir, img_name)
+                
+                # 串流解壓，不把整張圖片載入記憶體
+                with z.open(info) as src, open(img_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst, 65536)
+                
+                images.append(ExtractedImage(
+                    name=img_name,
+                    path=img_path,
+                    size=info.file_size,
+                ))
         
         # 提取文字並關聯圖片
         text_parts = []
@@ -219,79 +282,88 @@ class DocumentParser:
         images_dir = os.path.join(output_dir, "images")
         os.makedirs(images_dir, exist_ok=True)
         
-        try:
-            import fitz  # PyMuPDF
-            
-            doc = fitz.open(file_path)
-            text_parts = []
-            images = []
-            
-            for page_num, page in enumerate(doc):
-                # 提取文字
-                text = page.get_text()
-                if text.strip():
-                    text_parts.append(f"[📄 第 {page_num + 1} 頁]\n{text}")
+        if not _HAS_FITZ:
+            return DocumentParser._parse_pdf_plumber(file_path)
+        
+        doc = fitz.open(file_path)
+        text_parts = []
+        images = []
+        
+        for page_num, page in enumerate(doc):
+            # 提取文字
+            text = page.get_text()
+            if text.strip():
+                text_parts.append(f"[📄 第 {page_num + 1} 頁]\n{text}")
                 
-                # 提取圖片
-                for img_idx, img in enumerate(page.get_images()):
-                    try:
-                        xref = img[0]
-                        pix = fitz.Pixmap(doc, xref)
+            # 提取圖片
+            for img_idx, img in enumerate(page.get_images()):
+                try:
+                    xref = img[0]
+                    pix = fitz.Pixmap(doc, xref)
                         
-                        img_name = f"img_p{page_num+1}_{img_idx+1:03d}.png"
-                        img_path = os.path.join(images_dir, img_name)
+                    img_name = f"img_p{page_num+1}_{img_idx+1:03d}.png"
+                    img_path = os.path.join(images_dir, img_name)
                         
-                        if pix.n < 5:
-                            pix.save(img_path)
-                        else:
-                            pix = fitz.Pixmap(fitz.csRGB, pix)
-                            pix.save(img_path)
+                    if pix.n < 5:
+                        pix.save(img_path)
+                    else:
+                        pix = fitz.Pixmap(fitz.csRGB, pix)
+                        pix.save(img_path)
                         
-                        images.append(ExtractedImage(
-                            name=img_name,
-                            path=img_path,
-                            size=os.path.getsize(img_path),
-                            paragraph_idx=page_num,
-                            paragraph_text=f"第 {page_num + 1} 頁",
-                        ))
+                    images.append(ExtractedImage(
+                        name=img_name,
+                        path=img_path,
+                        size=os.path.getsize(img_path),
+                        paragraph_idx=page_num,
+                        paragraph_text=f"第 {page_num + 1} 頁",
+                    ))
                         
-                        text_parts.append(f"\n[📷 圖片: {img_name}]\n")
-                    except:
-                        pass
-            
-            doc.close()
-            return "\n".join(text_parts), images
+                    text_parts.append(f"\n[📷 圖片: {img_name}]\n")
+                except:
+                    pass
             
-        except ImportError:
-            # 備用：pdfplumber
-            try:
-                import pdfplumber
-                
-                text_parts = []
-                with pdfplumber.open(file_path) as pdf:
-                    for page_num, page in enumerate(pdf.pages):
-                        text = page.extract_text()
-                        if text:
-                            text_parts.append(f"[📄 第 {page_num + 1} 頁]\n{text}")
-                
-                return "\n".join(text_parts), []
-                
-            except ImportError:
-                raise ImportError("需要安裝 PyMuPDF 或 pdfplumber")
+        doc.close()
+        return "\n".join(text_parts), images
+    
+    @staticmethod
+    def _parse_pdf_plumber(file_path: str) -> Tuple[str, List[ExtractedImage]]:
+        """備用：pdfplumber（僅文字）"""
+        if not _HAS_PDFPLUMBER:
+            raise ImportError("需要安裝 PyMuPDF 或 pdfplumber")
+        
+        text_parts = []
+        with pdfplumber.open(file_path) as pdf:
+            for page_num, page in enumerate(pdf.pages):
+                text = page.extract_text()
+                if text:
+                    text_parts.append(f"[📄 第 {page_num + 1} 頁]\n{text}")
+        
+        return "\n".join(text_parts), []
     
     @staticmethod
     def _parse_text(file_path: str, output_dir: str) -> Tuple[str, List[ExtractedImage]]:
         """解析純文字"""
-        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-            text = f.read()
-        return text, []
+        if os.path.getsize(file_path) < LARGE_TEXT_BYTES:
+            with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+                text = f.read()
+            return text, []
+        
+        # 大檔：直接由 page cache 分段解碼，不先複製整份 bytes 到 Python；
+        # 換行處理與文字模式 open 相同（\r\n、\r 轉為 \n）
+        decoder = io.IncrementalNewlineDecoder(
+            codecs.getincrementaldecoder('utf-8')(errors='ignore'), translate=True
+        )
+        parts = []
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for i in range(0, len(mm), _DECODE_CHUNK):
+                parts.append(decoder.decode(mm[i:i + _DECODE_CHUNK]))
+        parts.append(decoder.decode(b"", final=True))
+        return "".join(parts), []
     
     @staticmethod
     def _parse_xlsx(file_path: str, output_dir: str) -> Tuple[str, List[ExtractedImage]]:
         """解析 Excel"""
-        try:
-            import pandas as pd
-        except ImportError:
+        if not _HAS_PANDAS:
             raise ImportError("需要安裝 pandas 和 openpyxl")
         
         xls = pd.ExcelFile(file_path)
@@ -300,7 +372,7 @@ class DocumentParser:
         for sheet_name in xls.sheet_names:
             df = pd.read_excel(xls, sheet_name=sheet_name)
             text_parts.append(f"[📊 工作表: {sheet_name}]")
-            text_parts.append(df.to_markdown(index=False))
+            text_parts.append(DocumentParser._frame_to_text(df))
             text_parts.append("")
         
         return "\n".join(text_parts), []
@@ -308,20 +380,20 @@ class DocumentParser:
     @staticmethod
     def _parse_csv(file_path: str, output_dir: str) -> Tuple[str, List[ExtractedImage]]:
         """解析 CSV"""
-        try:
-            import pandas as pd
-        except ImportError:
+        if not _HAS_PANDAS:
             raise ImportError("需要安裝 pandas")
         
         df = pd.read_csv(file_path)
-        return df.to_markdown(index=False), []
+        return DocumentParser._frame_to_text(df), []
+    
+    @staticmethod
+    def _frame_to_text(df) -> str:
+        """表格轉為 | 分隔文字（pandas C writer，不經 tabulate 逐格排版）"""
+        return df.to_csv(sep='|', index=False, lineterminator='\n')
     
     @staticmethod
     def _parse_image(file_path: str, output_dir: str) -> Tuple[str, List[ExtractedImage]]:
         """解析圖片檔案（使用 OCR 或作為圖片索引）"""
-        import shutil
-        from pathlib import Path
-        
         images_dir = os.path.join(output_dir, "images")
         os.makedirs(images_dir, exist_ok=True)
         
@@ -330,16 +402,29 @@ class DocumentParser:
         img_path = os.path.join(images_dir, filename)
         shutil.copy2(file_path, img_path)
         
-        # 取得圖片資訊
+        # 取得圖片資訊，並在同一次解碼中進行 OCR
         img_size = os.path.getsize(file_path)
         width, height = 0, 0
+        ocr_text = ""
         
-        try:
-            from PIL import Image
-            with Image.open(file_path) as img:
-                width, height = img.size
-        except:
-            pass
+        if _HAS_PIL:
+            try:
+                with Image.open(file_path) as img:
+                    width, height = img.size
+                    
+                    # 嘗試 pytesseract OCR（支援中文+英文）
+                    if _HAS_TESSERACT:
+                        try:
+                            img.load()
+                            ocr_text = pytesseract.image_to_string(img, lang='chi_tra+eng')
+                            if ocr_text.strip():
+                                logger.info(f"✅ OCR 成功提取文字: {len(ocr_text)} 字元")
+                        except Exception as e:
+                            logger.debug(f"OCR 失敗: {e}")
+                    else:
+                        logger.debug("pytesseract 未安裝，跳過 OCR")
+            except:
+                pass
         
         # 建立圖片記錄
         image_record = ExtractedImage(
@@ -352,24 +437,7 @@ class DocumentParser:
             paragraph_text=f"上傳的圖片: {filename}"
         )
         
-        # 嘗試 OCR 提取文字
-        ocr_text = ""
-        
-        # 方法 1: 嘗試 pytesseract（如果有安裝）
-        try:
-            import pytesseract
-            from PIL import Image
-            img = Image.open(file_path)
-            # 支援中文+英文
-            ocr_text = pytesseract.image_to_string(img, lang='chi_tra+eng')
-            if ocr_text.strip():
-                logger.info(f"✅ OCR 成功提取文字: {len(ocr_text)} 字元")
-        except ImportError:
-            logger.debug("pytesseract 未安裝，跳過 OCR")
-        except Exception as e:
-            logger.debug(f"OCR 失敗: {e}")
-        
-        # 方法 2: 如果 OCR 失敗，使用檔名作為描述
+        # OCR 失敗時，使用檔名作為描述
         if not ocr_text.strip():
             ocr_text = f"[圖片檔案]\n檔名: {filename}\n尺寸: {width}x{height}\n大小: {img_size} bytes"
         
@@ -383,6 +451,20 @@ class DocumentParser:
         
         return text_content, [image_record]
 
+# 副檔名 → 解析函式（類別定義完成後建立一次）
+DocumentParser._PARSERS = {
+    '.docx': DocumentParser._parse_docx,
+    '.pdf': DocumentParser._parse_pdf,
+    '.txt': DocumentParser._parse_text,
+    '.md': DocumentParser._parse_text,
+    '.xlsx': DocumentParser._parse_xlsx,
+    '.csv': DocumentParser._parse_csv,
+    '.png': DocumentParser._parse_image,
+    '.jpg': DocumentParser._parse_image,
+    '.jpeg': DocumentParser._parse_image,
+    '.gif': DocumentParser._parse_image,
+}
+
 # ═══════════════════════════════════════════════════════════════
 # 關鍵字索引
 # ═══════════════════════════════════════════════════════════════
@@ -390,24 +472,38 @@ class DocumentParser:
 class PersonalKeywordIndex:
     """個人知識庫關鍵字索引"""
     
+    # 模糊比對用的字元 n-gram 長度（模糊比對的查詢詞至少 2 字）
+    NGRAM = 2
+    # 索引變更後延遲寫檔的秒數（期間的多次變更合併為一次寫入）
+    SAVE_DELAY = 1.0
+    
     def __init__(self, index_path: str):
         self.index_path = index_path
         self.index: Dict[str, List[Tuple[str, float]]] = {}
         self.doc_keywords: Dict[str, List[str]] = {}
         self._lock = Lock()
+        # 搜尋用的陣列形式（CSR），索引變更後於下次搜尋時重建
+        self._arrays: Optional[Dict[str, Any]] = None
+        # 字元 n-gram → 含該 n-gram 的關鍵字，模糊比對時只檢查候選關鍵字
+        self.ngrams: Dict[str, set] = {}
+        # 關鍵字 → posting 中的 doc_id 集合，O(1) 判斷是否重複
+        self._posting_sets: Dict[str, set] = {}
+        # 延遲寫檔狀態
+        self._dirty = False
+        self._save_timer: Optional[Timer] = None
+        self._write_lock = Lock()
         self._load()
     
     def _extract_keywords(self, text: str) -> List[str]:
         """提取關鍵字"""
         keywords = set()
         
-        for pattern in KEYWORD_PATTERNS:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            keywords.update(matches)
+        for regex in _KEYWORD_RES:
+            keywords.update(regex.findall(text))
         
-        # 中文詞彙
-        chinese = re.findall(r'[\u4e00-\u9fa5]{2,8}', text)
-        keywords.update(w for w in chinese if w not in CHINESE_STOPWORDS and len(w) >= 2)
+        # 中文詞彙（純 ASCII 文字直接略過；模式已保證長度 >= 2，停用詞以集合差去除）
+        if not text.isascii():
+            keywords.update(set(_CHINESE_WORD_RE.findall(text)) - _STOPWORDS)
         
         return list(keywords)
     
@@ -416,19 +512,38 @@ class PersonalKeywordIndex:
         keywords = self._extract_keywords(text)
         
         with self._lock:
-            self.doc_keywords[doc_id] = keywords
-            
-            for kw in keywords:
-                kw_lower = kw.lower()
-                if kw_lower not in self.index:
-                    self.index[kw_lower] = []
-                
-                if not any(d == doc_id for d, _ in self.index[kw_lower]):
-                    self.index[kw_lower].append((doc_id, 1.0))
+            self._index_keywords(doc_id, keywords)
         
         self._save()
         return keywords
     
+    def bulk_add(self, items: List[Tuple[str, str]]) -> Dict[str, List[str]]:
+        """批次添加文件 [(doc_id, text), ...]，全部完成後才排程一次寫檔"""
+        extracted = {doc_id: self._extract_keywords(text) for doc_id, text in items}
+        
+        with self._lock:
+            for doc_id, keywords in extracted.items():
+                self._index_keywords(doc_id, keywords)
+        
+        self._save()
+        return extracted
+    
+    def _index_keywords(self, doc_id: str, keywords: List[str]):
+        """將文件關鍵字寫入索引（呼叫端需持有 _lock）"""
+        self.doc_keywords[doc_id] = keywords
+        
+        for kw in keywords:
+            kw_lower = kw.lower()
+            if kw_lower not in self.index:
+                self.index[kw_lower] = []
+                self._add_ngrams(kw_lower)
+            
+            posting_set = self._posting_sets.setdefault(kw_lower, set())
+            if doc_id not in posting_set:
+                posting_set.add(doc_id)
+                self.index[kw_lower].append((doc_id, 1.0))
+        self._arrays = None
+    
     def remove(self, doc_id: str):
         """移除文件"""
         with self._lock:
@@ -437,7 +552,9 @@ class PersonalKeywordIndex:
                     kw_lower = kw.lower()
                     if kw_lower in self.index:
                         self.index[kw_lower] = [(d, s) for d, s in self.index[kw_lower] if d != doc_id]
+                        self._posting_sets.get(kw_lower, set()).discard(doc_id)
                 del self.doc_keywords[doc_id]
+            self._arrays = None
         
         self._save()
     
@@ -447,40 +564,167 @@ class PersonalKeywordIndex:
         query_words = set(query.lower().split())
         all_terms = set(kw.lower() for kw in query_keywords) | query_words
         
-        doc_scores: Dict[str, float] = {}
+        if top_k <= 0:
+            return []
         
-        for term in all_terms:
-            if term in self.index:
-                for doc_id, weight in self.index[term]:
-                    doc_scores[doc_id] = doc_scores.get(doc_id, 0) + 2 * weight
+        with self._lock:
+            arrays = self._get_arrays()
+            key_pos = arrays["key_pos"]
+            if not key_pos:
+                return []
             
-            for indexed_kw, doc_list in self.index.items():
-                if len(term) >= 2 and (term in indexed_kw or indexed_kw in term):
-                    for doc_id, weight in doc_list:
-                        doc_scores[doc_id] = doc_scores.get(doc_id, 0) + weight
+            # 各關鍵字命中的倍數：完全相符 +2，模糊（互為子字串）+1
+            multiplier = np.zeros(len(key_pos), dtype=np.float64)
+            for term in all_terms:
+                pos = key_pos.get(term)
+                if pos is not None:
+                    multiplier[pos] += 2
+                
+                if len(term) >= 2:
+                    for kw in self._fuzzy_candidates(term, key_pos):
+                        multiplier[key_pos[kw]] += 1
         
-        results = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
-        return results[:top_k]
+        offsets = arrays["offsets"]
+        doc_idx = arrays["doc_idx"]
+        weights = arrays["weights"]
+        num_docs = len(arrays["doc_ids"])
+        
+        hit_keys = np.flatnonzero(multiplier)
+        if not len(hit_keys):
+            return []
+        
+        # 展開命中關鍵字的 posting 範圍，以 bincount 一次累加各文件分數
+        starts = offsets[hit_keys]
+        counts = offsets[hit_keys + 1] - starts
+        total = int(counts.sum())
+        if not total:
+            return []
+        positions = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(total)
+        contrib = weights[positions] * np.repeat(multiplier[hit_keys], counts)
+        scores = np.bincount(doc_idx[positions], weights=contrib, minlength=num_docs)
+        hit_docs = np.bincount(doc_idx[positions], minlength=num_docs) > 0
+        
+        candidates = np.flatnonzero(hit_docs)
+        if len(candidates) > top_k:
+            part = np.argpartition(-scores[candidates], top_k - 1)[:top_k]
+            candidates = candidates[part]
+        order = candidates[np.argsort(-scores[candidates], kind="stable")]
+        
+        doc_ids = arrays["doc_ids"]
+        return [(doc_ids[i], float(scores[i])) for i in order]
+    
+    def _fuzzy_candidates(self, term: str, key_pos: Dict[str, int]) -> set:
+        """與 term 互為子字串的關鍵字（以 n-gram 取候選，不掃描整個索引）"""
+        n = self.NGRAM
+        matched = set()
+        
+        # 關鍵字包含 term：取 term 所有 n-gram 的交集後再確認
+        grams = sorted(
+            (self.ngrams.get(term[i:i + n], ()) for i in range(len(term) - n + 1)),
+            key=len,
+        )
+        if grams and grams[0]:
+            candidates = set(grams[0]).intersection(*grams[1:])
+            matched.update(kw for kw in candidates if term in kw)
+        
+        # term 包含關鍵字：直接查 term 的每個子字串
+        length = len(term)
+        for i in range(length):
+            for j in range(i + 1, length + 1):
+                if term[i:j] in key_pos:
+                    matched.add(term[i:j])
+        
+        return matched
+    
+    def _add_ngrams(self, kw: str):
+        """將關鍵字登記到 n-gram 反向索引"""
+        n = self.NGRAM
+        for i in range(len(kw) - n + 1):
+            self.ngrams.setdefault(kw[i:i + n], set()).add(kw)
+    
+    def _get_arrays(self) -> Dict[str, Any]:
+        """
+        取得 CSR 形式的索引（呼叫端需持有 _lock）
+        
+        第 i 個關鍵字的 posting 為 doc_idx / weights 的 [offsets[i], offsets[i+1]) 區段。
+        """
+        if self._arrays is None:
+            keys = list(self.index.keys())
+            doc_ids: List[str] = []
+            doc_pos: Dict[str, int] = {}
+            offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+            flat_docs: List[int] = []
+            flat_weights: List[float] = []
+            
+            for i, kw in enumerate(keys):
+                for doc_id, weight in self.index[kw]:
+                    pos = doc_pos.get(doc_id)
+                    if pos is None:
+                        pos = doc_pos[doc_id] = len(doc_ids)
+                        doc_ids.append(doc_id)
+                    flat_docs.append(pos)
+                    flat_weights.append(weight)
+                offsets[i + 1] = len(flat_docs)
+            
+            self._arrays = {
+                "key_pos": {kw: i for i, kw in enumerate(keys)},
+                "offsets": offsets,
+                "doc_idx": np.array(flat_docs, dtype=np.int64),
+                "weights": np.array(flat_weights, dtype=np.float64),
+                "doc_ids": doc_ids,
+            }
+        return self._arrays
     
     def _save(self):
-        """儲存"""
-        data = {
-            "index": {k: list(v) for k, v in self.index.items()},
-            "doc_keywords": self.doc_keywords,
-        }
-        with open(self.index_path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        """標記索引已變更，SAVE_DELAY 秒後合併寫入"""
+        with self._lock:
+            self._dirty = True
+            if self._save_timer is None:
+                self._save_timer = Timer(self.SAVE_DELAY, self.flush)
+                self._save_timer.start()
+    
+    def flush(self):
+        """立即寫入未儲存的變更"""
+        with self._write_lock:
+            with self._lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                if not self._dirty:
+                    return
+                data = {
+                    "index": {k: list(v) for k, v in self.index.items()},
+                    "doc_keywords": dict(self.doc_keywords),
+                }
+                self._dirty = False
+            
+            if _HAS_ORJSON:
+                payload = orjson.dumps(data)
+            else:
+                payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+            
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, self.index_path)
     
     def _load(self):
         """載入"""
         if os.path.exists(self.index_path):
             try:
-                with open(self.index_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.index = {k: [tuple(x) for x in v] for k, v in data.get("index", {}).items()}
-                    self.doc_keywords = data.get("doc_keywords", {})
+                with open(self.index_path, 'rb') as f:
+                    raw = f.read()
+                data = orjson.loads(raw) if _HAS_ORJSON else json.loads(raw)
+                self.index = {k: [tuple(x) for x in v] for k, v in data.get("index", {}).items()}
+                self.doc_keywords = data.get("doc_keywords", {})
             except:
                 pass
+        
+        # n-gram 反向索引與 posting 集合可由索引重建，不另外存檔
+        self.ngrams = {}
+        for kw in self.index:
+            self._add_ngrams(kw)
+        self._posting_sets = {kw: {d for d, _ in postings} for kw, postings in self.index.items()}
 
 # ═══════════════════════════════════════════════════════════════
 # 個人知識庫
@@ -489,6 +733,21 @@ class PersonalKeywordIndex:
 class PersonalKnowledgeBase:
     """個人知識庫"""
     
+    # 搜尋結果的預覽長度（字元）
+    PREVIEW_LENGTH = 300
+    
+    # metadata 變更記錄超過快照大小的此倍數時壓縮回 metadata.json
+    META_COMPACT_RATIO = 4
+    
+    # 允許的副檔名（frozenset 查詢）
+    ALLOWED_EXTENSIONS = frozenset(PERSONAL_KB_CONFIG.allowed_extensions)
+    
+    # 向量庫 delete 每次 $in 的文件數（避免超過 SQLite 參數上限）
+    DELETE_BATCH = 200
+    
+    # 批次上傳時各檔案的處理管線共用此執行緒池
+    _INGEST_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="personal-kb-ingest")
+    
     def __init__(self, user_id: str):
         self.user_id = user_id
         self.base_dir = os.path.join(PERSONAL_KB_DIR, user_id)
@@ -496,6 +755,7 @@ class PersonalKnowledgeBase:
         self.extracted_dir = os.path.join(self.base_dir, "extracted")
         self.vectordb_dir = os.path.join(self.base_dir, "vectordb")
         self.metadata_path = os.path.join(self.base_dir, "metadata.json")
+        self.metadata_log_path = os.path.join(self.base_dir, "metadata.log")
         
         # 建立目錄
         for d in [self.docs_dir, self.extracted_dir, self.vectordb_dir]:
@@ -509,62 +769,169 @@ class PersonalKnowledgeBase:
         
         self._vectordb = None
         self._lock = Lock()
+        # 處理中的 doc_id（批次上傳時避免重複處理內容相同的檔案）
+        self._pending = set()
     
     def _load_metadata(self) -> Dict:
-        """載入 metadata"""
+        """載入 metadata（快照 + 重播變更記錄）"""
         if os.path.exists(self.metadata_path):
-            with open(self.metadata_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        
-        return {
-            "user_id": self.user_id,
-            "documents": {},
-            "stats": {
-                "total_documents": 0,
-                "total_chunks": 0,
-                "total_images": 0,
-                "last_updated": None,
+            with open(self.metadata_path, 'rb') as f:
+                raw = f.read()
+            metadata = orjson.loads(raw) if _HAS_ORJSON else json.loads(raw)
+        else:
+            metadata = {
+                "user_id": self.user_id,
+                "documents": {},
+                "stats": {
+                    "total_documents": 0,
+                    "total_chunks": 0,
+                    "total_images": 0,
+                    "last_updated": None,
+                }
             }
-        }
+        
+        if os.path.exists(self.metadata_log_path):
+            with open(self.metadata_log_path, 'rb') as f:
+                for line in f:
+                    try:
+                        record = orjson.loads(line) if _HAS_ORJSON else json.loads(line)
+                    except ValueError:
+                        # 寫入中斷留下的不完整記錄
+                        continue
+                    if record["op"] == "add":
+                        metadata["documents"][record["doc_id"]] = record["doc"]
+                    else:
+                        metadata["documents"].pop(record["doc_id"], None)
+                    metadata["stats"] = record["stats"]
+        
+        return metadata
     
     def _save_metadata(self):
-        """儲存 metadata"""
-        self.metadata["stats"]["last_updated"] = datetime.now().isoformat()
-        with open(self.metadata_path, 'w', encoding='utf-8') as f:
-            json.dump(self.metadata, f, ensure_ascii=False, indent=2)
+        """寫入完整 metadata 快照並清空變更記錄"""
+        with self._lock:
+            self.metadata["stats"]["last_updated"] = datetime.now().isoformat()
+            if _HAS_ORJSON:
+                payload = orjson.dumps(self.metadata, option=orjson.OPT_INDENT_2)
+            else:
+                payload = json.dumps(self.metadata, ensure_ascii=False, indent=2).encode('utf-8')
+            
+            tmp_path = f"{self.metadata_path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, self.metadata_path)
+            
+            if os.path.exists(self.metadata_log_path):
+                os.remove(self.metadata_log_path)
+    
+    def _log_metadata(self, op: str, doc_ids: List[str]):
+        """
+        將文件的新增 / 移除附加到 metadata.log（每筆一行 JSON）
+        
+        每次變更只寫入該文件的記錄，不重寫整份 metadata.json；
+        記錄累積超過快照的 META_COMPACT_RATIO 倍時才壓縮為新快照。
+        """
+        if not doc_ids:
+            return
+        
+        with self._lock:
+            stats = self.metadata["stats"]
+            stats["last_updated"] = datetime.now().isoformat()
+            records = []
+            for doc_id in doc_ids:
+                record = {"op": op, "doc_id": doc_id, "stats": stats}
+                if op == "add":
+                    record["doc"] = self.metadata["documents"][doc_id]
+                records.append(record)
+            
+            if _HAS_ORJSON:
+                payload = b"".join(orjson.dumps(r) + b"\n" for r in records)
+            else:
+                payload = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode('utf-8')
+            
+            with open(self.metadata_log_path, 'ab') as f:
+                f.write(payload)
+                log_size = f.tell()
+            
+            try:
+                snapshot_size = os.path.getsize(self.metadata_path)
+            except OSError:
+                snapshot_size = 0
+        
+        if log_size > self.META_COMPACT_RATIO * snapshot_size:
+            self._save_metadata()
     
     def _get_vectordb(self):
         """取得向量庫"""
         if self._vectordb is None:
-            try:
-                from langchain_chroma import Chroma
-                from langchain_openai import OpenAIEmbeddings
-                import chromadb
-                
-                logger.info(f"🔧 初始化個人向量庫: {self.vectordb_dir}")
-                
-                embedding = OpenAIEmbeddings(model=EMBEDDING_MODEL)
-                
-                # 確保目錄存在
-                os.makedirs(self.vectordb_dir, exist_ok=True)
-                
-                client = chromadb.PersistentClient(path=self.vectordb_dir)
-                
-                self._vectordb = Chroma(
-                    client=client,
-                    collection_name=f"personal_{self.user_id}",
-                    embedding_function=embedding
-                )
-                logger.info(f"✅ 個人向量庫初始化成功: personal_{self.user_id}")
-            except Exception as e:
-                logger.error(f"❌ 向量庫初始化失敗: {e}")
-                import traceback
-                logger.error(traceback.format_exc())
+            with self._lock:
+                if self._vectordb is None:
+                    self._vectordb = self._create_vectordb()
         
         return self._vectordb
     
+    def _create_vectordb(self):
+        """建立此用戶的 Chroma collection（embedding 為程序內共用實例）"""
+        try:
+            from langchain_chroma import Chroma
+            import chromadb
+            
+            logger.info(f"🔧 初始化個人向量庫: {self.vectordb_dir}")
+            
+            # 確保目錄存在
+            os.makedirs(self.vectordb_dir, exist_ok=True)
+            
+            vectordb = Chroma(
+                client=chromadb.PersistentClient(path=self.vectordb_dir),
+                collection_name=f"personal_{self.user_id}",
+                embedding_function=get_shared_embedding()
+            )
+            logger.info(f"✅ 個人向量庫初始化成功: personal_{self.user_id}")
+            return vectordb
+        except Exception as e:
+            logger.error(f"❌ 向量庫初始化失敗: {e}")
+            import traceback
+            logger.error(traceback.format_exc())
+            return None
+    
+    def _add_to_vectordb(self, vectordb, texts: List[str], metadatas: List[Dict]):
+        """先並行計算 embedding，再直接寫入 Chroma collection"""
+        vectors = embed_in_batches(vectordb.embeddings, texts, EMBED_BATCH_SIZE)
+        for i in range(0, len(texts), EMBED_BATCH_SIZE):
+            end = i + EMBED_BATCH_SIZE
+            vectordb._collection.upsert(
+                ids=[str(uuid.uuid4()) for _ in texts[i:end]],
+                embeddings=vectors[i:end],
+                documents=texts[i:end],
+                metadatas=metadatas[i:end],
+            )
+    
     def add_document(self, file_path: str, filename: str = None) -> Dict:
         """添加文件"""
+        result = self._ingest_document(file_path, filename)
+        if result["success"]:
+            self._log_metadata("add", [result["doc_id"]])
+        return result
+    
+    def add_documents_bulk(self, paths: List[str], filenames: List[str] = None) -> List[Dict]:
+        """
+        批次添加文件
+        
+        每個檔案的「雜湊 → 解析 → 切塊 → embedding」在共用執行緒池中執行，
+        檔案之間的磁碟 I/O 與網路等待彼此重疊；metadata 變更在整批完成後一次寫入。
+        
+        Returns:
+            與 paths 順序對應的結果列表（格式同 add_document）
+        """
+        filenames = filenames or [None] * len(paths)
+        # 先在目前執行緒建立向量庫，避免多個工作執行緒同時初始化
+        self._get_vectordb()
+        
+        results = list(self._INGEST_POOL.map(self._ingest_document, paths, filenames))
+        self._log_metadata("add", [r["doc_id"] for r in results if r["success"]])
+        return results
+    
+    def _ingest_document(self, file_path: str, filename: str = None) -> Dict:
+        """處理單一文件並更新記憶體中的 metadata（由呼叫端記錄變更）"""
         filename = filename or os.path.basename(file_path)
         
         # 檢查檔案大小
@@ -578,37 +945,41 @@ class PersonalKnowledgeBase:
         
         # 檢查格式
         ext = Path(filename).suffix.lower()
-        if ext not in PERSONAL_KB_CONFIG.allowed_extensions:
+        if ext not in self.ALLOWED_EXTENSIONS:
             return {
                 "success": False,
                 "error": f"不支援的格式: {ext}"
             }
         
-        # 生成 ID
+        # 生成 ID（串流計算，維持 MD5 以免既有文件 ID 改變而失去重複檢查）
         with open(file_path, 'rb') as f:
-            file_hash = hashlib.md5(f.read()).hexdigest()[:12]
+            file_hash = _file_md5(f)[:12]
         doc_id = f"doc_{file_hash}"
         
-        # 檢查重複
-        if doc_id in self.metadata["documents"]:
-            return {
-                "success": False,
-                "error": "文件已存在",
-                "doc_id": doc_id,
-            }
+        # 檢查重複（同一批次中內容相同的檔案只處理第一個）
+        with self._lock:
+            if doc_id in self.metadata["documents"] or doc_id in self._pending:
+                return {
+                    "success": False,
+                    "error": "文件已存在",
+                    "doc_id": doc_id,
+                }
+            self._pending.add(doc_id)
         
-        # 建立輸出目錄
         doc_output_dir = os.path.join(self.extracted_dir, doc_id)
-        os.makedirs(doc_output_dir, exist_ok=True)
         
         try:
+            # 建立輸出目錄
+            os.makedirs(doc_output_dir, exist_ok=True)
+            
             # 解析文件
             text, images = DocumentParser.parse(file_path, doc_output_dir)
             
             # 儲存原始文字
             text_path = os.path.join(doc_output_dir, f"{doc_id}.md")
+            full_text = f"# {filename}\n\n{text}"
             with open(text_path, 'w', encoding='utf-8') as f:
-                f.write(f"# {filename}\n\n{text}")
+                f.write(full_text)
             
             # 切塊
             chunks = self._split_text(text, doc_id, filename)
@@ -616,44 +987,42 @@ class PersonalKnowledgeBase:
             # 添加到向量庫
             vectordb = self._get_vectordb()
             if vectordb and chunks:
-                from langchain_core.documents import Document
-                docs = [
-                    Document(
-                        page_content=chunk.content,
-                        metadata={
-                            "doc_id": doc_id,
-                            "filename": filename,
-                            "chunk_idx": chunk.chunk_idx,
-                        }
-                    )
+                texts = [chunk.content for chunk in chunks]
+                metadatas = [
+                    {
+                        "doc_id": doc_id,
+                        "filename": filename,
+                        "chunk_idx": chunk.chunk_idx,
+                    }
                     for chunk in chunks
                 ]
-                logger.info(f"📤 開始 embedding {len(docs)} 個 chunks...")
-                vectordb.add_documents(docs)
-                logger.info(f"✅ Embedding 完成: {len(docs)} chunks 已加入向量庫")
+                logger.info(f"📤 開始 embedding {len(texts)} 個 chunks...")
+                self._add_to_vectordb(vectordb, texts, metadatas)
+                logger.info(f"✅ Embedding 完成: {len(texts)} chunks 已加入向量庫")
             else:
                 logger.warning(f"⚠️ 跳過 embedding: vectordb={vectordb is not None}, chunks={len(chunks) if chunks else 0}")
             
-            # 添加到關鍵字索引
+            # 添加到關鍵字索引（索引檔由 PersonalKeywordIndex 延遲寫入）
             keywords = self.keyword_index.add(doc_id, text)
             
             # 更新 metadata
-            self.metadata["documents"][doc_id] = {
-                "filename": filename,
-                "file_type": ext,
-                "file_size": file_size,
-                "upload_time": datetime.now().isoformat(),
-                "status": "indexed",
-                "text_path": text_path,
-                "chunk_count": len(chunks),
-                "images": [asdict(img) for img in images],
-                "keywords": keywords[:50],
-            }
-            
-            self.metadata["stats"]["total_documents"] += 1
-            self.metadata["stats"]["total_chunks"] += len(chunks)
-            self.metadata["stats"]["total_images"] += len(images)
-            self._save_metadata()
+            with self._lock:
+                self.metadata["documents"][doc_id] = {
+                    "filename": filename,
+                    "file_type": ext,
+                    "file_size": file_size,
+                    "upload_time": datetime.now().isoformat(),
+                    "status": "indexed",
+                    "text_path": text_path,
+                    "chunk_count": len(chunks),
+                    "images": [asdict(img) for img in images],
+                    "keywords": keywords[:50],
+                    "preview": self._make_preview(full_text, self.PREVIEW_LENGTH),
+                }
+                
+                self.metadata["stats"]["total_documents"] += 1
+                self.metadata["stats"]["total_chunks"] += len(chunks)
+                self.metadata["stats"]["total_images"] += len(images)
             
             logger.info(f"✅ 文件已添加: {filename} ({len(chunks)} chunks, {len(images)} images)")
             
@@ -676,6 +1045,9 @@ class PersonalKnowledgeBase:
                 "success": False,
                 "error": str(e),
             }
+        finally:
+            with self._lock:
+                self._pending.discard(doc_id)
     
     def _split_text(self, text: str, doc_id: str, filename: str) -> List[DocumentChunk]:
         """切割文字"""
@@ -683,79 +1055,242 @@ class PersonalKnowledgeBase:
         chunk_size = config.chunk_size
         overlap = config.chunk_overlap
         
+        if getattr(config, "strategy", "paragraph") == "sliding":
+            stride = getattr(config, "stride", 0) or chunk_size * 3 // 4
+            return self._split_text_sliding(text, doc_id, filename, chunk_size, stride)
+        
         prefix = f"【{filename}】\n"
+        prefix_len = len(prefix)
         chunks = []
         
-        # 按段落切割
-        paragraphs = re.split(r'\n\n+', text)
-        current = prefix
-        
-        for para in paragraphs:
-            if len(current) + len(para) > chunk_size:
-                if current.strip() and current != prefix:
-                    chunks.append(DocumentChunk(
-                        content=current.strip(),
-                        chunk_idx=len(chunks),
-                        doc_id=doc_id,
-                    ))
+        # 以片段列表累積目前區塊，只在輸出時 join 一次；
+        # has_content 表示區塊在前綴之外已有文字（取代與 prefix 的字串比較）
+        parts = [prefix]
+        current_len = prefix_len
+        has_content = False
+        append_chunk = chunks.append
+        
+        def flush():
+            content = "".join(parts).strip()
+            if content and has_content:
+                append_chunk(DocumentChunk(
+                    content=content,
+                    chunk_idx=len(chunks),
+                    doc_id=doc_id,
+                ))
+        
+        # 按段落切割（finditer 逐段產生，不建立整份段落列表）
+        for para in self._iter_paragraphs(text):
+            if current_len + len(para) > chunk_size:
+                flush()
                 # 保留重疊
-                overlap_text = current[-overlap:] if len(current) > overlap else ""
-                current = prefix + overlap_text + para
+                overlap_text = self._tail(parts, overlap) if current_len > overlap else ""
+                parts = [prefix, overlap_text, para]
+                current_len = prefix_len + len(overlap_text) + len(para)
+                has_content = bool(overlap_text or para)
+            elif has_content:
+                parts.append("\n\n")
+                parts.append(para)
+                current_len += 2 + len(para)
             else:
-                current += "\n\n" + para if current != prefix else para
+                parts.append(para)
+                current_len += len(para)
+                has_content = bool(para)
         
-        if current.strip() and current != prefix:
-            chunks.append(DocumentChunk(
-                content=current.strip(),
-                chunk_idx=len(chunks),
-                doc_id=doc_id,
-            ))
+        flush()
+        return chunks
+    
+    @staticmethod
+    def _iter_paragraphs(text: str):
+        """依空行切段落，等同 _PARA_RE.split(text)"""
+        start = 0
+        for m in _PARA_RE.finditer(text):
+            yield text[start:m.start()]
+            start = m.end()
+        yield text[start:]
+    
+    @staticmethod
+    def _tail(parts: List[str], size: int) -> str:
+        """取片段串接後的最後 size 個字元，只 join 需要的尾端片段"""
+        if size <= 0:
+            return "".join(parts)[-size:]
+        tail = []
+        length = 0
+        for piece in reversed(parts):
+            tail.append(piece)
+            length += len(piece)
+            if length >= size:
+                break
+        return "".join(reversed(tail))[-size:]
+    
+    def _split_text_sliding(
+        self, text: str, doc_id: str, filename: str, size: int, stride: int
+    ) -> List[DocumentChunk]:
+        """
+        以固定大小的滑動視窗切割文字
+        
+        每個區塊約 size 字元，起點間隔 stride 字元（相鄰區塊重疊 size - stride）；
+        視窗兩端在 _SNAP_DISTANCE 內對齊換行 / 句號 / 空白，避免切斷詞句。
+        檔名前綴只加在第一個區塊。
+        """
+        chunks = []
+        n = len(text)
+        start = 0
+        while start < n:
+            end = min(start + size, n)
+            if end < n:
+                lo = max(start + 1, end - _SNAP_DISTANCE)
+                cut = max(text.rfind(c, lo, end) for c in _SNAP_CHARS)
+                if cut >= 0:
+                    end = cut + 1
+            
+            content = text[start:end].strip()
+            if content:
+                if not chunks:
+                    content = f"【{filename}】\n{content}"
+                chunks.append(DocumentChunk(
+                    content=content,
+                    chunk_idx=len(chunks),
+                    doc_id=doc_id,
+                ))
+            
+            if end >= n:
+                break
+            
+            # 下一個起點：前進 stride（不超過本區塊結尾，避免漏字），再對齊到邊界之後
+            start = min(start + stride, end)
+            hi = min(start + _SNAP_DISTANCE, end)
+            snaps = [p for p in (text.find(c, start, hi) for c in _SNAP_CHARS) if p >= 0]
+            if snaps:
+                start = min(snaps) + 1
         
         return chunks
     
     def remove_document(self, doc_id: str) -> bool:
         """移除文件"""
-        if doc_id not in self.metadata["documents"]:
-            return False
+        return self.remove_documents([doc_id]) == 1
+    
+    def remove_documents(self, doc_ids: List[str]) -> int:
+        """
+        批次移除文件
+        
+        向量庫以 delete（doc_id $in）每 DELETE_BATCH 個文件一批移除 chunks，
+        metadata 變更一次記錄。
         
-        doc_info = self.metadata["documents"][doc_id]
+        Returns:
+            實際移除的文件數
+        """
+        doc_ids = [d for d in dict.fromkeys(doc_ids) if d in self.metadata["documents"]]
+        if not doc_ids:
+            return 0
         
         # 從向量庫移除
         vectordb = self._get_vectordb()
+        if vectordb:
+            for i in range(0, len(doc_ids), self.DELETE_BATCH):
+                batch = doc_ids[i:i + self.DELETE_BATCH]
+                where = {"doc_id": batch[0]} if len(batch) == 1 else {"doc_id": {"$in": batch}}
+                try:
+                    vectordb.delete(where=where)
+                except Exception as e:
+                    logger.warning(f"向量庫移除失敗（{len(batch)} 個文件）: {e}")
+        
+        for doc_id in doc_ids:
+            # 從關鍵字索引移除
+            self.keyword_index.remove(doc_id)
+            
+            # 刪除檔案
+            doc_dir = os.path.join(self.extracted_dir, doc_id)
+            if os.path.exists(doc_dir):
+                shutil.rmtree(doc_dir)
+            
+            # 更新 metadata
+            with self._lock:
+                doc_info = self.metadata["documents"].pop(doc_id)
+                self.metadata["stats"]["total_documents"] -= 1
+                self.metadata["stats"]["total_chunks"] -= doc_info.get("chunk_count", 0)
+                self.metadata["stats"]["total_images"] -= len(doc_info.get("images", []))
+            
+            logger.info(f"✅ 文件已移除: {doc_info.get('filename')}")
+        
+        self._log_metadata("del", doc_ids)
+        return len(doc_ids)
+    
+    def search(self, query: str, top_k: int = 5, include_images: bool = False) -> List[SearchResult]:
+        """混合搜尋"""
+        # 1. 關鍵字搜尋
+        kw_results = self.keyword_index.search(query, top_k=top_k)
+        
+        # 2. 向量搜尋
+        vector_hits = []
+        vectordb = self._get_vectordb()
         if vectordb:
             try:
-                vectordb._collection.delete(where={"doc_id": doc_id})
-            except:
-                pass
+                vector_docs = vectordb.similarity_search_with_score(query, k=top_k)
+                vector_hits = [(doc.page_content, doc.metadata, score) for doc, score in vector_docs]
+            except Exception as e:
+                logger.warning(f"向量搜尋失敗: {e}")
         
-        # 從關鍵字索引移除
-        self.keyword_index.remove(doc_id)
+        return self._merge_results(kw_results, vector_hits, top_k, include_images)
+    
+    def search_batch(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        include_images: bool = False
+    ) -> List[List[SearchResult]]:
+        """
+        批次混合搜尋
         
-        # 刪除檔案
-        doc_dir = os.path.join(self.extracted_dir, doc_id)
-        if os.path.exists(doc_dir):
-            shutil.rmtree(doc_dir)
+        所有查詢一次 embedding、一次 collection.query；關鍵字搜尋在執行緒池中
+        與向量查詢同時進行。回傳與 queries 順序對應的結果列表。
+        """
+        if not queries:
+            return []
         
-        # 更新 metadata
-        self.metadata["stats"]["total_documents"] -= 1
-        self.metadata["stats"]["total_chunks"] -= doc_info.get("chunk_count", 0)
-        self.metadata["stats"]["total_images"] -= len(doc_info.get("images", []))
-        del self.metadata["documents"][doc_id]
-        self._save_metadata()
+        vector_hits: List[List[Tuple[str, Dict, float]]] = [[] for _ in queries]
+        vectordb = self._get_vectordb()
         
-        logger.info(f"✅ 文件已移除: {doc_info.get('filename')}")
-        return True
+        with ThreadPoolExecutor(max_workers=min(len(queries), 4)) as pool:
+            kw_futures = [pool.submit(self.keyword_index.search, q, top_k) for q in queries]
+            
+            if vectordb:
+                try:
+                    vectors = vectordb.embeddings.embed_documents(queries)
+                    res = vectordb._collection.query(
+                        query_embeddings=vectors,
+                        n_results=top_k,
+                        include=["documents", "metadatas", "distances"],
+                    )
+                    for i in range(len(queries)):
+                        vector_hits[i] = list(zip(
+                            res["documents"][i], res["metadatas"][i], res["distances"][i]
+                        ))
+                except Exception as e:
+                    logger.warning(f"批次向量搜尋失敗: {e}")
+            
+            kw_results = [f.result() for f in kw_futures]
+        
+        return [
+            self._merge_results(kw, hits, top_k, include_images)
+            for kw, hits in zip(kw_results, vector_hits)
+        ]
     
-    def search(self, query: str, top_k: int = 5, include_images: bool = False) -> List[SearchResult]:
-        """混合搜尋"""
+    def _merge_results(
+        self,
+        kw_results: List[Tuple[str, float]],
+        vector_hits: List[Tuple[str, Dict, float]],
+        top_k: int,
+        include_images: bool
+    ) -> List[SearchResult]:
+        """合併關鍵字與向量結果（同一文件只取先出現者），依分數排序"""
         results: List[SearchResult] = []
         seen_docs = set()
+        documents = self.metadata["documents"]
         
-        # 1. 關鍵字搜尋
-        kw_results = self.keyword_index.search(query, top_k=top_k)
         for doc_id, score in kw_results:
-            if doc_id in self.metadata["documents"] and doc_id not in seen_docs:
-                doc_info = self.metadata["documents"][doc_id]
+            if doc_id in documents and doc_id not in seen_docs:
+                doc_info = documents[doc_id]
                 results.append(SearchResult(
                     doc_id=doc_id,
                     filename=doc_info["filename"],
@@ -766,40 +1301,40 @@ class PersonalKnowledgeBase:
                 ))
                 seen_docs.add(doc_id)
         
-        # 2. 向量搜尋
-        vectordb = self._get_vectordb()
-        if vectordb:
-            try:
-                vector_docs = vectordb.similarity_search_with_score(query, k=top_k)
-                for doc, score in vector_docs:
-                    doc_id = doc.metadata.get("doc_id")
-                    if doc_id and doc_id not in seen_docs and doc_id in self.metadata["documents"]:
-                        doc_info = self.metadata["documents"][doc_id]
-                        results.append(SearchResult(
-                            doc_id=doc_id,
-                            filename=doc_info["filename"],
-                            content=doc.page_content[:300],
-                            score=1.0 / (1.0 + score),
-                            match_type="vector",
-                            images=(doc_info.get("images", [])[:3] if include_images else []),
-                        ))
-                        seen_docs.add(doc_id)
-            except Exception as e:
-                logger.warning(f"向量搜尋失敗: {e}")
+        for content, metadata, distance in vector_hits:
+            doc_id = (metadata or {}).get("doc_id")
+            if doc_id and doc_id not in seen_docs and doc_id in documents:
+                doc_info = documents[doc_id]
+                results.append(SearchResult(
+                    doc_id=doc_id,
+                    filename=doc_info["filename"],
+                    content=content[:300],
+                    score=1.0 / (1.0 + distance),
+                    match_type="vector",
+                    images=(doc_info.get("images", [])[:3] if include_images else []),
+                ))
+                seen_docs.add(doc_id)
         
         # 排序
         results.sort(key=lambda x: x.score, reverse=True)
         return results[:top_k]
     
-    def _get_doc_preview(self, doc_id: str, max_length: int = 300) -> str:
-        """取得文件預覽"""
+    @staticmethod
+    def _make_preview(text: str, max_length: int) -> str:
+        return text[:max_length] + "..." if len(text) > max_length else text
+    
+    def _get_doc_preview(self, doc_id: str, max_length: int = PREVIEW_LENGTH) -> str:
+        """取得文件預覽（優先使用入庫時快取在 metadata 的預覽）"""
         doc_info = self.metadata["documents"].get(doc_id, {})
-        text_path = doc_info.get("text_path")
+        if max_length == self.PREVIEW_LENGTH and "preview" in doc_info:
+            return doc_info["preview"]
         
+        text_path = doc_info.get("text_path")
         if text_path and os.path.exists(text_path):
+            # 只讀取預覽所需的長度（多讀 1 字元以判斷是否截斷）
             with open(text_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-                return text[:max_length] + "..." if len(text) > max_length else text
+                text = f.read(max_length + 1)
+            return self._make_preview(text, max_length)
         
         return ""
     
@@ -17,12 +17,56 @@
 import os
 import re
 import json
+import time
+import asyncio
 import logging
-from typing import List, Dict, Optional, Tuple
+import importlib.util
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from threading import Lock
+from typing import Callable, List, Dict, Optional, Tuple
 from dataclasses import dataclass, field
 
+try:
+    import ahocorasick
+    _HAS_AHOCORASICK = True
+except ImportError:
+    _HAS_AHOCORASICK = False
+
+try:
+    import marisa_trie
+    _HAS_TRIE = True
+except ImportError:
+    _HAS_TRIE = False
+
+try:
+    import numpy as np
+    _HAS_NUMPY = True
+except ImportError:
+    _HAS_NUMPY = False
+
+try:
+    import orjson
+    _HAS_ORJSON = True
+except ImportError:
+    _HAS_ORJSON = False
+
+from utils import get_shared_embedding
+
 logger = logging.getLogger(__name__)
 
+# LLM 增強結果快取
+ENHANCE_CACHE_SIZE = int(os.getenv("QUERY_ENHANCE_CACHE_SIZE", "2048"))
+ENHANCE_CACHE_TTL = int(os.getenv("QUERY_ENHANCE_CACHE_TTL", str(3600 * 24)))
+ENHANCE_CACHE_SEMANTIC = os.getenv("QUERY_ENHANCE_CACHE_SEMANTIC", "true").lower() == "true"
+ENHANCE_CACHE_THRESHOLD = float(os.getenv("QUERY_ENHANCE_CACHE_THRESHOLD", "0.93"))
+
+# LLM 增強在背景執行緒執行、與規則式處理重疊；超過此秒數即只用規則結果。
+# 執行緒數依同時請求數設定（預設與 FastAPI 執行緒池相同的 40），避免請求在池中排隊而吃掉逾時時間
+LLM_ENHANCE_TIMEOUT = float(os.getenv("QUERY_ENHANCE_LLM_TIMEOUT", "10"))
+LLM_ENHANCE_WORKERS = int(os.getenv("QUERY_ENHANCE_LLM_WORKERS", "40"))
+_LLM_POOL = ThreadPoolExecutor(max_workers=LLM_ENHANCE_WORKERS, thread_name_prefix="query-enhance-llm")
+
 
 # ═══════════════════════════════════════════════════════════════
 # 術語詞典（靜態，快速查找）
@@ -96,6 +140,96 @@ TERM_DICTIONARY = {
     "流量": ["流量", "flow rate"],
 }
 
+# 術語比對：優先用 Aho-Corasick 自動機一次掃描查詢；未安裝時改用 marisa-trie
+# 在每個位置查前綴（成本與詞典大小無關）；兩者皆無時依長度由長到短逐一 find。
+# 採最長匹配：候選出現位置依術語長度由長到短（同長依詞典順序）取用，與已取用
+# 範圍重疊者捨棄，因此「金屬墊片」會蓋過其中的「墊片」。
+# 結果一律依詞典順序排列，三種做法結果相同。
+# （詞典僅數十條時純 Python 的 dict 字典樹反而比逐一 find 慢，故不提供）
+_TERM_ORDER = {term: idx for idx, term in enumerate(TERM_DICTIONARY)}
+_MAX_TERM_LEN = max(map(len, TERM_DICTIONARY))
+
+# 最長匹配的取用順序（sorted 為穩定排序，同長者維持詞典順序）
+_TERMS_BY_LENGTH = tuple(sorted(TERM_DICTIONARY, key=len, reverse=True))
+_TERM_RANK = {term: rank for rank, term in enumerate(_TERMS_BY_LENGTH)}
+
+_TERM_AUTOMATON = None
+_TERM_TRIE = None
+if _HAS_AHOCORASICK:
+    _TERM_AUTOMATON = ahocorasick.Automaton()
+    for _term, _idx in _TERM_ORDER.items():
+        _TERM_AUTOMATON.add_word(_term, (_idx, _term))
+    _TERM_AUTOMATON.make_automaton()
+elif _HAS_TRIE:
+    _TERM_TRIE = marisa_trie.Trie(list(TERM_DICTIONARY))
+
+
+def _scan_terms(query: str) -> Dict[str, List[int]]:
+    """
+    找出查詢中出現的詞典術語及其出現位置（最長匹配，不互相重疊）
+    
+    Returns:
+        {術語: [起始位置, ...]}，依詞典順序排列（位置遞增）
+    """
+    covered = bytearray(len(query))
+    positions: Dict[str, List[int]] = {}
+    
+    if _TERM_AUTOMATON is None and _TERM_TRIE is None:
+        for term in _TERMS_BY_LENGTH:
+            n = len(term)
+            i = query.find(term)
+            while i != -1:
+                if covered.find(1, i, i + n) == -1:
+                    covered[i:i + n] = b"\x01" * n
+                    positions.setdefault(term, []).append(i)
+                    i = query.find(term, i + n)
+                else:
+                    i = query.find(term, i + 1)
+    else:
+        # 先收集所有（可能重疊的）候選，再依取用順序挑選
+        if _TERM_AUTOMATON is not None:
+            candidates = [
+                (_TERM_RANK[term], end - len(term) + 1, term)
+                for end, (_, term) in _TERM_AUTOMATON.iter(query)
+            ]
+        else:
+            candidates = [
+                (_TERM_RANK[term], i, term)
+                for i in range(len(query))
+                for term in _TERM_TRIE.prefixes(query[i:i + _MAX_TERM_LEN])
+            ]
+        candidates.sort()
+        for _, i, term in candidates:
+            n = len(term)
+            if covered.find(1, i, i + n) == -1:
+                covered[i:i + n] = b"\x01" * n
+                positions.setdefault(term, []).append(i)
+    
+    return {
+        term: sorted(positions[term])
+        for term in sorted(positions, key=_TERM_ORDER.__getitem__)
+    }
+
+
+def _match_terms(query: str) -> List[str]:
+    """找出查詢中出現的詞典術語（依詞典順序）"""
+    return list(_scan_terms(query))
+
+
+def _insert_after(text: str, ends: List[int], insert: str) -> str:
+    """在 text 的各個位置（遞增）插入 insert"""
+    if len(ends) == 1:
+        end = ends[0]
+        return f"{text[:end]}{insert}{text[end:]}"
+    parts = []
+    prev = 0
+    for end in ends:
+        parts.append(text[prev:end])
+        parts.append(insert)
+        prev = end
+    parts.append(text[prev:])
+    return "".join(parts)
+
 # 品牌別名
 BRAND_ALIASES = {
     "SMC": ["smc", "エスエムシー"],
@@ -108,6 +242,13 @@ BRAND_ALIASES = {
     "NOK": ["nok", "エヌオーケー"],
 }
 
+# 品牌偵測用的 (大寫別名, 品牌)，依 BRAND_ALIASES 的品牌順序展開並去重
+_BRAND_ALIAS_PAIRS = tuple(dict.fromkeys(
+    (alias.upper(), brand)
+    for brand, aliases in BRAND_ALIASES.items()
+    for alias in (brand, *aliases)
+))
+
 # 產品型號正則
 MODEL_PATTERNS = {
     "smc": [
@@ -130,11 +271,62 @@ MODEL_PATTERNS = {
     ],
 }
 
+# 型號正則於載入時編譯一次
+_MODEL_RES = [
+    (brand, [re.compile(p, re.IGNORECASE) for p in patterns])
+    for brand, patterns in MODEL_PATTERNS.items()
+]
+
+# 各品牌的型號正則合併為一個（只用於判斷是否出現該品牌型號；
+# 取出型號仍需逐一 findall，因為不同模式的匹配可能互相重疊）
+_MODEL_BRAND_RES = [
+    (brand, re.compile("|".join(f"(?:{p})" for p in patterns), re.IGNORECASE))
+    for brand, patterns in MODEL_PATTERNS.items()
+]
+
+
+# LLM 回應外層的 markdown code fence（開頭 ```json 與結尾 ```）
+_MD_FENCE_RE = re.compile(r'^```\w*\n?|\n?```$')
+
+# LLM 查詢增強的固定指示（放在 system，每次請求相同，可被提供商快取；
+# 只有最後的用戶查詢會變動）
+_ENHANCE_SYSTEM_PROMPT = """你是一個工業產品搜索助手，專門幫助擴展搜索查詢以提高召回率。
+
+分析用戶的工業產品查詢，理解用戶意圖並生成搜索查詢變體。
+
+請回答 JSON 格式：
+{
+    "intent": "用戶想要找什麼（簡短描述）",
+    "queries": [
+        "搜索查詢1（加入日文術語）",
+        "搜索查詢2（加入英文術語）",
+        "搜索查詢3（同義詞變體）"
+    ]
+}
+
+注意：
+- 這是工業設備產品目錄搜索
+- 常見品牌：SMC（氣壓設備）、VALQUA/華爾卡（墊片）、玖基（油封）
+- 要考慮中日英三語術語
+- 只回答 JSON，不要有其他文字"""
 
 # ═══════════════════════════════════════════════════════════════
 # 數據類
 # ═══════════════════════════════════════════════════════════════
 
+@dataclass
+class QueryScan:
+    """規則式掃描結果（型號、品牌、術語一次掃描取得）"""
+    models: List[str] = field(default_factory=list)          # 產品型號
+    brand: str = ""                                           # 偵測到的品牌
+    term_positions: Dict[str, List[int]] = field(default_factory=dict)  # 術語 → 出現位置
+    language_variants: Dict[str, str] = field(default_factory=dict)     # 多語言變體
+    
+    @property
+    def keywords(self) -> List[str]:
+        return list(self.term_positions)
+
+
 @dataclass
 class EnhancedQuery:
     """增強後的查詢結果"""
@@ -153,13 +345,243 @@ class EnhancedQuery:
         queries.extend(self.expanded_queries)
         # 加入產品型號作為獨立查詢（精確匹配）
         queries.extend(self.extracted_models)
-        return list(dict.fromkeys(queries))  # 去重保序
+        return list(dict.fromkeys(queries))
 
 
 # ═══════════════════════════════════════════════════════════════
 # LLM 客戶端
 # ═══════════════════════════════════════════════════════════════
 
+# OpenAI / Anthropic 客戶端共用的 HTTP 連線池（keep-alive，裝有 h2 時啟用 HTTP/2）
+_shared_http = None
+_shared_http_lock = Lock()
+
+def _get_http_client():
+    """取得共用的 httpx.Client；httpx 不可用時回傳 None（SDK 使用各自的預設客戶端）"""
+    global _shared_http
+    if _shared_http is None:
+        with _shared_http_lock:
+            if _shared_http is None:
+                try:
+                    import httpx
+                except ImportError:
+                    return None
+                _shared_http = httpx.Client(
+                    http2=importlib.util.find_spec("h2") is not None,
+                    limits=httpx.Limits(max_keepalive_connections=32, max_connections=64),
+                    timeout=httpx.Timeout(60.0, connect=10.0),
+                )
+    return _shared_http
+
+
+_system_messages: Dict[str, Dict[str, str]] = {}
+
+def _anthropic_system(system: str, cache: bool):
+    """Anthropic 的 system 參數；cache=True 時在 system 區塊設定 prompt cache 斷點"""
+    if not cache:
+        return system
+    return [{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}]
+
+
+def _system_message(system: str) -> Dict[str, str]:
+    """OpenAI system 訊息（同一段 system prompt 只建立一次）"""
+    message = _system_messages.get(system)
+    if message is None:
+        message = _system_messages[system] = {"role": "system", "content": system}
+    return message
+
+
+# LLM 回應的 JSON 解析（orjson 可用時使用；其解析錯誤同樣是 ValueError 子類別）
+_json_loads = orjson.loads if _HAS_ORJSON else json.loads
+
+
+def _parse_json_text(text: str) -> Dict:
+    """解析完整的 LLM 回應（去除 markdown code fence）"""
+    text = text.strip()
+    if text.startswith("```"):
+        text = _MD_FENCE_RE.sub('', text)
+    return _json_loads(text)
+
+
+def _read_json_stream(deltas) -> Dict:
+    """
+    逐段讀取串流回應，第一個完整的頂層 JSON 物件出現時立即解析並回傳
+    
+    以括號深度（略過字串內容）判斷物件結束；呼叫端隨後關閉串流，
+    不再等待模型輸出結尾的 code fence 或多餘文字。串流結束仍未取得
+    物件時，改以完整文字解析。
+    """
+    parts = []
+    offset = 0
+    depth = 0
+    start = -1
+    in_string = False
+    escape = False
+    
+    for delta in deltas:
+        if not delta:
+            continue
+        parts.append(delta)
+        for i, ch in enumerate(delta):
+            if in_string:
+                if escape:
+                    escape = False
+                elif ch == "\\":
+                    escape = True
+                elif ch == '"':
+                    in_string = False
+            elif ch == "{":
+                if depth == 0:
+                    start = offset + i
+                depth += 1
+            elif depth:
+                if ch == '"':
+                    in_string = True
+                elif ch == "}":
+                    depth -= 1
+                    if depth == 0:
+                        try:
+                            return _json_loads("".join(parts)[start:offset + i + 1])
+                        except ValueError:
+                            pass
+        offset += len(delta)
+    
+    return _parse_json_text("".join(parts))
+
+
+# ─────────────────────────────────────────────────────────────
+# 提供商註冊表：建立客戶端、一般呼叫、JSON 串流呼叫各一個函式，
+# LLMClient 依 provider 名稱查表分派
+# ─────────────────────────────────────────────────────────────
+
+def _is_quota_error(e: Exception) -> bool:
+    """是否為限額 / 速率限制錯誤（可改用另一個提供商重試）"""
+    error_msg = str(e).lower()
+    return "usage limits" in error_msg or "quota" in error_msg or "rate limit" in error_msg
+
+
+def _make_anthropic(api_key: str):
+    from anthropic import Anthropic
+    return Anthropic(api_key=api_key, http_client=_get_http_client())
+
+
+def _anthropic_kwargs(model: str, prompt: str, system: str, cache_system: bool) -> Dict:
+    kwargs = {
+        "model": model,
+        "max_tokens": 1000,
+        "messages": [{"role": "user", "content": prompt}],
+    }
+    if system:
+        kwargs["system"] = _anthropic_system(system, cache_system)
+    return kwargs
+
+
+def _anthropic_complete(client, model: str, prompt: str, system: str, cache_system: bool) -> str:
+    response = client.messages.create(**_anthropic_kwargs(model, prompt, system, cache_system))
+    return response.content[0].text
+
+
+def _anthropic_stream_json(client, model: str, prompt: str, system: str, cache_system: bool) -> Dict:
+    # 離開 with 區塊即關閉串流
+    with client.messages.stream(**_anthropic_kwargs(model, prompt, system, cache_system)) as stream:
+        return _read_json_stream(stream.text_stream)
+
+
+def _make_openai(api_key: str):
+    from openai import OpenAI
+    return OpenAI(api_key=api_key, http_client=_get_http_client())
+
+
+def _openai_messages(prompt: str, system: str) -> List[Dict[str, str]]:
+    user_message = {"role": "user", "content": prompt}
+    return [_system_message(system), user_message] if system else [user_message]
+
+
+def _openai_complete(client, model: str, prompt: str, system: str, cache_system: bool) -> str:
+    # OpenAI 對 1024 tokens 以上的相同前綴自動快取，不需 cache_system
+    response = client.chat.completions.create(
+        model=model,
+        messages=_openai_messages(prompt, system),
+        max_tokens=1000,
+        temperature=0.1,
+    )
+    return response.choices[0].message.content
+
+
+def _openai_stream_json(client, model: str, prompt: str, system: str, cache_system: bool) -> Dict:
+    # response_format=json_object 限定只輸出 JSON
+    stream = client.chat.completions.create(
+        model=model,
+        messages=_openai_messages(prompt, system),
+        max_tokens=1000,
+        temperature=0.1,
+        response_format={"type": "json_object"},
+        stream=True,
+    )
+    try:
+        return _read_json_stream(
+            chunk.choices[0].delta.content for chunk in stream if chunk.choices
+        )
+    finally:
+        stream.close()
+
+
+@dataclass(frozen=True)
+class _Provider:
+    """LLM 提供商"""
+    label: str              # 日誌顯示名稱
+    api_key_env: str        # API key 環境變數
+    model_env: str          # 模型名稱環境變數
+    default_model: str
+    make_client: Callable[[str], object]
+    complete: Callable[..., str]
+    stream_json: Callable[..., Dict]
+    fallback: str           # 限額時改用的提供商
+
+
+_PROVIDERS: Dict[str, _Provider] = {
+    "anthropic": _Provider(
+        label="Anthropic",
+        api_key_env="ANTHROPIC_API_KEY",
+        model_env="ANTHROPIC_MODEL_SIMPLE",
+        default_model="claude-haiku-4-5-20251001",
+        make_client=_make_anthropic,
+        complete=_anthropic_complete,
+        stream_json=_anthropic_stream_json,
+        fallback="openai",
+    ),
+    "openai": _Provider(
+        label="OpenAI",
+        api_key_env="OPENAI_API_KEY",
+        model_env="OPENAI_MODEL_SIMPLE",
+        default_model="gpt-4o-mini",
+        make_client=_make_openai,
+        complete=_openai_complete,
+        stream_json=_openai_stream_json,
+        fallback="anthropic",
+    ),
+}
+
+
+def _open_provider(name: str) -> Optional[Tuple[str, object, str]]:
+    """
+    建立提供商的客戶端（環境變數於此讀取一次）
+    
+    Returns:
+        (provider, client, model)；未設定 API key 或 SDK 未安裝時回傳 None
+    """
+    provider = _PROVIDERS[name]
+    api_key = os.getenv(provider.api_key_env)
+    if not api_key:
+        return None
+    try:
+        client = provider.make_client(api_key)
+    except ImportError:
+        logger.warning(f"無法初始化 {provider.label} 客戶端")
+        return None
+    return name, client, os.getenv(provider.model_env, provider.default_model)
+
+
 class LLMClient:
     """簡易 LLM 客戶端"""
     
@@ -172,97 +594,233 @@ class LLMClient:
             self.provider = "anthropic" if primary in ("anthropic", "claude") else "openai"
         
         self._client = None
+        self._fallback = None  # (provider, client, model)，首次 fallback 時建立後重用
         self._init_client()
     
     def _init_client(self):
-        if self.provider == "anthropic" and os.getenv("ANTHROPIC_API_KEY"):
-            try:
-                from anthropic import Anthropic
-                self._client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-                self.model = os.getenv("ANTHROPIC_MODEL_SIMPLE", "claude-haiku-4-5-20251001")
-                logger.debug(f"QueryEnhancer 使用 Anthropic: {self.model}")
-            except ImportError:
-                self._init_openai()
-        else:
-            self._init_openai()
+        # 指定 Anthropic 但不可用時改用 OpenAI；其他設定值一律使用 OpenAI
+        candidates = ("anthropic", "openai") if self.provider == "anthropic" else ("openai",)
+        for name in candidates:
+            opened = _open_provider(name)
+            if opened is not None:
+                self.provider, self._client, self.model = opened
+                logger.debug(f"QueryEnhancer 使用 {_PROVIDERS[name].label}: {self.model}")
+                return
     
-    def _init_openai(self):
-        if os.getenv("OPENAI_API_KEY"):
-            try:
-                from openai import OpenAI
-                self._client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-                self.provider = "openai"
-                self.model = os.getenv("OPENAI_MODEL_SIMPLE", "gpt-4o-mini")
-                logger.debug(f"QueryEnhancer 使用 OpenAI: {self.model}")
-            except ImportError:
-                logger.warning("無法初始化 LLM 客戶端")
-                self._client = None
-    
-    def chat(self, prompt: str, system: str = None) -> str:
+    def chat(self, prompt: str, system: str = None, cache_system: bool = False) -> str:
+        """
+        呼叫 LLM
+        
+        Args:
+            prompt: 用戶訊息
+            system: system prompt
+            cache_system: system 為固定內容時設為 True，讓 Anthropic 快取該前綴
+                          （OpenAI 對 1024 tokens 以上的相同前綴自動快取）
+        """
         if not self._client:
             return ""
         
         try:
-            if self.provider == "anthropic":
-                kwargs = {
-                    "model": self.model,
-                    "max_tokens": 1000,
-                    "messages": [{"role": "user", "content": prompt}],
-                }
-                if system:
-                    kwargs["system"] = system
-                response = self._client.messages.create(**kwargs)
-                return response.content[0].text
-            else:
-                messages = []
-                if system:
-                    messages.append({"role": "system", "content": system})
-                messages.append({"role": "user", "content": prompt})
-                response = self._client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    max_tokens=1000,
-                    temperature=0.1,
-                )
-                return response.choices[0].message.content
+            return _PROVIDERS[self.provider].complete(
+                self._client, self.model, prompt, system, cache_system
+            )
         except Exception as e:
-            error_msg = str(e)
             # 限額錯誤時嘗試 fallback
-            if "usage limits" in error_msg or "quota" in error_msg.lower() or "rate limit" in error_msg.lower():
+            if _is_quota_error(e):
                 logger.warning(f"⚠️ QueryEnhancer {self.provider} 限額，嘗試 fallback")
-                return self._fallback_chat(prompt, system)
+                return self._fallback_chat(prompt, system, cache_system)
             logger.error(f"LLM 調用失敗: {e}")
             return ""
     
-    def _fallback_chat(self, prompt: str, system: str = None) -> str:
+    def chat_json(self, prompt: str, system: str = None, cache_system: bool = False) -> Optional[Dict]:
+        """
+        呼叫 LLM 並取得 JSON 物件回應（串流讀取，物件完整即結束）
+        
+        OpenAI 另以 response_format=json_object 限定只輸出 JSON。
+        參數同 chat()；失敗時回傳 None。
+        """
+        if not self._client:
+            return None
+        
+        try:
+            return _PROVIDERS[self.provider].stream_json(
+                self._client, self.model, prompt, system, cache_system
+            )
+        except ValueError as e:
+            logger.warning(f"LLM 回應不是有效的 JSON: {e}")
+            return None
+        except Exception as e:
+            # 限額錯誤時嘗試 fallback（非串流）
+            if _is_quota_error(e):
+                logger.warning(f"⚠️ QueryEnhancer {self.provider} 限額，嘗試 fallback")
+                response = self._fallback_chat(prompt, system, cache_system)
+                try:
+                    return _parse_json_text(response) if response else None
+                except ValueError as e:
+                    logger.warning(f"LLM 回應不是有效的 JSON: {e}")
+                    return None
+            logger.error(f"LLM 調用失敗: {e}")
+            return None
+    
+    def _fallback_chat(self, prompt: str, system: str = None, cache_system: bool = False) -> str:
         """Fallback 到另一個提供商"""
         try:
-            if self.provider == "anthropic" and os.getenv("OPENAI_API_KEY"):
-                from openai import OpenAI
-                client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-                model = os.getenv("OPENAI_MODEL_SIMPLE", "gpt-4o-mini")
-                messages = []
-                if system:
-                    messages.append({"role": "system", "content": system})
-                messages.append({"role": "user", "content": prompt})
-                response = client.chat.completions.create(
-                    model=model, messages=messages, max_tokens=1000, temperature=0.1,
-                )
-                logger.info(f"✅ QueryEnhancer fallback 到 OpenAI 成功")
-                return response.choices[0].message.content
-            elif self.provider == "openai" and os.getenv("ANTHROPIC_API_KEY"):
-                from anthropic import Anthropic
-                client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-                model = os.getenv("ANTHROPIC_MODEL_SIMPLE", "claude-haiku-4-5-20251001")
-                kwargs = {"model": model, "max_tokens": 1000, "messages": [{"role": "user", "content": prompt}]}
-                if system:
-                    kwargs["system"] = system
-                response = client.messages.create(**kwargs)
-                logger.info(f"✅ QueryEnhancer fallback 到 Anthropic 成功")
-                return response.content[0].text
+            fallback = self._get_fallback()
+            if fallback is None:
+                return ""
+            name, client, model = fallback
+            text = _PROVIDERS[name].complete(client, model, prompt, system, cache_system)
+            logger.info(f"✅ QueryEnhancer fallback 到 {_PROVIDERS[name].label} 成功")
+            return text
         except Exception as e:
             logger.error(f"❌ QueryEnhancer fallback 也失敗: {e}")
         return ""
+    
+    def _get_fallback(self) -> Optional[Tuple[str, object, str]]:
+        """建立（或重用）另一個提供商的客戶端"""
+        if self._fallback is None:
+            provider = _PROVIDERS.get(self.provider)
+            if provider is not None:
+                self._fallback = _open_provider(provider.fallback)
+        return self._fallback
+
+
+# ═══════════════════════════════════════════════════════════════
+# LLM 結果快取
+# ═══════════════════════════════════════════════════════════════
+
+class LLMResultCache:
+    """
+    LLM 增強結果快取（兩層）
+    
+    1. 精確層：正規化後的查詢字串 → 結果（LRU + TTL）
+    2. 語意層：查詢 embedding 與已快取查詢的 cosine 相似度超過門檻即命中，
+       讓換句話說的查詢（如「耐熱墊片」/「高溫墊片」）不必再呼叫 LLM
+    
+    語意命中還要求兩個查詢的規則式掃描結果（產品型號、品牌、命中的術語）完全相同，
+    避免「MXJ6 規格」套用到「MXJ8 規格」、「SMC 電磁閥」套用到「CKD 電磁閥」的結果。
+    
+    max_size <= 0 時停用快取。
+    """
+    
+    def __init__(
+        self,
+        max_size: int = ENHANCE_CACHE_SIZE,
+        ttl: int = ENHANCE_CACHE_TTL,
+        semantic: bool = ENHANCE_CACHE_SEMANTIC,
+        threshold: float = ENHANCE_CACHE_THRESHOLD,
+    ):
+        self.max_size = max(max_size, 0)
+        self.enabled = self.max_size > 0
+        self.ttl = ttl
+        self.semantic = semantic and _HAS_NUMPY and self.enabled
+        self.threshold = threshold
+        # key → (結果, 建立時間, 掃描結果 guard, 語意層列號或 None)
+        self._entries: "OrderedDict[str, Tuple[Dict, float, Tuple[str, ...], Optional[int]]]" = OrderedDict()
+        # 語意層矩陣：max_size 列預先配置（首次寫入向量時依維度建立），每筆快取佔一列；
+        # 寫入 / 移除只改動該列，不重建矩陣。未使用的列為零向量
+        self._vectors = None
+        self._row_keys: List[Optional[str]] = [None] * self.max_size
+        self._free_rows: List[int] = list(range(self.max_size - 1, -1, -1))
+        self._lock = Lock()
+    
+    @staticmethod
+    def _normalize(query: str) -> str:
+        return " ".join(query.split()).lower()
+    
+    def _embed(self, query: str):
+        """計算正規化的查詢 embedding；失敗時（如暫時性網路錯誤）本次查詢略過語意層"""
+        try:
+            vector = np.asarray(get_shared_embedding().embed_query(query), dtype=np.float32)
+            norm = float(np.linalg.norm(vector))
+            return vector / norm if norm else None
+        except Exception as e:
+            logger.warning(f"查詢快取 embedding 失敗，本次略過語意快取: {e}")
+            return None
+    
+    def get(self, query: str, guard: Tuple) -> Tuple[Optional[Dict], Optional[object]]:
+        """
+        查詢快取
+        
+        Args:
+            guard: 規則式掃描結果（型號、品牌、術語），語意命中時必須相同
+        
+        Returns:
+            (快取結果或 None, 查詢 embedding（供 set 重用，未計算時為 None）)
+        """
+        if not self.enabled:
+            return None, None
+        
+        key = self._normalize(query)
+        now = time.time()
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[1] < self.ttl:
+                    self._entries.move_to_end(key)
+                    return entry[0], None
+                self._remove(key)
+        
+        if not self.semantic:
+            return None, None
+        
+        vector = self._embed(query)
+        if vector is None:
+            return None, None
+        
+        with self._lock:
+            if self._vectors is None or self._vectors.shape[1] != vector.shape[0]:
+                return None, vector
+            sims = self._vectors @ vector
+            hits = np.flatnonzero(sims >= self.threshold)
+            for idx in hits[np.argsort(sims[hits])[::-1]]:
+                row_key = self._row_keys[idx]
+                if row_key is None:
+                    continue
+                entry = self._entries[row_key]
+                if entry[2] == guard and now - entry[1] < self.ttl:
+                    logger.info(f"🧠 查詢增強語意快取命中 (sim={sims[idx]:.3f})")
+                    return entry[0], vector
+        
+        return None, vector
+    
+    def set(self, query: str, guard: Tuple, value: Dict, vector=None):
+        """寫入快取"""
+        if not self.enabled:
+            return
+        
+        key = self._normalize(query)
+        with self._lock:
+            self._remove(key)
+            while len(self._entries) >= self.max_size:
+                self._remove(next(iter(self._entries)))
+            
+            row = None
+            if vector is not None:
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.max_size, vector.shape[0]), dtype=np.float32)
+                if self._vectors.shape[1] == vector.shape[0]:
+                    row = self._free_rows.pop()
+                    self._vectors[row] = vector
+                    self._row_keys[row] = key
+            self._entries[key] = (value, time.time(), guard, row)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._vectors = None
+            self._row_keys = [None] * self.max_size
+            self._free_rows = list(range(self.max_size - 1, -1, -1))
+    
+    def _remove(self, key: str):
+        """移除項目並釋放其語意層列（呼叫端需持有 _lock）"""
+        entry = self._entries.pop(key, None)
+        if entry is not None and entry[3] is not None:
+            row = entry[3]
+            self._vectors[row] = 0.0
+            self._row_keys[row] = None
+            self._free_rows.append(row)
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -279,6 +837,7 @@ class QueryEnhancer:
         """
         self.use_llm = use_llm
         self._llm = None
+        self._llm_cache = LLMResultCache()
         if use_llm:
             try:
                 self._llm = LLMClient()
@@ -290,100 +849,178 @@ class QueryEnhancer:
         """
         增強查詢
         
+        LLM 呼叫在規則式掃描後立即送到背景執行緒，與其餘規則處理重疊；
+        超過 LLM_ENHANCE_TIMEOUT 秒未回應則取消尚未開始的呼叫，只使用規則結果。
+        
         Args:
             query: 原始用戶查詢
         
         Returns:
             EnhancedQuery 對象
         """
+        result, llm_future, rule_queries = self._start_enhance(query)
+        
+        llm_enhanced = None
+        if llm_future is not None:
+            try:
+                llm_enhanced = llm_future.result(timeout=LLM_ENHANCE_TIMEOUT)
+            except FutureTimeoutError:
+                # 尚在排隊的呼叫已不需要，直接取消（已開始執行者無法中斷）
+                llm_future.cancel()
+                logger.warning(f"LLM 增強逾時（>{LLM_ENHANCE_TIMEOUT}s），只使用規則結果")
+        
+        return self._finish_enhance(result, llm_enhanced, rule_queries)
+    
+    async def enhance_async(self, query: str) -> EnhancedQuery:
+        """增強查詢（async 版本，等待 LLM 時不阻塞事件迴圈）"""
+        result, llm_future, rule_queries = self._start_enhance(query)
+        
+        llm_enhanced = None
+        if llm_future is not None:
+            try:
+                llm_enhanced = await asyncio.wait_for(
+                    asyncio.shield(asyncio.wrap_future(llm_future)), LLM_ENHANCE_TIMEOUT
+                )
+            except asyncio.TimeoutError:
+                llm_future.cancel()
+                logger.warning(f"LLM 增強逾時（>{LLM_ENHANCE_TIMEOUT}s），只使用規則結果")
+        
+        return self._finish_enhance(result, llm_enhanced, rule_queries)
+    
+    def _start_enhance(self, query: str):
+        """
+        規則式處理，並在背景送出 LLM 增強
+        
+        Returns:
+            (EnhancedQuery, LLM future 或 None, 規則式擴展查詢)
+        """
         result = EnhancedQuery(original=query)
         
-        # 1. 提取產品型號（精確匹配最重要）
-        result.extracted_models = self._extract_models(query)
-        result.detected_brand = self._detect_brand(query)
+        # 1-2. 規則式掃描：產品型號（精確匹配最重要）、品牌、術語與多語言變體
+        scan = self._scan(query)
+        result.extracted_models = scan.models
+        result.detected_brand = scan.brand
+        result.keywords = scan.keywords
+        result.language_variants = scan.language_variants
         
-        # 2. 規則式擴展（快速，無需 LLM）
-        result.keywords = self._extract_keywords(query)
-        result.language_variants = self._translate_terms(query)
+        # 4. 使用 LLM 深度理解（可選）：先送出，與下面的規則處理同時進行
+        llm_future = None
+        if self.use_llm and self._llm and self._llm._client:
+            guard = (tuple(sorted(scan.models)), scan.brand, tuple(sorted(scan.term_positions)))
+            llm_future = _LLM_POOL.submit(self._cached_llm_enhance, query, guard)
         
         # 3. 構建主要查詢
         result.primary_query = self._build_primary_query(query, result)
         
-        # 4. 使用 LLM 深度理解（可選）
-        if self.use_llm and self._llm and self._llm._client:
-            llm_enhanced = self._llm_enhance(query)
-            if llm_enhanced:
-                result.intent = llm_enhanced.get("intent", "")
-                result.expanded_queries.extend(llm_enhanced.get("queries", []))
-        
         # 5. 生成擴展查詢
-        result.expanded_queries.extend(self._generate_expanded_queries(query, result))
+        rule_queries = self._generate_expanded_queries(query, result, scan.term_positions)
+        
+        return result, llm_future, rule_queries
+    
+    def _finish_enhance(
+        self, result: EnhancedQuery, llm_enhanced: Optional[Dict], rule_queries: List[str]
+    ) -> EnhancedQuery:
+        """合併 LLM 與規則式擴展查詢（LLM 查詢在前）"""
+        if llm_enhanced:
+            result.intent = llm_enhanced.get("intent", "")
+            result.expanded_queries.extend(llm_enhanced.get("queries", []))
+        result.expanded_queries.extend(rule_queries)
         
         # 去重
         result.expanded_queries = list(dict.fromkeys(result.expanded_queries))
         
-        logger.info(f"📝 查詢增強: '{query}' → {len(result.get_all_queries())} 個查詢變體")
+        logger.info(f"📝 查詢增強: '{result.original}' → {len(result.get_all_queries())} 個查詢變體")
         
         return result
     
+    def _scan(self, query: str) -> QueryScan:
+        """對查詢做一次規則式掃描（型號掃描一次、術語自動機掃描一次）"""
+        models, model_brand = self._scan_models(query)
+        term_positions = _scan_terms(query)
+        return QueryScan(
+            models=models,
+            brand=self._detect_brand(query, model_brand),
+            term_positions=term_positions,
+            language_variants=self._translate_terms(query, list(term_positions)),
+        )
+    
     def _extract_models(self, query: str) -> List[str]:
         """提取產品型號"""
+        return self._scan_models(query)[0]
+    
+    def _scan_models(self, query: str) -> Tuple[List[str], str]:
+        """
+        掃描產品型號
+        
+        Returns:
+            (型號列表, 第一個有型號匹配的品牌（大寫），無則為空字串)
+        """
         models = []
+        model_brand = ""
         
-        for brand, patterns in MODEL_PATTERNS.items():
-            for pattern in patterns:
-                matches = re.findall(pattern, query, re.IGNORECASE)
+        for brand, regexes in _MODEL_RES:
+            for regex in regexes:
+                matches = regex.findall(query)
+                if matches and not model_brand:
+                    model_brand = brand.upper()
                 for m in matches:
                     if isinstance(m, tuple):
                         m = m[0]
                     if m and len(m) >= 2:
                         models.append(m.upper())
         
-        return list(set(models))
+        return list(set(models)), model_brand
     
-    def _detect_brand(self, query: str) -> str:
-        """偵測品牌"""
+    def _detect_brand(self, query: str, model_brand: str = None) -> str:
+        """
+        偵測品牌
+        
+        Args:
+            query: 原始查詢
+            model_brand: _scan_models 推斷的品牌（未提供時重新掃描型號）
+        """
         query_upper = query.upper()
         
-        for brand, aliases in BRAND_ALIASES.items():
-            if brand.upper() in query_upper:
+        for alias, brand in _BRAND_ALIAS_PAIRS:
+            if alias in query_upper:
                 return brand
-            for alias in aliases:
-                if alias.upper() in query_upper:
-                    return brand
         
         # 根據產品型號推斷
-        for brand, patterns in MODEL_PATTERNS.items():
-            for pattern in patterns:
-                if re.search(pattern, query, re.IGNORECASE):
-                    return brand.upper()
+        if model_brand is not None:
+            return model_brand
+        for brand, regex in _MODEL_BRAND_RES:
+            if regex.search(query):
+                return brand.upper()
         
         return ""
     
     def _extract_keywords(self, query: str) -> List[str]:
         """提取關鍵字"""
-        keywords = []
-        
-        for term in TERM_DICTIONARY.keys():
-            if term in query:
-                keywords.append(term)
-        
-        return keywords
+        return _match_terms(query)
     
-    def _translate_terms(self, query: str) -> Dict[str, str]:
-        """翻譯術語到多語言"""
+    def _translate_terms(self, query: str, terms: List[str] = None) -> Dict[str, str]:
+        """
+        翻譯術語到多語言
+        
+        Args:
+            query: 原始查詢
+            terms: 已提取的詞典術語（未提供時重新比對）
+        """
         variants = {"original": query}
         
         ja_terms = []
         en_terms = []
         
-        for zh_term, translations in TERM_DICTIONARY.items():
-            if zh_term in query:
-                # 第一個通常是日文，第二個是英文
-                if translations:
-                    ja_terms.append(translations[0])
-                if len(translations) > 1:
-                    en_terms.append(translations[1])
+        if terms is None:
+            terms = _match_terms(query)
+        
+        for zh_term in terms:
+            translations = TERM_DICTIONARY[zh_term]
+            # 第一個通常是日文，第二個是英文
+            if translations:
+                ja_terms.append(translations[0])
+            if len(translations) > 1:
+                en_terms.append(translations[1])
         
         if ja_terms:
             variants["japanese"] = " ".join(ja_terms)
@@ -407,57 +1044,58 @@ class QueryEnhancer:
         
         return " ".join(parts)
     
+    def _cached_llm_enhance(self, query: str, guard: Tuple) -> Optional[Dict]:
+        """
+        先查 LLM 結果快取，未命中才呼叫 LLM（只快取成功的結果）
+        
+        guard 為 (型號, 品牌, 命中的術語)，語意快取只在三者都相同時命中。
+        """
+        cached, vector = self._llm_cache.get(query, guard)
+        if cached is not None:
+            return cached
+        
+        llm_enhanced = self._llm_enhance(query)
+        if llm_enhanced:
+            self._llm_cache.set(query, guard, llm_enhanced, vector)
+        return llm_enhanced
+    
+    def clear_cache(self):
+        """清除 LLM 結果快取"""
+        self._llm_cache.clear()
+    
     def _llm_enhance(self, query: str) -> Optional[Dict]:
         """使用 LLM 進行深度查詢增強"""
         
-        prompt = f"""分析以下工業產品查詢，理解用戶意圖並生成搜索查詢變體。
-
-用戶查詢：{query}
-
-請回答 JSON 格式：
-{{
-    "intent": "用戶想要找什麼（簡短描述）",
-    "queries": [
-        "搜索查詢1（加入日文術語）",
-        "搜索查詢2（加入英文術語）",
-        "搜索查詢3（同義詞變體）"
-    ]
-}}
-
-注意：
-- 這是工業設備產品目錄搜索
-- 常見品牌：SMC（氣壓設備）、VALQUA/華爾卡（墊片）、玖基（油封）
-- 要考慮中日英三語術語
-- 只回答 JSON，不要有其他文字"""
-
-        system = "你是一個工業產品搜索助手，專門幫助擴展搜索查詢以提高召回率。"
+        # 固定指示在 system（可快取的前綴），變動的查詢放在最後
+        prompt = f"用戶查詢：{query}"
         
         try:
-            response = self._llm.chat(prompt, system)
-            
-            # 清理 markdown
-            response = response.strip()
-            if response.startswith("```"):
-                response = re.sub(r'^```\w*\n?', '', response)
-                response = re.sub(r'\n?```$', '', response)
-            
-            return json.loads(response)
+            return self._llm.chat_json(prompt, _ENHANCE_SYSTEM_PROMPT, cache_system=True)
         except Exception as e:
             logger.warning(f"LLM 增強失敗: {e}")
             return None
     
-    def _generate_expanded_queries(self, query: str, result: EnhancedQuery) -> List[str]:
-        """生成擴展查詢"""
+    def _generate_expanded_queries(
+        self, query: str, result: EnhancedQuery, term_positions: Dict[str, List[int]] = None
+    ) -> List[str]:
+        """
+        生成擴展查詢
+        
+        Args:
+            query: 原始查詢
+            result: 規則式處理結果
+            term_positions: 掃描得到的術語出現位置（未提供時重新掃描）
+        """
         expanded = []
         
-        # 基於關鍵字的擴展
-        for keyword in result.keywords:
-            if keyword in TERM_DICTIONARY:
-                for trans in TERM_DICTIONARY[keyword][:2]:
-                    # 替換原查詢中的關鍵字
-                    expanded_q = query.replace(keyword, f"{keyword} {trans}")
-                    if expanded_q != query:
-                        expanded.append(expanded_q)
+        if term_positions is None:
+            term_positions = _scan_terms(query)
+        
+        # 基於關鍵字的擴展：依掃描到的位置，在關鍵字後面插入翻譯
+        for keyword, starts in term_positions.items():
+            ends = [i + len(keyword) for i in starts]
+            for trans in TERM_DICTIONARY[keyword][:2]:
+                expanded.append(_insert_after(query, ends, f" {trans}"))
         
         # 品牌擴展
         if result.detected_brand:
@@ -491,6 +1129,17 @@ def enhance_query(query: str, use_llm: bool = True) -> EnhancedQuery:
     return get_query_enhancer(use_llm).enhance(query)
 
 
+async def enhance_query_async(query: str, use_llm: bool = True) -> EnhancedQuery:
+    """增強查詢的便捷函數（async 版本）"""
+    return await get_query_enhancer(use_llm).enhance_async(query)
+
+
+def clear_enhance_cache():
+    """清除查詢增強器的 LLM 結果快取"""
+    if _enhancer_instance is not None:
+        _enhancer_instance.clear_cache()
+
+
 # ═══════════════════════════════════════════════════════════════
 # 測試
 # ═══════════════════════════════════════════════════════════════
@@ -7,10 +7,17 @@ import os
 import re
 import hashlib
 import unicodedata
+from collections import OrderedDict
 from enum import Enum
 from datetime import datetime
 from typing import Optional, List, Dict
 from threading import Lock
+from concurrent.futures import Future, ThreadPoolExecutor
+
+try:
+    from config import EMBEDDING_MODEL
+except ImportError:
+    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
 
 # ─────────────────────────────────────────────────────────────
 # 常數定義
@@ -53,6 +60,35 @@ def _nfkc(s: str) -> str:
     return t
 
 
+# NFKC 結果快取：以原始位元組摘要為鍵，重複載入同一檔案時免重算
+_NFKC_CACHE_MAX = 256
+_nfkc_cache: "OrderedDict[bytes, str]" = OrderedDict()
+_nfkc_cache_lock = Lock()
+
+
+def _nfkc_cached(raw: bytes, text: str) -> str:
+    """
+    帶快取的 NFKC 正規化
+    
+    Args:
+        raw: 檔案原始位元組（用於計算快取鍵）
+        text: 已解碼的文字
+    """
+    key = hashlib.blake2b(raw, digest_size=16).digest()
+    with _nfkc_cache_lock:
+        cached = _nfkc_cache.get(key)
+        if cached is not None:
+            _nfkc_cache.move_to_end(key)
+            return cached
+    
+    result = _nfkc(text)
+    with _nfkc_cache_lock:
+        _nfkc_cache[key] = result
+        if len(_nfkc_cache) > _NFKC_CACHE_MAX:
+            _nfkc_cache.popitem(last=False)
+    return result
+
+
 def _restore_product_codes(s: str) -> str:
     """恢復產品型號格式"""
     s = re.sub(r'ProductCode_([A-Z0-9-]+)', r'No.\1', s)
@@ -95,6 +131,45 @@ def hash_csv_file(csv_file: str) -> str:
         pass
     return h.hexdigest()
 
+# ─────────────────────────────────────────────────────────────
+# Embedding 共用資源
+# ─────────────────────────────────────────────────────────────
+
+# 整個程序同時進行的 embedding 請求數上限（技術文件、個人知識庫、查詢快取共用）
+MAX_EMBED_CONCURRENCY = int(os.getenv("MAX_EMBED_CONCURRENCY", "4"))
+
+# embedding 以同步 embed_documents 在此執行緒池送出：同步 client 可跨執行緒共用，
+# 不必為每次寫入建立新的事件迴圈（共用 client 的非同步連線池會綁定在第一個迴圈上）
+_EMBED_POOL = ThreadPoolExecutor(max_workers=MAX_EMBED_CONCURRENCY, thread_name_prefix="embed")
+
+_shared_embedding = None
+_shared_embedding_lock = Lock()
+
+
+def get_shared_embedding():
+    """取得程序內共用的 OpenAIEmbeddings（共用 HTTP 連線池）"""
+    global _shared_embedding
+    if _shared_embedding is None:
+        with _shared_embedding_lock:
+            if _shared_embedding is None:
+                from langchain_openai import OpenAIEmbeddings
+                _shared_embedding = OpenAIEmbeddings(model=EMBEDDING_MODEL)
+    return _shared_embedding
+
+
+def submit_embedding(embedding, texts: List[str]) -> Future:
+    """將一批文字的 embed_documents 送到共用執行緒池"""
+    return _EMBED_POOL.submit(embedding.embed_documents, texts)
+
+
+def embed_in_batches(embedding, texts: List[str], batch_size: int) -> List[List[float]]:
+    """分批並行計算 embedding，回傳與 texts 對應的向量"""
+    futures = [
+        submit_embedding(embedding, texts[i:i + batch_size])
+        for i in range(0, len(texts), batch_size)
+    ]
+    return [vector for f in futures for vector in f.result()]
+
 # ─────────────────────────────────────────────────────────────
 # 查詢分類器
 # ─────────────────────────────────────────────────────────────